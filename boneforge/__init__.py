@@ -0,0 +1 @@
+from .batch import batchEdit, isBatching, markDirty
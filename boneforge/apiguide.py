@@ -0,0 +1,520 @@
+"""my.skeleton.boneforge.apiguide
+
+OpenMaya 2.0 implementation of the Guide classes.
+
+The classes have the same public methods as those of boneforge.guide but do
+not use PyMEL. Like boneforge.apihandle, node valued members return API
+objects: guide is an MObject, and transform and orientGroup are full DAG path
+names. Plugs are cached per wrapper and edits are run as modifiers through
+lib.modifier.
+
+This module must not import PyMEL.
+"""
+import maya.api.OpenMaya as OpenMaya
+import maya.cmds as cmds
+
+from .apihandle import Handle, isHandleType
+from .guidebase import GuideBase, HandleListCache
+
+import lib.api
+import lib.modifier
+import lib.nodecache
+
+class Guide(GuideBase):
+    """Base class for all guide nodes.
+
+    Guide(node) returns an instance of the class matching the node type.
+    Instances are interned per node. node may be a node name, an MObject or
+    an MDagPath of a guide node or its transform.
+    """
+
+    __slots__ = ("_objHandle", "_plugs")
+    _handleListCache = HandleListCache()
+
+    def __init__(self, guideNode=None):
+        # Instances are fully initialized, or reused, by __new__
+        pass
+
+    def __new__(cls, guideNode=None):
+        if guideNode is None:
+            return super(Guide, cls).__new__(cls)
+        node = _guideShape(guideNode)
+        objHandle = OpenMaya.MObjectHandle(node)
+        key = objHandle.hashCode()
+        instance = _guideCache.get(key)
+        if instance is None:
+            guideClass = GUIDE_NODE_CLASS[OpenMaya.MFnDependencyNode(node).typeName]
+            instance = super(Guide, cls).__new__(guideClass)
+            instance._objHandle = objHandle
+            instance._plugs = {}
+            _guideCache.add(key, objHandle, instance)
+        return instance
+
+    def __repr__(self):
+        return "{}.{}({!r})".format(__name__,
+                                  self.__class__.__name__,
+                                  self.name)
+
+    def __eq__(self, other):
+        return isinstance(other, self.__class__) and other.guide == self.guide
+
+    def __hash__(self):
+        return self._objHandle.hashCode()
+
+    @property
+    def guide(self):
+        return self._objHandle.object()
+
+    def _plug(self, name):
+        """Returns the cached MPlug of the named guide node attribute."""
+        plug = self._plugs.get(name)
+        if plug is None:
+            plug = self._plugs[name] = lib.api.findPlug(self.guide, name)
+        return plug
+
+    def _transformObject(self):
+        return OpenMaya.MFnDagNode(self.guide).parent(0)
+
+    @property
+    def name(self):
+        return OpenMaya.MFnDagNode(self._transformObject()).name()
+
+    @name.setter
+    def name(self, name):
+        modifier = OpenMaya.MDGModifier()
+        modifier.renameNode(self._transformObject(), name)
+        lib.modifier.doIt(modifier)
+
+    @property
+    def transform(self):
+        return OpenMaya.MFnDagNode(self._transformObject()).fullPathName()
+
+    @property
+    def forgeID(self):
+        return self._plug("forgeID").asString()
+
+    @property
+    def provideAimVector(self):
+        return self._plug("provideAimVector").asBool()
+
+    @provideAimVector.setter
+    def provideAimVector(self, value):
+        modifier = OpenMaya.MDGModifier()
+        modifier.newPlugValueBool(self._plug("provideAimVector"), value)
+        lib.modifier.doIt(modifier)
+
+    def _queryHandles(self):
+        """Query the ordered list of handles from the scene."""
+        return map(Handle, lib.api.arraySourceNodes(self._plug("handle")))
+
+    def _createHandle(self, name, position):
+        """Internal helper method creating an unconnected handle under the guide transform."""
+        cmds.select(clear=True)
+        handle = Handle.create(self.guide, name)
+        modifier = OpenMaya.MDagModifier()
+        modifier.reparentNode(handle._transformObject(), self._transformObject())
+        translate = handle._transformPlug("translate")
+        for i, value in enumerate(position):
+            modifier.newPlugValueDouble(translate.child(i), value)
+        lib.modifier.doIt(modifier)
+        return handle
+
+    def _connectHandles(self, handles, index):
+        """Connect the Handles to the handle array, starting at the given index."""
+        arrayPlug = self._handleArrayPlug()
+        modifier = OpenMaya.MDGModifier()
+        for offset, handle in enumerate(handles):
+            modifier.connect(handle._plug("message"), arrayPlug.elementByLogicalIndex(index + offset))
+        lib.modifier.doIt(modifier)
+
+    def _deleteHandles(self, handles):
+        """Delete the given Handles."""
+        modifier = OpenMaya.MDagModifier()
+        for handle in handles:
+            modifier.deleteNode(handle._transformObject())
+        lib.modifier.doIt(modifier)
+
+    def _handleArrayPlug(self):
+        return self._plug("handle")
+
+    def _storedParentGuideHandleIndex(self):
+        return self._plug("parentGuideHandleIndex").asInt()
+
+    def parentGuide(self):
+        """Returns the parent guide."""
+        guide = lib.api.sourceNode(self._plug("parentGuide"))
+        if guide is not None:
+            return Guide(guide)
+        return None
+
+    def setParentGuide(self, guide, index=-1):
+        """Set the parent guide and guide handle index.
+
+        See boneforge.guide.Guide.setParentGuide.
+        """
+        baseHandle = self.handleAtIndex(0)
+        baseHandle.setParent(None)
+        currentParent = self.parentGuide()
+        modifier = OpenMaya.MDGModifier()
+        if currentParent and currentParent.childGuide() == self:
+            lib.api.disconnectSources(modifier, currentParent._plug("childGuide"))
+            lib.modifier.doIt(modifier)
+            currentParent.handleAtIndex(-1).setOrientTarget(None)
+            modifier = OpenMaya.MDGModifier()
+        lib.api.disconnectSources(modifier, self._plug("parentGuide"))
+        lib.api.disconnectSources(modifier, self._plug("parentGuideHandle"))
+        if guide is not None:
+            modifier.connect(guide._plug("message"), self._plug("parentGuide"))
+        lib.modifier.doIt(modifier)
+        if guide is not None:
+            baseHandle.setParent(guide.handleAtIndex(index))
+            # If this guide is a direct child of the given guide (follows the last handle)
+            # Then set as the child of that guide
+            if index == -1:
+                guide.setChildGuide(self)
+            self.setParentGuideHandleIndex(index)
+
+    def parentGuideHandle(self):
+        """Returns the Handle of the parent guide that this guide is linked to."""
+        handle = lib.api.sourceNode(self._plug("parentGuideHandle"))
+        if handle is not None:
+            return Handle(handle)
+        return None
+
+    def setParentGuideHandleIndex(self, index):
+        """Link this guide to the handle at the given index of its parent guide."""
+        modifier = OpenMaya.MDGModifier()
+        lib.api.disconnectSources(modifier, self._plug("parentGuideHandle"))
+        modifier.newPlugValueInt(self._plug("parentGuideHandleIndex"), index)
+        parentGuide = self.parentGuide()
+        if index != -1 and parentGuide is not None:
+            parentHandle = parentGuide.handleAtIndex(index)
+            modifier.connect(parentHandle._plug("message"), self._plug("parentGuideHandle"))
+        lib.modifier.doIt(modifier)
+
+    def childGuide(self):
+        guide = lib.api.sourceNode(self._plug("childGuide"))
+        if guide is not None:
+            return Guide(guide)
+        return None
+
+    def setChildGuide(self, guide):
+        currentChild = self.childGuide()
+        if currentChild is not None:
+            currentChild.setParentGuide(None)
+            modifier = OpenMaya.MDGModifier()
+            lib.api.disconnectSources(modifier, self._plug("childGuide"))
+            lib.modifier.doIt(modifier)
+            self.handleAtIndex(-1).setOrientTarget(None)
+        if guide is not None:
+            modifier = OpenMaya.MDGModifier()
+            modifier.connect(guide._plug("message"), self._plug("childGuide"))
+            lib.modifier.doIt(modifier)
+            self.handleAtIndex(-1).setOrientTarget(guide.handleAtIndex(0))
+
+    def _nodeIsGuidePart(self, node):
+        isGuideShape = node == self.guide
+        isHandle = isHandleType(node) and lib.api.sameNode(Handle(node).guideNode, self.guide)
+        return isGuideShape or isHandle
+
+    def remove(self):
+        transform = self._transformObject()
+        transformFn = OpenMaya.MFnDagNode(transform)
+        parent = transformFn.parent(0)
+        if parent.hasFn(OpenMaya.MFn.kWorld):
+            parent = OpenMaya.MObject.kNullObj
+        modifier = OpenMaya.MDagModifier()
+        for i in xrange(transformFn.childCount()):
+            child = transformFn.child(i)
+            if self._nodeIsGuidePart(child):
+                continue
+            modifier.reparentNode(child, parent)
+        modifier.deleteNode(transform)
+        lib.modifier.doIt(modifier)
+
+    def handleColor(self):
+        plug = self._plug("handleColor")
+        return tuple(plug.child(i).asFloat() for i in xrange(3))
+
+    def setHandleColor(self, color):
+        plug = self._plug("handleColor")
+        modifier = OpenMaya.MDGModifier()
+        for i, value in enumerate(color):
+            modifier.newPlugValueFloat(plug.child(i), value)
+        lib.modifier.doIt(modifier)
+
+    @staticmethod
+    def _nodeClass(nodeType):
+        return GUIDE_NODE_CLASS[nodeType]
+
+    @classmethod
+    def _createGuideNode(cls, name):
+        """Create a guide node of this class, connected to its transform, and return its Guide."""
+        modifier = OpenMaya.MDagModifier()
+        transform = modifier.createNode(cls.nodetype)
+        modifier.renameNode(transform, name)
+        lib.modifier.doIt(modifier)
+        guide = cls(transform)
+        modifier = OpenMaya.MDGModifier()
+        modifier.connect(lib.api.findPlug(transform, "worldMatrix").elementByLogicalIndex(0),
+                         guide._plug("guideMatrix"))
+        lib.modifier.doIt(modifier)
+        return guide
+
+
+class GuideSpine(Guide):
+    """Control Class for planar spine guide object."""
+
+    __slots__ = ()
+    nodetype = "skeletonGuideSpine"
+
+    @classmethod
+    def create(cls, name="guideSpine"):
+        """Create a new guide object with a single handle."""
+        with lib.modifier.undoChunk("boneforgeCreateGuide"):
+            guide = cls._createGuideNode(name)
+            guide.addHandle()
+            cmds.select(guide.transform)
+        return guide
+
+    def addHandle(self, name="joint", position=(0, 0, 0)):
+        """Append a new handle to the end of the chain."""
+        handle = super(GuideSpine, self).addHandle(name, position)
+        cmds.setAttr(handle.transform + ".translateX", lock=True)
+        return handle
+
+    def insertHandles(self, index, positions, name="joint"):
+        """Insert a new handle at the given index for each of the given positions."""
+        handles = super(GuideSpine, self).insertHandles(index, positions, name)
+        for handle in handles:
+            cmds.setAttr(handle.transform + ".translateX", lock=True)
+        return handles
+
+
+class GuideLimb(Guide):
+    """Control Class for limb guide object."""
+
+    __slots__ = ()
+    nodetype = "skeletonGuideLimb"
+
+    @classmethod
+    def create(cls, name="guideLimb"):
+        """Create a new guide object with 3 initial handles."""
+        with lib.modifier.undoChunk("boneforgeCreateGuide"):
+            guide = cls._createGuideNode(name)
+            guide._orientGroupObject()
+            base = guide._addNewHandleAtIndex(0, "joint", (0, 0, 0))
+            mid = guide._addNewHandleAtIndex(1, "joint", (2, 0, 0))
+            end = guide._addNewHandleAtIndex(2, "joint", (4, 0, 0))
+            guide.setBaseHandle(base)
+            guide.setHingeHandle(mid)
+            guide.setEndHandle(end)
+            cmds.select(guide.transform)
+        return guide
+
+    def _orientGroupObject(self):
+        group = lib.api.sourceNode(self._plug("orientGroup"))
+        if group is None:
+            modifier = OpenMaya.MDagModifier()
+            group = modifier.createNode("transform", self._transformObject())
+            lib.modifier.doIt(modifier)
+            groupFn = OpenMaya.MFnDependencyNode(group)
+            modifier = OpenMaya.MDGModifier()
+            modifier.connect(groupFn.findPlug("message", False), self._plug("orientGroup"))
+            modifier.connect(self._plug("orientGroupTranslate"), groupFn.findPlug("translate", False))
+            modifier.connect(self._plug("orientGroupRotate"), groupFn.findPlug("rotate", False))
+            lib.modifier.doIt(modifier)
+        return group
+
+    @property
+    def orientGroup(self):
+        return OpenMaya.MFnDagNode(self._orientGroupObject()).fullPathName()
+
+    @property
+    def useChildBaseAsEnd(self):
+        return self._plug("useChildBaseAsEnd").asBool()
+
+    @useChildBaseAsEnd.setter
+    def useChildBaseAsEnd(self, value):
+        if value:
+            child = self.childGuide()
+            if child is not None:
+                self._setBool("useChildBaseAsEnd", True)
+                self.setEndHandle(child.handleAtIndex(0))
+            else:
+                raise RuntimeError("Guide {!r} has no child to use as limb end".format(self.name))
+        else:
+            if self.handleCount() >= 3:
+                self._setBool("useChildBaseAsEnd", False)
+                self.setEndHandle(self.handleAtIndex(-1))
+            else:
+                raise RuntimeError("Cannot stop using child as limb end unless guide {!r} has 3 or more handles".format(self.name))
+
+    def _setBool(self, name, value):
+        modifier = OpenMaya.MDGModifier()
+        modifier.newPlugValueBool(self._plug(name), value)
+        lib.modifier.doIt(modifier)
+
+    def _matrixSourceHandle(self, name):
+        node = lib.api.sourceNode(self._plug(name))
+        if node is not None:
+            return Handle(node)
+        return None
+
+    def _connectMatrixSource(self, name, handle):
+        modifier = OpenMaya.MDGModifier()
+        lib.api.disconnectSources(modifier, self._plug(name))
+        modifier.connect(handle._transformPlug("worldMatrix", 0), self._plug(name))
+        lib.modifier.doIt(modifier)
+
+    def baseHandle(self):
+        return self._matrixSourceHandle("baseMatrix")
+
+    def hingeHandle(self):
+        return self._matrixSourceHandle("hingeMatrix")
+
+    def endHandle(self):
+        return self._matrixSourceHandle("endMatrix")
+
+    def setBaseHandle(self, handle):
+        existingHandle = self.baseHandle()
+        self.removeFromOrientGroup(handle)
+        self._connectMatrixSource("baseMatrix", handle)
+        if existingHandle and existingHandle != handle:
+            self.moveToOrientGroup(existingHandle)
+        self.snapOrientGroupHandlesToPlane()
+
+    def setHingeHandle(self, handle):
+        existingHandle = self.hingeHandle()
+        self.removeFromOrientGroup(handle)
+        self._connectMatrixSource("hingeMatrix", handle)
+        if existingHandle and existingHandle != handle:
+            self.moveToOrientGroup(existingHandle)
+
+    def setEndHandle(self, handle):
+        existingHandle = self.endHandle()
+        existingHandleGuide = existingHandle.guideNode if existingHandle else None
+        if lib.api.sameNode(handle.guideNode, self.guide):
+            self.removeFromOrientGroup(handle)
+        self._connectMatrixSource("endMatrix", handle)
+        if (existingHandle and existingHandle != handle
+                and lib.api.sameNode(existingHandleGuide, self.guide)):
+            self.moveToOrientGroup(existingHandle)
+        self.snapOrientGroupHandlesToPlane()
+
+    def moveToOrientGroup(self, handle):
+        modifier = OpenMaya.MDagModifier()
+        modifier.reparentNode(handle._transformObject(), self._orientGroupObject())
+        _zeroRotate(modifier, handle)
+        lib.modifier.doIt(modifier)
+        cmds.setAttr(handle.transform + ".translateY", lock=True)
+
+    def removeFromOrientGroup(self, handle):
+        orientGroup = self._orientGroupObject()
+        if OpenMaya.MFnDagNode(handle._transformObject()).parent(0) == orientGroup:
+            transform = handle.transform
+            for attr in ("translateX", "translateY", "translateZ"):
+                cmds.setAttr("{}.{}".format(transform, attr), lock=False)
+            modifier = OpenMaya.MDagModifier()
+            modifier.reparentNode(handle._transformObject(), self._transformObject())
+            _zeroRotate(modifier, handle)
+            lib.modifier.doIt(modifier)
+
+    def snapOrientGroupHandlesToPlane(self):
+        groupFn = OpenMaya.MFnDagNode(self._orientGroupObject())
+        for i in xrange(groupFn.childCount()):
+            attr = OpenMaya.MFnDagNode(groupFn.child(i)).fullPathName() + ".translateY"
+            locked = cmds.getAttr(attr, lock=True)
+            cmds.setAttr(attr, lock=False)
+            cmds.setAttr(attr, 0)
+            cmds.setAttr(attr, lock=locked)
+
+    def addHandle(self, name="joint", position=(0, 0, 0)):
+        """Append a new handle to the end of the chain.
+
+        This extends the base class to set the new handle as the End Handle."""
+        handle = super(GuideLimb, self).addHandle(name, position)
+        self.setEndHandle(handle)
+        return handle
+
+    def insertHandles(self, index, positions, name="joint"):
+        """Insert a new handle at the given index for each of the given positions.
+
+        This extends the base class to set the first new handle as the Base Handle
+        if inserted at index 0, or the last new handle as the End Handle if
+        appended after the last handle.
+        """
+        handleCount = self.handleCount()
+        handles = super(GuideLimb, self).insertHandles(index, positions, name)
+        if not handles:
+            return handles
+        orientGroupHandles = handles
+        if index == 0:
+            self.setBaseHandle(handles[0])
+            orientGroupHandles = handles[1:]
+        elif index >= handleCount:
+            self.setEndHandle(handles[-1])
+            orientGroupHandles = handles[:-1]
+        for handle in orientGroupHandles:
+            self.moveToOrientGroup(handle)
+        return handles
+
+    def _nodeIsGuidePart(self, node):
+        return (super(GuideLimb, self)._nodeIsGuidePart(node)
+                or node == self._orientGroupObject())
+
+
+class GuideBlock(Guide):
+    """Control Class for block guide object."""
+
+    __slots__ = ()
+    nodetype = "skeletonGuideBlock"
+
+    @classmethod
+    def create(cls, name="guideBlock"):
+        """Create a new guide object with its handle."""
+        with lib.modifier.undoChunk("boneforgeCreateGuide"):
+            guide = cls._createGuideNode(name)
+            guide.addHandle()
+            cmds.select(guide.transform)
+        return guide
+
+
+GUIDE_NODE_TYPES = (GuideSpine.nodetype, GuideLimb.nodetype, GuideBlock.nodetype)
+GUIDE_NODE_CLASS = {
+    GuideSpine.nodetype: GuideSpine,
+    GuideLimb.nodetype: GuideLimb,
+    GuideBlock.nodetype: GuideBlock,
+}
+
+_guideCache = lib.nodecache.NodeCache(GUIDE_NODE_TYPES)
+
+def _guideShape(node):
+    """Returns the MObject of the guide node, given the node or its transform."""
+    mobject = lib.api.toMObject(node)
+    if mobject.hasFn(OpenMaya.MFn.kTransform):
+        for typeName in GUIDE_NODE_TYPES:
+            shape = lib.api.shapeOfType(mobject, typeName)
+            if shape is not None:
+                return shape
+    return mobject
+
+def _zeroRotate(modifier, handle):
+    rotate = handle._transformPlug("rotate")
+    for i in xrange(3):
+        modifier.newPlugValueDouble(rotate.child(i), 0.0)
+
+def guidesFromScene():
+    """Returns Guides for every guide node in the scene."""
+    selection = OpenMaya.MSelectionList()
+    for name in cmds.ls(type=GUIDE_NODE_TYPES) or []:
+        selection.add(name)
+    return [Guide(selection.getDependNode(i)) for i in xrange(selection.length())]
+
+def guideFromName(name):
+    """Returns the Guide of the named guide node or transform."""
+    return Guide(name)
+
+def isGuideType(obj):
+    node = _guideShape(obj)
+    return OpenMaya.MFnDependencyNode(node).typeName in GUIDE_NODE_TYPES
@@ -0,0 +1,271 @@
+"""my.skeleton.boneforge.apihandle
+
+OpenMaya 2.0 implementation of the Handle class.
+
+Handle has the same public methods as boneforge.handle.Handle but does not use
+PyMEL. Node valued members return API objects instead of PyNodes: node and
+guideNode are MObjects, and transform is the full DAG path name of the handle
+transform, which maya.cmds accepts. Plugs are found once per wrapper and cached.
+Each edit is collected into a modifier and run through lib.modifier, so it is
+one undoable step.
+
+This module must not import PyMEL.
+"""
+import maya.api.OpenMaya as OpenMaya
+import maya.cmds as cmds
+
+import lib.api
+import lib.modifier
+import lib.nodecache
+
+HANDLE_NODE_TYPE = "guideHandle"
+# (guide attribute, handle attribute) pairs of the connections driving a handle
+GUIDE_HANDLE_ATTRS = (("message", "guide"),
+                      ("provideAimVector", "useGuideAim"),
+                      ("aimVector", "aimVector"),
+                      ("upVector", "upVector"),
+                      ("aimAxis", "aimAxis"),
+                      ("upAxis", "upAxis"),
+                      ("handleColor", "handleColor"))
+
+
+class Handle(object):
+    """Control class for handle objects.
+
+    Instances are interned per node: Handle(node) returns the existing wrapper
+    for the node, or its shape, until the node is deleted. node may be a node
+    name, an MObject or an MDagPath.
+    """
+
+    __slots__ = ("_objHandle", "_plugs")
+
+    def __new__(cls, handle):
+        node = lib.api.shapeOfType(handle, HANDLE_NODE_TYPE)
+        objHandle = OpenMaya.MObjectHandle(node)
+        key = objHandle.hashCode()
+        instance = _handleCache.get(key)
+        if instance is None:
+            instance = super(Handle, cls).__new__(cls)
+            instance._objHandle = objHandle
+            instance._plugs = {}
+            _handleCache.add(key, objHandle, instance)
+        return instance
+
+    def __init__(self, handle):
+        # Instances are fully initialized, or reused, by __new__
+        pass
+
+    @classmethod
+    def create(cls, guideNode, name=None):
+        """Create a new Handle object."""
+        with lib.modifier.undoChunk("boneforgeCreateHandle"):
+            modifier = OpenMaya.MDagModifier()
+            transform = modifier.createNode(HANDLE_NODE_TYPE)
+            if name:
+                modifier.renameNode(transform, name)
+            lib.modifier.doIt(modifier)
+            handle = cls(transform)
+
+            modifier = OpenMaya.MDGModifier()
+            modifier.connect(handle._transformPlug("worldMatrix", 0), handle._plug("handleMatrix"))
+            modifier.connect(handle._transformPlug("scaleY"), handle._transformPlug("scaleX"))
+            modifier.connect(handle._transformPlug("scaleY"), handle._transformPlug("scaleZ"))
+            connectGuideToHandle(guideNode, handle, modifier)
+            lib.modifier.doIt(modifier)
+
+            transformName = handle.transform
+            cmds.aliasAttr("radius", transformName + ".scaleY")
+            for attr in ("scaleX", "scaleZ"):
+                cmds.setAttr("{}.{}".format(transformName, attr), lock=True, keyable=False, channelBox=False)
+            cmds.select(transformName)
+        return handle
+
+    def __repr__(self):
+        return "{}.{}({!r})".format(__name__,
+                                  self.__class__.__name__,
+                                  self.name)
+
+    def __eq__(self, other):
+        return isinstance(other, self.__class__) and other.node == self.node
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return self._objHandle.hashCode()
+
+    @property
+    def node(self):
+        return self._objHandle.object()
+
+    def _plug(self, name):
+        """Returns the cached MPlug of the named handle node attribute."""
+        plug = self._plugs.get(name)
+        if plug is None:
+            plug = self._plugs[name] = lib.api.findPlug(self.node, name)
+        return plug
+
+    def _transformObject(self):
+        return OpenMaya.MFnDagNode(self.node).parent(0)
+
+    def _transformPlug(self, name, index=None):
+        """Returns the cached MPlug of the named transform attribute, or of its element at index."""
+        key = ("transform", name, index)
+        plug = self._plugs.get(key)
+        if plug is None:
+            plug = lib.api.findPlug(self._transformObject(), name)
+            if index is not None:
+                plug = plug.elementByLogicalIndex(index)
+            self._plugs[key] = plug
+        return plug
+
+    @property
+    def name(self):
+        return OpenMaya.MFnDagNode(self._transformObject()).name()
+
+    @name.setter
+    def name(self, name):
+        modifier = OpenMaya.MDGModifier()
+        modifier.renameNode(self._transformObject(), name)
+        lib.modifier.doIt(modifier)
+
+    @property
+    def transform(self):
+        return OpenMaya.MFnDagNode(self._transformObject()).fullPathName()
+
+    @property
+    def guideNode(self):
+        return lib.api.sourceNode(self._plug("guide"))
+
+    @property
+    def forgeID(self):
+        return self._plug("forgeID").asString()
+
+    @property
+    def rotateOrder(self):
+        return self._plug("jointRotateOrder").asShort()
+
+    @rotateOrder.setter
+    def rotateOrder(self, order):
+        modifier = OpenMaya.MDGModifier()
+        modifier.newPlugValueShort(self._plug("jointRotateOrder"), order)
+        lib.modifier.doIt(modifier)
+
+    def parent(self):
+        """Returns the parent Handle."""
+        parentNode = lib.api.sourceNode(self._plug("parentHandle"))
+        if parentNode is not None:
+            return self.__class__(parentNode)
+        return None
+
+    def setParent(self, other):
+        """Set the parent Handle."""
+        parentHandle = self.parent()
+        if parentHandle:
+            parentHandle.removeChild(self)
+        if other is not None:
+            modifier = OpenMaya.MDGModifier()
+            modifier.connect(other._plug("message"), self._plug("parentHandle"))
+            modifier.connect(other._transformPlug("worldMatrix", 0), self._plug("parentHandleMatrix"))
+            lib.modifier.doIt(modifier)
+            other.addChild(self)
+
+    def childCount(self):
+        """Returns the number of child Handles."""
+        return len(lib.api.arraySourceNodes(self._plug("childHandle")))
+
+    def addChild(self, child):
+        """Add a Handle as a child of this Handle."""
+        idx = lib.api.firstOpenIndex(self._plug("childHandleMatrix"))
+        modifier = OpenMaya.MDGModifier()
+        modifier.connect(child._plug("message"), self._plug("childHandle").elementByLogicalIndex(idx))
+        modifier.connect(child._transformPlug("worldMatrix", 0),
+                         self._plug("childHandleMatrix").elementByLogicalIndex(idx))
+        lib.modifier.doIt(modifier)
+
+        # If the child is part of the same guide, this handle should orient towards it
+        # (If not part of the same guide, it may or may not,
+        # depending on how the child guide is connected)
+        if lib.api.sameNode(child.guideNode, self.guideNode):
+            self.setOrientTarget(child)
+
+    def removeChild(self, child):
+        """Remove the Handle as a child of this Handle."""
+        children = self.children()
+        children.remove(child)
+        modifier = OpenMaya.MDGModifier()
+        for name in ("childHandle", "childHandleMatrix"):
+            arrayPlug = self._plug(name)
+            for index in arrayPlug.getExistingArrayAttributeIndices():
+                modifier.removeMultiInstance(arrayPlug.elementByLogicalIndex(index), True)
+        lib.modifier.doIt(modifier)
+        orientTarget = self.orientTarget()
+        self.setOrientTarget(None)
+        for handle in children:
+            self.addChild(handle)
+        if orientTarget != child:
+            self.setOrientTarget(orientTarget)
+        modifier = OpenMaya.MDGModifier()
+        lib.api.disconnectSources(modifier, child._plug("parentHandle"))
+        lib.api.disconnectSources(modifier, child._plug("parentHandleMatrix"))
+        lib.modifier.doIt(modifier)
+
+    def children(self):
+        """Return a list of child Handles."""
+        return map(self.__class__, lib.api.arraySourceNodes(self._plug("childHandle")))
+
+    def orientTarget(self):
+        """Returns the Handle that this Handle will orient towards."""
+        target = lib.api.sourceNode(self._plug("orientTarget"))
+        if target is not None:
+            return self.__class__(target)
+        return None
+
+    def setOrientTarget(self, target):
+        """Set the Handle that this Handle will orient towards."""
+        if target == self.orientTarget():
+            return
+        if target and target not in self.children():
+            raise RuntimeError(
+                "Cannot set {} as the orient target, as it is not a child of {}"
+                .format(target, self))
+
+        modifier = OpenMaya.MDGModifier()
+        lib.api.disconnectSources(modifier, self._plug("orientTarget"))
+        lib.api.disconnectSources(modifier, self._plug("orientTargetMatrix"))
+        if target:
+            modifier.connect(target._plug("message"), self._plug("orientTarget"))
+            modifier.connect(target._transformPlug("worldMatrix", 0), self._plug("orientTargetMatrix"))
+        lib.modifier.doIt(modifier)
+
+    def jointMatrix(self):
+        return lib.api.getMatrix(self._plug("jointMatrix"))
+
+    def buildJoint(self):
+        cmds.select(clear=True)
+        jnt = cmds.joint(name=self.name)
+        cmds.setAttr(jnt + ".rotateOrder", self.rotateOrder)
+        matrix = self.jointMatrix()
+        cmds.xform(jnt, matrix=list(matrix))
+        return jnt
+
+
+_handleCache = lib.nodecache.NodeCache([HANDLE_NODE_TYPE])
+
+def connectGuideToHandle(guideNode, handle, modifier=None):
+    """Connect the guide attributes driving a handle.
+
+    The connections are added to the given modifier, or executed at once if none is given.
+    """
+    runModifier = modifier is None
+    if runModifier:
+        modifier = OpenMaya.MDGModifier()
+    guideFn = OpenMaya.MFnDependencyNode(lib.api.toMObject(guideNode))
+    for guideAttr, handleAttr in GUIDE_HANDLE_ATTRS:
+        modifier.connect(guideFn.findPlug(guideAttr, False), handle._plug(handleAttr))
+    if runModifier:
+        lib.modifier.doIt(modifier)
+
+def isHandleType(obj):
+    node = lib.api.shapeOfType(obj, HANDLE_NODE_TYPE)
+    return node is not None and OpenMaya.MFnDependencyNode(node).typeName == HANDLE_NODE_TYPE
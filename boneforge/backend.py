@@ -0,0 +1,20 @@
+"""my.skeleton.boneforge.backend
+
+Selects the implementation of the Guide and Handle classes.
+
+The backend is read once, from the BONEFORGE_BACKEND environment variable,
+when boneforge.core is first imported:
+
+    pymel      boneforge.guide and boneforge.handle (default)
+    openmaya   boneforge.apiguide and boneforge.apihandle, built on
+               maya.api.OpenMaya without importing PyMEL
+"""
+import os
+
+PYMEL = "pymel"
+OPENMAYA = "openmaya"
+BACKENDS = (PYMEL, OPENMAYA)
+
+BACKEND = os.environ.get("BONEFORGE_BACKEND", PYMEL).lower()
+if BACKEND not in BACKENDS:
+    raise ValueError("Unknown BONEFORGE_BACKEND {!r}, expected one of {}".format(BACKEND, BACKENDS))
@@ -0,0 +1,80 @@
+"""my.skeleton.boneforge.batch
+
+Transactional batches of guide edits.
+
+    with boneforge.batchEdit():
+        for guideID in guideIDs:
+            model.insertHandle(guideID, 1)
+
+Every edit made inside a batch joins one undo chunk. Listeners, such as the
+GuideDataModel of the UI, hold back their change notifications while a batch
+is open and note the forgeIDs of the guides they touched with markDirty.
+Scripts editing guides directly can mark them dirty the same way. When the
+outermost batch ends each listener is flushed once with all dirty forgeIDs,
+so the UI refreshes once however many edits were made.
+
+Batches nest, only the outermost one opens the undo chunk and flushes.
+Importing this module does not import Maya.
+"""
+import contextlib
+import weakref
+
+_depth = 0
+_dirtyIDs = set()
+_listeners = weakref.WeakSet()
+
+def isBatching():
+    """Returns True while a batchEdit block is open."""
+    return _depth > 0
+
+def markDirty(forgeIDs):
+    """Record guides, given by forgeID, changed inside the open batch.
+
+    Does nothing outside a batch.
+    """
+    if _depth > 0:
+        if isinstance(forgeIDs, basestring):
+            forgeIDs = (forgeIDs,)
+        _dirtyIDs.update(forgeIDs)
+
+def addListener(listener):
+    """Flush the listener at the end of every outermost batch.
+
+    The listener's flushBatch method is called with the set of dirty forgeIDs.
+    Listeners are weakly referenced, so they need not be removed.
+    """
+    _listeners.add(listener)
+
+def removeListener(listener):
+    _listeners.discard(listener)
+
+@contextlib.contextmanager
+def batchEdit(name="boneforgeBatchEdit"):
+    """Context manager grouping the guide edits in its block into one undo step and UI update.
+
+    Listeners are flushed even if the block raises, since the edits made
+    before the error are still in the scene.
+    """
+    global _depth
+    if _depth > 0:
+        _depth += 1
+        try:
+            yield
+        finally:
+            _depth -= 1
+        return
+
+    import lib.modifier
+    _depth = 1
+    try:
+        with lib.modifier.undoChunk(name):
+            yield
+    finally:
+        _depth = 0
+        _flush()
+
+def _flush():
+    dirtyIDs = set(_dirtyIDs)
+    _dirtyIDs.clear()
+    for listener in list(_listeners):
+        listener.flushBatch(dirtyIDs)
@@ -0,0 +1,337 @@
+"""my.skeleton.boneforge.benchmark
+
+Timings comparing the PyMEL and OpenMaya implementations of Guide and Handle.
+
+    import boneforge.benchmark
+    boneforge.benchmark.compareBackends(guideCount=100, handlesPerGuide=20)
+
+Run inside Maya with the BoneForge plugin loaded. The benchmark scene is built
+in a new file, so save any work first. Both backends are imported directly, so
+the BONEFORGE_BACKEND setting does not matter here.
+
+importTime() measures the cost of importing a boneforge module in a fresh
+mayapy process, and needs no running Maya session:
+
+    boneforge.benchmark.importTime("boneforge.core")
+
+compareTemplateImport() times building guides from template data, one guide
+at a time and batched, inside Maya.
+
+compareTemplateFormats() times a template round trip against JSON with one
+dictionary per handle, on synthetic guide data. It needs no Maya either.
+
+compareSceneConnections() and compareSceneRebuild() time refreshing the
+connectors and the guide node items of a node editor scene of synthetic
+guides, inside Maya's Qt session.
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+
+import lib.lazy
+import template
+
+cmds = lib.lazy.LazyModule("maya.cmds")
+
+IMPORT_TIMER = "import time; start = time.time(); import {}; print(time.time() - start)"
+
+def timeIt(func, repeat=3):
+    """Returns the (first, best) wall clock times in seconds of calling func repeat times."""
+    times = []
+    for _ in xrange(repeat):
+        start = time.time()
+        func()
+        times.append(time.time() - start)
+    return times[0], min(times)
+
+def buildScene(guideCount=100, handlesPerGuide=20):
+    """Build a new scene of chained spine guides and return their transform names."""
+    from . import apiguide
+
+    cmds.file(new=True, force=True)
+    names = []
+    previous = None
+    for i in xrange(guideCount):
+        guide = apiguide.GuideSpine.create("benchmarkGuide{}".format(i))
+        guide.insertHandles(1, [(0, j, 0) for j in xrange(1, handlesPerGuide)])
+        if previous is not None:
+            guide.setParentGuide(previous)
+        previous = guide
+        names.append(guide.transform)
+    return names
+
+def traverse(guides):
+    """Read the values and walk the hierarchy of every handle of the given Guides."""
+    for guide in guides:
+        guide.forgeID
+        guide.parentGuide()
+        guide.childGuide()
+        for handle in guide.handles():
+            handle.forgeID
+            handle.rotateOrder
+            handle.parent()
+            handle.children()
+            handle.orientTarget()
+
+def compareBackends(guideCount=100, handlesPerGuide=20, repeat=3):
+    """Time wrapping and traversing a benchmark scene with each backend.
+
+    Returns a dictionary of backend name to (first, best) times in seconds.
+    The first run includes building the wrapper, plug and handle list caches.
+    """
+    import pymel.core as pm
+    from . import apiguide
+    from . import backend
+    from . import guide as pmguide
+
+    names = buildScene(guideCount, handlesPerGuide)
+    results = {
+        backend.PYMEL: timeIt(lambda: traverse([pmguide.Guide(pm.PyNode(n)) for n in names]), repeat),
+        backend.OPENMAYA: timeIt(lambda: traverse([apiguide.Guide(n) for n in names]), repeat),
+    }
+    for name, (first, best) in sorted(results.items()):
+        print "{:<10} first {:8.3f}s  best {:8.3f}s".format(name, first, best)
+    return results
+
+def mayapyPath():
+    """Returns the path of the mayapy interpreter of the running Maya, or of $MAYA_LOCATION."""
+    location = os.environ.get("MAYA_LOCATION")
+    if not location:
+        return sys.executable
+    name = "mayapy.exe" if sys.platform == "win32" else "mayapy"
+    return os.path.join(location, "bin", name)
+
+def importTime(moduleName="boneforge.core", interpreter=None, repeat=3):
+    """Returns the best time in seconds to import the module in a fresh interpreter.
+
+    interpreter defaults to mayapy. Each run starts a new process, so nothing
+    is cached between runs apart from the operating system's file cache.
+    """
+    packageRoot = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [packageRoot, env.get("PYTHONPATH")]))
+    command = [interpreter or mayapyPath(), "-c", IMPORT_TIMER.format(moduleName)]
+    times = []
+    for _ in xrange(repeat):
+        output = subprocess.check_output(command, env=env)
+        times.append(float(output.strip().splitlines()[-1]))
+    return min(times)
+
+def templateGuideData(guideCount=100, handlesPerGuide=50):
+    """Returns synthetic chained guide data in the getGuideData layout."""
+    guideData = []
+    for i in xrange(guideCount):
+        handleRange = xrange(handlesPerGuide)
+        guideData.append({
+            "guideNodeType": template.SPINE_NODE_TYPE,
+            "className": "GuideSpine",
+            "forgeID": "guide{}".format(i),
+            "name": "benchmarkGuide{}".format(i),
+            "parentGuideID": "guide{}".format(i - 1) if i else "",
+            "parentGuideHandleIndex": -1,
+            "provideAimVector": False,
+            "handleColor": (0.5, 0.5, 0.5),
+            "translation": (0.0, 0.0, 0.0),
+            "rotation": (0.0, 0.0, 0.0),
+            "scale": (1.0, 1.0, 1.0),
+            "handleCount": handlesPerGuide,
+            "handleForgeIDs": ["handle{}_{}".format(i, j) for j in handleRange],
+            "handleNames": ["benchmarkHandle{}_{}".format(i, j) for j in handleRange],
+            "handleRotateOrders": [0] * handlesPerGuide,
+            "handleTranslations": [j * 0.1 + 1.0 / 3 for j in xrange(handlesPerGuide * 3)],
+            "handleRotations": [j * 0.7 for j in xrange(handlesPerGuide * 3)],
+            "handleRadii": [1.0 + j / 7.0 for j in handleRange],
+        })
+    return guideData
+
+def _perHandleJson(guideData):
+    """Returns the guide data as JSON with one dictionary per handle."""
+    records = []
+    for data in guideData:
+        record = dict((k, v) for k, v in data.items() if not k.startswith("handle"))
+        record["handles"] = [{
+            "forgeID": data["handleForgeIDs"][i],
+            "name": data["handleNames"][i],
+            "rotateOrder": data["handleRotateOrders"][i],
+            "translation": data["handleTranslations"][i * 3:i * 3 + 3],
+            "rotation": data["handleRotations"][i * 3:i * 3 + 3],
+            "radius": data["handleRadii"][i],
+        } for i in xrange(data["handleCount"])]
+        records.append(record)
+    return json.dumps(records, indent=4)
+
+def compareTemplateFormats(handleCount=5000, handlesPerGuide=50, repeat=3):
+    """Time an encode and decode round trip of the template format and of per-handle JSON.
+
+    Returns a dictionary of format name to (best seconds, size in bytes).
+    """
+    guideData = templateGuideData(max(1, handleCount // handlesPerGuide), handlesPerGuide)
+    formats = {
+        "template": (template.encodeTemplate, template.decodeTemplate),
+        "json": (_perHandleJson, json.loads),
+    }
+    results = {}
+    for name, (encode, decode) in sorted(formats.items()):
+        best = timeIt(lambda: decode(encode(guideData)), repeat)[1]
+        results[name] = (best, len(encode(guideData)))
+        print "{:<10} best {:8.3f}s  size {:>10} bytes".format(name, *results[name])
+    return results
+
+def compareTemplateImport(guideCount=50, handlesPerGuide=10):
+    """Time building synthetic template data with template.buildGuidesSerially and template.buildGuides.
+
+    Each build runs in a new file. Returns a dictionary of build name to seconds,
+    with the phase timings of the batched build under "batchedPhases".
+    """
+    guideData = templateGuideData(guideCount, handlesPerGuide)
+    results = {}
+    cmds.file(new=True, force=True)
+    results["serial"] = timeIt(lambda: template.buildGuidesSerially(guideData), 1)[0]
+    cmds.file(new=True, force=True)
+    phases = {}
+    results["batched"] = timeIt(lambda: template.buildGuides(guideData, phases), 1)[0]
+    results["batchedPhases"] = phases
+    print "serial     {:8.3f}s".format(results["serial"])
+    print "batched    {:8.3f}s".format(results["batched"])
+    for phase, seconds in sorted(phases.items()):
+        print "  {:<8} {:8.3f}s".format(phase, seconds)
+    return results
+
+class _SyntheticGuideModel(object):
+    """Stands in for GuideDataModel with a chain of guides that exist only in memory."""
+
+    def __init__(self, guideCount, handlesPerGuide):
+        from .ui import datamodel
+
+        self.records = {}
+        self.connections = []
+        previous = None
+        for i in xrange(guideCount):
+            forgeID = "benchmarkGuide{}".format(i)
+            record = datamodel.GuideRecord(forgeID)
+            record.name = forgeID
+            record.guideClass = "GuideSpine"
+            record.handleCount = handlesPerGuide
+            record.dirty = False
+            self.records[forgeID] = record
+            if previous is not None:
+                self.connections.append((previous, -1, forgeID))
+            previous = forgeID
+        self.model = self
+
+    def guideIDs(self):
+        return self.records.iterkeys()
+
+    def guideRecord(self, id):
+        return self.records[id]
+
+def _scanUpdateConnections(scene):
+    """ForgeNodeScene.updateConnections as it was before the scene kept its items by forgeID.
+
+    Every connector is removed and recreated, and both guide node items of
+    each connection are found by scanning every item of the scene.
+    """
+    from .ui import connector
+    from .ui import nodeitem
+
+    def nodeByID(gID):
+        return dict((item.forgeID, item) for item in scene.items()
+                    if isinstance(item, nodeitem.GuideNodeItem))[gID]
+
+    for item in scene.items():
+        if isinstance(item, connector.Connector):
+            item.prepareToRemove()
+            scene.removeItem(item)
+    for output, index, input in scene.model.connections:
+        outputPlugs = nodeByID(output).getPlugItems(nodeitem.ConnectionPlugItem.Output, index)
+        inputPlug = nodeByID(input).getPlugItems(nodeitem.ConnectionPlugItem.Input)[0]
+        scene.addItem(connector.Connector(outputPlugs, inputPlug))
+
+def _timeConnectionUpdates(guideCount, handlesPerGuide, repeat, updateConnections, changeOne=True):
+    """Returns the (rebuild, changeOne) seconds of an updateConnections function on a synthetic scene.
+
+    "rebuild" removes and restores every connection, "changeOne" removes
+    and restores one connection. changeOne is None unless requested.
+    """
+    from .ui import nodescene
+
+    model = _SyntheticGuideModel(guideCount, handlesPerGuide)
+    scene = nodescene.ForgeNodeScene(model)
+    scene.rebuildFromData()
+    connections = list(model.connections)
+
+    def update(changed):
+        model.connections = changed
+        updateConnections(scene)
+        model.connections = connections
+        updateConnections(scene)
+
+    try:
+        rebuild = timeIt(lambda: update([]), repeat)[1]
+        changed = timeIt(lambda: update(connections[:-1]), repeat)[1] if changeOne else None
+    finally:
+        scene.clearItems()
+    return rebuild, changed
+
+def compareSceneConnections(guideCount=2000, handlesPerGuide=4, repeat=3, baselineGuideCount=200):
+    """Time ForgeNodeScene.updateConnections against the algorithm it replaced.
+
+    "rebuild" removes and restores every connection of guideCount chained
+    guides and "changeOne" one connection. The replaced algorithm, which
+    recreated every connector and found items by scanning the scene, is
+    O(connections x items), so it is timed in full on baselineGuideCount
+    guides only: "scanRebuildBaseline" against "rebuildBaseline", the current
+    algorithm on the same scene size. Returns a dictionary of name to seconds.
+    """
+    from .ui import nodescene
+
+    results = {}
+    results["rebuild"], results["changeOne"] = _timeConnectionUpdates(
+        guideCount, handlesPerGuide, repeat, nodescene.ForgeNodeScene.updateConnections)
+    results["rebuildBaseline"] = _timeConnectionUpdates(
+        baselineGuideCount, handlesPerGuide, repeat, nodescene.ForgeNodeScene.updateConnections, False)[0]
+    results["scanRebuildBaseline"] = _timeConnectionUpdates(
+        baselineGuideCount, handlesPerGuide, repeat, _scanUpdateConnections, False)[0]
+    print "{} guides".format(guideCount)
+    print "rebuild    {:8.3f}s".format(results["rebuild"])
+    print "changeOne  {:8.3f}s".format(results["changeOne"])
+    print "{} guides".format(baselineGuideCount)
+    print "rebuild    {:8.3f}s".format(results["rebuildBaseline"])
+    print "scan       {:8.3f}s (replaced algorithm)".format(results["scanRebuildBaseline"])
+    return results
+
+def compareSceneRebuild(guideCount=2000, handlesPerGuide=4, repeat=3):
+    """Time ForgeNodeScene.rebuildFromData against clearing the scene and building it again.
+
+    "reconcile" rebuilds with one guide removed and restored. Returns a
+    dictionary of method name to seconds.
+    """
+    from .ui import nodescene
+
+    model = _SyntheticGuideModel(guideCount, handlesPerGuide)
+    scene = nodescene.ForgeNodeScene(model)
+    scene.rebuildFromData()
+    connections = list(model.connections)
+
+    def reconcile():
+        forgeID, record = model.records.popitem()
+        model.connections = [c for c in connections if forgeID not in (c[0], c[2])]
+        scene.rebuildFromData()
+        model.records[forgeID] = record
+        model.connections = connections
+        scene.rebuildFromData()
+
+    def recreate():
+        scene.clearItems()
+        scene.rebuildFromData()
+
+    results = {}
+    results["reconcile"] = timeIt(reconcile, repeat)[1]
+    results["recreate"] = timeIt(recreate, repeat)[1]
+    print "{} guides".format(guideCount)
+    print "reconcile  {:8.3f}s".format(results["reconcile"])
+    print "recreate   {:8.3f}s".format(results["recreate"])
+    scene.clearItems()
+    return results
@@ -1,37 +1,75 @@
-import pymel.core as pm
-import maya.api.OpenMaya as OpenMaya
+"""my.skeleton.boneforge.core
 
-from . import handle
-from . import guide
+Importing this module has no side effects and does not import PyMEL, Maya
+or the BoneForge plugin. The Guide and Handle classes of the selected backend
+(see boneforge.backend) are imported, and the plugin loaded, the first time
+one of Guide, GuideSpine, GuideLimb, GuideBlock, Handle, guide or handle is
+read from this module, or a function needing them is called.
+"""
+from . import backend
+import lib.lazy
 
+cmds = lib.lazy.LazyModule("maya.cmds")
+OpenMaya = lib.lazy.LazyModule("maya.api.OpenMaya")
 
 LOAD_PLUGIN = True
 PLUGIN_PATH = "boneforge.py"
-if LOAD_PLUGIN:
-    if not pm.pluginInfo(PLUGIN_PATH, q=True, loaded=True):
-        pm.loadPlugin(PLUGIN_PATH)
 
-from .guide import Guide, GuideSpine, GuideLimb, GuideBlock
-from .handle import Handle
+def ensurePlugin():
+    """Load the BoneForge plugin if it is not loaded yet."""
+    if not cmds.pluginInfo(PLUGIN_PATH, q=True, loaded=True):
+        cmds.loadPlugin(PLUGIN_PATH)
+
+def _guideModule():
+    """Returns the guide module of the selected backend, loading the plugin first."""
+    if LOAD_PLUGIN:
+        ensurePlugin()
+    if backend.BACKEND == backend.OPENMAYA:
+        from . import apiguide
+        return apiguide
+    from . import guide
+    return guide
+
+def _handleModule():
+    """Returns the handle module of the selected backend, loading the plugin first."""
+    if LOAD_PLUGIN:
+        ensurePlugin()
+    if backend.BACKEND == backend.OPENMAYA:
+        from . import apihandle
+        return apihandle
+    from . import handle
+    return handle
 
 def guidesFromScene():
-    allGuides = set()
-    for nodetype in guide.GUIDE_NODE_TYPES:
-        cls = guide.GUIDE_NODE_CLASS[nodetype]
-        allGuides.update(map(cls, pm.ls(type=nodetype)))
-    return list(allGuides)
+    return _guideModule().guidesFromScene()
+
+def guideFromName(name):
+    """Returns the Guide of the selected backend for the named guide node or transform."""
+    return _guideModule().guideFromName(name)
+
+def migrateGuideLinks(guides=None):
+    """Link guides attached by a stored parentGuideHandleIndex to the parent Handle itself.
+
+    The scene edits are made in one undo chunk. Returns the list of migrated guides.
+    """
+    import lib.modifier
+
+    if guides is None:
+        guides = guidesFromScene()
+    with lib.modifier.undoChunk("boneforgeMigrateGuideLinks"):
+        return [g for g in guides if g.migrateParentGuideHandleIndex()]
 
 def addGuideHandle(guide):
     if guide.handleCount() > 1:
         lastHandle = guide.handleAtIndex(-1)
         secondLastHandle = guide.handleAtIndex(-2)
-        lastPos = OpenMaya.MVector(lastHandle.transform.translate.get())
-        secondLastPos = OpenMaya.MVector(secondLastHandle.transform.translate.get())
+        lastPos = _handleTranslation(lastHandle)
+        secondLastPos = _handleTranslation(secondLastHandle)
         vector = lastPos - secondLastPos
         newPos = lastPos + vector
     else:
         lastHandle = guide.handleAtIndex(-1)
-        lastPos = OpenMaya.MVector(lastHandle.transform.translate.get())
+        lastPos = _handleTranslation(lastHandle)
         newPos = lastPos
     print newPos
     guide.addHandle(position=newPos)
@@ -39,25 +77,34 @@ def addGuideHandle(guide):
 def insertGuideHandle(guide, index):
     if index == 0:
         baseHandle = guide.handleAtIndex(0)
-        newPos = OpenMaya.MVector(baseHandle.transform.translate.get())
+        newPos = _handleTranslation(baseHandle)
     elif index == guide.handleCount():
         addGuideHandle(guide)
         return
     else:
         after = guide.handleAtIndex(index)
         before = guide.handleAtIndex(index - 1)
-        afterPos = OpenMaya.MVector(after.transform.translate.get())
-        beforePos = OpenMaya.MVector(before.transform.translate.get())
+        afterPos = _handleTranslation(after)
+        beforePos = _handleTranslation(before)
         vector = (afterPos - beforePos) * 0.5
         newPos = beforePos + vector
     guide.insertHandle(index, position=newPos)
 
+def _handleTranslation(handle):
+    return OpenMaya.MVector(cmds.getAttr("{}.translate".format(handle.transform))[0])
+
 def buildSkeleton(rootGuide):
+    """Reference skeleton build, one PyMEL joint at a time.
+
+    See skeleton.buildSkeleton for the batched build engine.
+    """
+    import pymel.core as pm
+
     stack = [(rootGuide.handleAtIndex(0), None)]
     skeleton, noBind, noExport = [], [], []
     while stack:
         handle, parent = stack.pop()
-        jnt = handle.buildJoint()
+        jnt = pm.PyNode(handle.buildJoint())
         if parent:
             jnt.setParent(parent)
             pm.rename(jnt, handle.name)
@@ -67,4 +114,14 @@ def buildSkeleton(rootGuide):
 
     pm.makeIdentity(skeleton[0], apply=True)
     pm.select(skeleton[0])
-    return skeleton
\ No newline at end of file
+    return skeleton
+
+lib.lazy.lazyAttributes(__name__, {
+    "guide": _guideModule,
+    "handle": _handleModule,
+    "Guide": lambda: _guideModule().Guide,
+    "GuideSpine": lambda: _guideModule().GuideSpine,
+    "GuideLimb": lambda: _guideModule().GuideLimb,
+    "GuideBlock": lambda: _guideModule().GuideBlock,
+    "Handle": lambda: _handleModule().Handle,
+})
@@ -0,0 +1,361 @@
+"""my.skeleton.boneforge.graph
+
+Scene-wide in-memory index of the guide graph.
+
+A GuideGraph holds forgeID to node, guide to handles and the parent, child and
+orient target adjacency of every guide and handle in the scene. It is kept
+current by Maya connection and node added/removed callbacks, so traversal
+queries are dictionary lookups instead of listConnections calls.
+
+Guide and Handle consult the active graph, if one is installed:
+
+    graph.install()
+    ...
+    graph.uninstall()
+"""
+import maya.api.OpenMaya as OpenMaya
+import maya.utils
+import pymel.core as pm
+
+import lib.api
+
+HANDLE_NODE_TYPE = "guideHandle"
+GUIDE_NODE_TYPES = ("skeletonGuideSpine", "skeletonGuideLimb", "skeletonGuideBlock")
+
+_activeGraph = None
+
+def activeGraph():
+    """Returns the installed GuideGraph, or None."""
+    return _activeGraph
+
+def install():
+    """Create, populate and install a scene-wide GuideGraph, returning it."""
+    global _activeGraph
+    if _activeGraph is None:
+        _activeGraph = GuideGraph()
+        _activeGraph.addCallbacks()
+    return _activeGraph
+
+def uninstall():
+    """Remove the callbacks of the installed GuideGraph and stop using it."""
+    global _activeGraph
+    if _activeGraph is not None:
+        _activeGraph.removeCallbacks()
+        _activeGraph = None
+
+nodeKey = lib.api.nodeKey
+
+# Index maps holding one node per node, and those holding one node per array index
+SINGLE_MAPS = ("_handleGuide", "_parentHandle", "_orientTarget", "_parentGuide", "_parentGuideHandle",
+               "_childGuide")
+INDEXED_MAPS = ("_guideHandles", "_childHandles")
+
+
+class GuideGraph(object):
+    """Adjacency index of guide and handle nodes.
+
+    Nodes are keyed by their MObjectHandle hash code and returned as PyNodes.
+    """
+
+    def __init__(self):
+        self._callbackIDs = []
+        # Node key: attribute changed callback ID watching its forgeID
+        self._nodeCallbackIDs = {}
+        self._suspended = False
+        self.rebuild()
+
+    def rebuild(self):
+        """Discard the index and rebuild it from the scene."""
+        self._removeNodeCallbacks()
+        self._objects = {}
+        self._pynodes = {}
+        self._guideKeys = set()
+        self._forgeIDs = {}
+        self._forgeIDsDirty = True
+        self._guideHandles = {}
+        self._sortedHandles = {}
+        self._handleGuide = {}
+        self._parentHandle = {}
+        self._childHandles = {}
+        self._orientTarget = {}
+        self._parentGuide = {}
+        self._parentGuideHandle = {}
+        self._childGuide = {}
+        # Node key: set of (map name, owner key, index) entries that refer to
+        # the node, so removing a node can clear them
+        self._references = {}
+
+        nodeIter = OpenMaya.MItDependencyNodes()
+        while not nodeIter.isDone():
+            obj = nodeIter.thisNode()
+            typeName = OpenMaya.MFnDependencyNode(obj).typeName
+            if typeName == HANDLE_NODE_TYPE or typeName in GUIDE_NODE_TYPES:
+                self._addNode(obj)
+            nodeIter.next()
+        for key in list(self._objects):
+            obj = self._objects[key].object()
+            for plug in OpenMaya.MFnDependencyNode(obj).getConnections():
+                for source in plug.connectedTo(True, False):
+                    self._updateConnection(source, plug, True)
+
+    # Callbacks
+
+    def addCallbacks(self):
+        """Register the Maya callbacks that keep the index current."""
+        if self._callbackIDs:
+            return
+        ids = self._callbackIDs
+        for key in self._objects:
+            self._watchNode(key)
+        for nodeType in (HANDLE_NODE_TYPE,) + GUIDE_NODE_TYPES:
+            ids.append(OpenMaya.MDGMessage.addNodeAddedCallback(self._onNodeAdded, nodeType))
+            ids.append(OpenMaya.MDGMessage.addNodeRemovedCallback(self._onNodeRemoved, nodeType))
+        ids.append(OpenMaya.MDGMessage.addConnectionCallback(self._onConnection))
+        for message in (OpenMaya.MSceneMessage.kBeforeOpen,
+                        OpenMaya.MSceneMessage.kBeforeImport,
+                        OpenMaya.MSceneMessage.kBeforeCreateReference,
+                        OpenMaya.MSceneMessage.kBeforeLoadReference,
+                        OpenMaya.MSceneMessage.kBeforeNew):
+            ids.append(OpenMaya.MSceneMessage.addCallback(message, self._onBeforeFileIO))
+        for message in (OpenMaya.MSceneMessage.kAfterOpen,
+                        OpenMaya.MSceneMessage.kAfterImport,
+                        OpenMaya.MSceneMessage.kAfterCreateReference,
+                        OpenMaya.MSceneMessage.kAfterLoadReference,
+                        OpenMaya.MSceneMessage.kAfterUnloadReference,
+                        OpenMaya.MSceneMessage.kAfterNew):
+            ids.append(OpenMaya.MSceneMessage.addCallback(message, self._onAfterFileIO))
+
+    def removeCallbacks(self):
+        """Deregister all callbacks of this graph."""
+        if self._callbackIDs:
+            OpenMaya.MMessage.removeCallbacks(self._callbackIDs)
+        self._callbackIDs = []
+        self._removeNodeCallbacks()
+
+    def _watchNode(self, key):
+        """Watch the forgeID of the node, which the forgeID index depends on."""
+        if key not in self._nodeCallbackIDs:
+            obj = self._objects[key].object()
+            self._nodeCallbackIDs[key] = OpenMaya.MNodeMessage.addAttributeChangedCallback(
+                obj, self._onAttributeChanged)
+
+    def _removeNodeCallbacks(self):
+        if self._nodeCallbackIDs:
+            OpenMaya.MMessage.removeCallbacks(self._nodeCallbackIDs.values())
+        self._nodeCallbackIDs = {}
+
+    def _onAttributeChanged(self, msg, plug, otherPlug, clientData=None):
+        if (msg & OpenMaya.MNodeMessage.kAttributeSet
+                and OpenMaya.MFnAttribute(plug.attribute()).name == "forgeID"):
+            self._forgeIDsDirty = True
+
+    def _onBeforeFileIO(self, clientData=None):
+        # Node values are not final while a file is read, so ignore the
+        # individual events and rescan once it has finished
+        self._suspended = True
+        # A cancelled or failed read sends no after message, so check again
+        # once Maya is idle
+        maya.utils.executeDeferred(self._resumeAfterFileIO)
+
+    def _resumeAfterFileIO(self):
+        if self._suspended and self._callbackIDs:
+            self._onAfterFileIO()
+
+    def _onAfterFileIO(self, clientData=None):
+        self._suspended = False
+        self.rebuild()
+
+    def _onNodeAdded(self, obj, clientData=None):
+        if not self._suspended:
+            self._addNode(obj)
+
+    def _onNodeRemoved(self, obj, clientData=None):
+        if not self._suspended:
+            self._removeNode(nodeKey(obj))
+
+    def _onConnection(self, sourcePlug, destinationPlug, made, clientData=None):
+        if self._suspended:
+            return
+        if nodeKey(destinationPlug.node()) in self._objects:
+            self._updateConnection(sourcePlug, destinationPlug, made)
+
+    # Index maintenance
+
+    def _addNode(self, obj):
+        key = nodeKey(obj)
+        self._objects[key] = OpenMaya.MObjectHandle(obj)
+        if OpenMaya.MFnDependencyNode(obj).typeName in GUIDE_NODE_TYPES:
+            self._guideKeys.add(key)
+            self._guideHandles.setdefault(key, {})
+        else:
+            self._childHandles.setdefault(key, {})
+        self._forgeIDsDirty = True
+        if self._callbackIDs:
+            self._watchNode(key)
+
+    def _removeNode(self, key):
+        if key not in self._objects:
+            return
+        # Entries of other nodes that refer to this one
+        for name, owner, index in self._references.pop(key, ()):
+            if index is None:
+                self._unsetSingle(name, owner, key)
+            else:
+                self._unsetIndexed(name, owner, index, key)
+        # Entries of this node, and their references to other nodes
+        for name in SINGLE_MAPS:
+            target = getattr(self, name).get(key)
+            if target is not None:
+                self._unsetSingle(name, key, target)
+        for name in INDEXED_MAPS:
+            for index, target in getattr(self, name).get(key, {}).items():
+                self._unsetIndexed(name, key, index, target)
+        del self._objects[key]
+        self._pynodes.pop(key, None)
+        self._guideKeys.discard(key)
+        self._guideHandles.pop(key, None)
+        self._sortedHandles.pop(key, None)
+        self._childHandles.pop(key, None)
+        self._forgeIDsDirty = True
+        callbackID = self._nodeCallbackIDs.pop(key, None)
+        if callbackID is not None:
+            OpenMaya.MMessage.removeCallback(callbackID)
+
+    def _updateConnection(self, sourcePlug, destinationPlug, made):
+        """Apply a connection made or broken into a guide or handle node."""
+        destination = nodeKey(destinationPlug.node())
+        source = nodeKey(sourcePlug.node())
+        if destinationPlug.isElement:
+            attrName = OpenMaya.MFnAttribute(destinationPlug.array().attribute()).name
+            index = destinationPlug.logicalIndex()
+        else:
+            attrName = OpenMaya.MFnAttribute(destinationPlug.attribute()).name
+            index = None
+
+        if destination in self._guideKeys:
+            if attrName == "handle":
+                self._setIndexed("_guideHandles", destination, index, source, made)
+            elif attrName == "parentGuide":
+                self._setSingle("_parentGuide", destination, source, made)
+            elif attrName == "parentGuideHandle":
+                self._setSingle("_parentGuideHandle", destination, source, made)
+            elif attrName == "childGuide":
+                self._setSingle("_childGuide", destination, source, made)
+        else:
+            if attrName == "guide":
+                self._setSingle("_handleGuide", destination, source, made)
+            elif attrName == "parentHandle":
+                self._setSingle("_parentHandle", destination, source, made)
+            elif attrName == "childHandle":
+                self._setIndexed("_childHandles", destination, index, source, made)
+            elif attrName == "orientTarget":
+                self._setSingle("_orientTarget", destination, source, made)
+
+    def _setSingle(self, name, destination, source, made):
+        """Set or clear the source node of destination in the named single valued map."""
+        if made:
+            previous = getattr(self, name).get(destination)
+            if previous is not None:
+                self._unsetSingle(name, destination, previous)
+            getattr(self, name)[destination] = source
+            self._references.setdefault(source, set()).add((name, destination, None))
+        else:
+            self._unsetSingle(name, destination, source)
+
+    def _unsetSingle(self, name, destination, source):
+        mapping = getattr(self, name)
+        if mapping.get(destination) == source:
+            del mapping[destination]
+        self._references.get(source, set()).discard((name, destination, None))
+        if name == "_handleGuide":
+            self._sortedHandles.pop(source, None)
+
+    def _setIndexed(self, name, destination, index, source, made):
+        """Set or clear the source node at index of destination in the named indexed map."""
+        if made:
+            previous = getattr(self, name).setdefault(destination, {}).get(index)
+            if previous is not None:
+                self._unsetIndexed(name, destination, index, previous)
+            getattr(self, name)[destination][index] = source
+            self._references.setdefault(source, set()).add((name, destination, index))
+            if name == "_guideHandles":
+                self._sortedHandles.pop(destination, None)
+        else:
+            self._unsetIndexed(name, destination, index, source)
+
+    def _unsetIndexed(self, name, destination, index, source):
+        mapping = getattr(self, name).get(destination)
+        if mapping is not None and mapping.get(index) == source:
+            del mapping[index]
+        self._references.get(source, set()).discard((name, destination, index))
+        if name == "_guideHandles":
+            self._sortedHandles.pop(destination, None)
+
+    def _pynode(self, key):
+        """Returns the (cached) PyNode for the given key, or None."""
+        if key is None:
+            return None
+        node = self._pynodes.get(key)
+        if node is None:
+            objHandle = self._objects.get(key)
+            if objHandle is None or not objHandle.isValid():
+                return None
+            path = OpenMaya.MDagPath.getAPathTo(objHandle.object())
+            node = pm.PyNode(path.fullPathName())
+            self._pynodes[key] = node
+        return node
+
+    # Queries
+
+    def nodeFromID(self, forgeID):
+        """Returns the guide or handle PyNode with the given forgeID, or None."""
+        if self._forgeIDsDirty:
+            self._forgeIDs.clear()
+            for key, objHandle in self._objects.items():
+                plug = OpenMaya.MFnDependencyNode(objHandle.object()).findPlug("forgeID", False)
+                self._forgeIDs[plug.asString()] = key
+            self._forgeIDsDirty = False
+        return self._pynode(self._forgeIDs.get(forgeID))
+
+    def guides(self):
+        """Returns the PyNodes of all guide nodes in the scene."""
+        return [self._pynode(key) for key in self._guideKeys]
+
+    def handles(self, guideNode):
+        """Returns the handle PyNodes of the guide, ordered by index."""
+        key = nodeKey(guideNode)
+        handles = self._sortedHandles.get(key)
+        if handles is None:
+            indexed = self._guideHandles.get(key, {})
+            handles = [indexed[i] for i in sorted(indexed)]
+            self._sortedHandles[key] = handles
+        return [self._pynode(k) for k in handles]
+
+    def guideOf(self, handleNode):
+        """Returns the guide PyNode that owns the handle, or None."""
+        return self._pynode(self._handleGuide.get(nodeKey(handleNode)))
+
+    def parentHandle(self, handleNode):
+        """Returns the parent handle PyNode of the handle, or None."""
+        return self._pynode(self._parentHandle.get(nodeKey(handleNode)))
+
+    def childHandles(self, handleNode):
+        """Returns the child handle PyNodes of the handle, ordered by index."""
+        indexed = self._childHandles.get(nodeKey(handleNode), {})
+        return [self._pynode(indexed[i]) for i in sorted(indexed)]
+
+    def orientTarget(self, handleNode):
+        """Returns the orient target handle PyNode of the handle, or None."""
+        return self._pynode(self._orientTarget.get(nodeKey(handleNode)))
+
+    def parentGuide(self, guideNode):
+        """Returns the parent guide PyNode of the guide, or None."""
+        return self._pynode(self._parentGuide.get(nodeKey(guideNode)))
+
+    def parentGuideHandle(self, guideNode):
+        """Returns the parent guide handle PyNode the guide is linked to, or None."""
+        return self._pynode(self._parentGuideHandle.get(nodeKey(guideNode)))
+
+    def childGuide(self, guideNode):
+        """Returns the child guide PyNode of the guide, or None."""
+        return self._pynode(self._childGuide.get(nodeKey(guideNode)))
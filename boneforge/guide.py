@@ -1,26 +1,46 @@
 import pymel.core as pm
 from .handle import Handle, isHandleType
+from .guidebase import GuideBase, HandleListCache
+from . import graph
 
+import lib.nodecache
 import lib.transform
 
-class Guide(object):
-    """Base class for all guide nodes."""
+class Guide(GuideBase):
+    """Base class for all guide nodes.
 
-    def __init__(self, guideNode):
-        if pm.nodeType(guideNode) == "transform":
-            guideNode = guideNode.getShape()
-        self.guide = guideNode
+    Guide(node) returns an instance of the class matching the node type.
+    Instances are interned per node, so the node type is only queried the
+    first time a guide node, or its transform, is wrapped.
+    """
+
+    __slots__ = ("guide",)
+    _handleListCache = HandleListCache()
+
+    def __init__(self, guideNode=None):
+        # Instances are fully initialized, or reused, by __new__
+        pass
 
     def __new__(cls, guideNode=None):
-        if guideNode:
-            nodeType = pm.nodeType(guideNode)
+        if not guideNode:
+            return super(Guide, cls).__new__(cls)
+        key = hash(guideNode)
+        instance = _guideCache.get(key)
+        if instance is None:
+            node = guideNode
+            nodeType = pm.nodeType(node)
             if nodeType == "transform":
-                guideNode = guideNode.getShape()
-                nodeType = pm.nodeType(guideNode)
-            guideClass = GUIDE_NODE_CLASS[nodeType]
-            instance = guideClass.__new__(guideClass)
-        else:
-            instance = super(Guide, cls).__new__(cls)
+                node = node.getShape()
+                nodeType = pm.nodeType(node)
+            nodeKey = hash(node)
+            instance = _guideCache.get(nodeKey)
+            if instance is None:
+                guideClass = GUIDE_NODE_CLASS[nodeType]
+                instance = super(Guide, cls).__new__(guideClass)
+                instance.guide = node
+                _guideCache.add(nodeKey, node.__apimhandle__(), instance)
+            if key != nodeKey:
+                _guideCache.add(key, guideNode.__apimhandle__(), instance, primaryKey=nodeKey)
         return instance
 
     def __repr__(self):
@@ -31,6 +51,9 @@ class Guide(object):
     def __eq__(self, other):
         return isinstance(other, self.__class__) and other.guide == self.guide
 
+    def __hash__(self):
+        return hash(self.guide)
+
     @property
     def name(self):
         return self.transform.name()
@@ -55,148 +78,39 @@ class Guide(object):
     def provideAimVector(self, value):
         self.guide.provideAimVector.set(value)
 
-    def handleCount(self):
-        """Returns the number of handles associated with this guide."""
-        count = 0
-        for handle in self.guide.handle:
-            if handle.isConnected():
-                count += 1
-        return count
-
-    def handleAtIndex(self, index):
-        """Returns the Handle at the given index."""
-        return list(self.handles())[index]
-
-    def indexOf(self, handle):
-        """Returns the index of the given Handle."""
-        for i, h in enumerate(self.handles()):
-            if h == handle:
-                return i
-        else:
-            return -1
-
-    def addHandle(self, name="joint", position=(0, 0, 0)):
-        """Append a new handle to the end of the chain."""
-        self._consolidateSparseHandleArray()
-        numHandles = self.handleCount()
-        handle = self._addNewHandleAtIndex(numHandles, name, position)
-        return handle
-
-    def _addNewHandleAtIndex(self, index, name, position):
-        """Internal helper method for creating handles."""
+    def _createHandle(self, name, position):
+        """Internal helper method creating an unconnected handle under the guide transform."""
         pm.select(clear=True)
         handle = Handle.create(self.guide, name)
         handle.transform.setParent(self.transform)
         handle.transform.setTranslation(position)
-        handle.node.message.connect(self.guide.handle[index])
-        self._refreshHandleHierarchicalConnections()
         return handle
 
-    def insertHandle(self, index, name="joint", position=(0, 0, 0)):
-        """Insert a new handle at the given index."""
-        if index >= self.handleCount():
-            handle = self.addHandle(name, position)
-        else:
-            handleList = list(self.handles())
-            for i in reversed(xrange(index, self.handleCount())):
-                # If a handle after the insert point has a child in
-                # another guide, that guide needs to have its parentHandleIndex
-                # increased by 1
-                h = handleList[i]
-                for child in h.children():
-                    if child.guideNode != self.guide:
-                        g = Guide(child.guideNode)
-                        g.setParentGuideHandleIndex(g.parentGuideHandleIndex() + 1)
-                self._changeHandleIndex(i, i + 1)
-            handle = self._addNewHandleAtIndex(index, name, position)
-        return handle
+    def _queryHandles(self):
+        """Query the ordered list of handles from the guide graph or the scene."""
+        guideGraph = graph.activeGraph()
+        if guideGraph is not None:
+            return map(Handle, guideGraph.handles(self.guide))
+        return [Handle(handle.inputs()[0]) for handle in self.guide.handle if handle.isConnected()]
 
-    def removeHandle(self, index):
-        """Remove and delete the handle at the given index."""
-        self._consolidateSparseHandleArray()
-        handle = self.handleAtIndex(index)
-        # If the handle being removed has children in other guides,
-        # Set those guides to have no parent
-        for child in handle.children():
-            if child.guideNode != self.guide:
-                Guide(child.guideNode).setParentGuide(None)
-        handleList = list(self.handles())
-        for i in xrange(index + 1, self.handleCount()):
-            # If a handle after the removal point has a child in
-            # another guide, that guide needs to have its parentHandleIndex
-            # decreased by 1
-            h = handleList[i]
-            for child in h.children():
-                if child.guideNode != self.guide:
-                    g = Guide(child.guideNode)
-                    g.setParentGuideHandleIndex(g.parentGuideHandleIndex() - 1)
-            self._changeHandleIndex(i, i - 1)
-        pm.removeMultiInstance(
-            self.guide.handle[self.guide.handle.numElements() - 1], b=True)
-        pm.delete(handle.transform)
-        self._refreshHandleHierarchicalConnections()
-
-    def handles(self):
-        """Return an ordered iterator of the handles managed by this guide."""
-        for handle in self.guide.handle:
-            if handle.isConnected():
-                yield Handle(handle.inputs()[0])
-
-    def sanitize(self):
-        """Sanitize handles attribute and update hierarchy connections."""
-        self._consolidateSparseHandleArray()
-        self._refreshHandleHierarchicalConnections()
-
-    def _refreshHandleHierarchicalConnections(self):
-        """Re-set parent/child relationship connections on the handles of this guide."""
-        handleIter = self.handles()
-        prevHandle = next(handleIter)
-        # Set the first handle's parent to the handle at parentHandleIndex of parentHandle
-        if self.parentGuide() is not None:
-            parentHandle = self.parentGuide().handleAtIndex(self.parentGuideHandleIndex())
-            prevHandle.setParent(parentHandle)
-            if self.parentGuideHandleIndex() == -1:
-                parentHandle.setOrientTarget(prevHandle)
-        for handle in handleIter:
-            handle.setParent(prevHandle)
-            prevHandle.setOrientTarget(handle)
-            prevHandle = handle
-        # Set the final handle's orient target if there is a child guide
-        if self.childGuide() is not None:
-            nextHandle = self.childGuide().handleAtIndex(0)
-            lastHandle = self.handleAtIndex(-1)
-            nextHandle.setParent(lastHandle)
-            lastHandle.setOrientTarget(nextHandle)
-        else:
-            lastHandle = self.handleAtIndex(-1)
-            lastHandle.setOrientTarget(None)
+    def _connectHandles(self, handles, index):
+        """Connect the Handles to the handle array, starting at the given index."""
+        for offset, handle in enumerate(handles):
+            handle.node.message.connect(self.guide.handle[index + offset])
 
-    def _consolidateSparseHandleArray(self):
-        """Remove unconnected handle array entries.
+    def _deleteHandles(self, handles):
+        """Delete the given Handles."""
+        pm.delete([handle.transform for handle in handles])
 
-        Pushes all connections to occupy consecutive indices starting from 0.
-        """
-        i = 0
-        for handle in self.guide.handle:
-            if not handle.isConnected():
-                continue
-            if handle.index() == i:
-                i += 1
-                continue
-            self._changeHandleIndex(handle.index(), i)
-            i += 1
-
-    def _changeHandleIndex(self, fromIndex, toIndex):
-        """Moves the handle connection from one index to another."""
-        sourceHandle = self.guide.handle[fromIndex]
-        destinationHandle = self.guide.handle[toIndex]
-        handlePlug = sourceHandle.inputs(plugs=True)[0]
-        destinationHandle.disconnect()
-        handlePlug.connect(destinationHandle)
-        sourceHandle.disconnect()
+    def _storedParentGuideHandleIndex(self):
+        return self.guide.parentGuideHandleIndex.get()
 
     def parentGuide(self):
         """Returns the parent guide."""
+        guideGraph = graph.activeGraph()
+        if guideGraph is not None:
+            guide = guideGraph.parentGuide(self.guide)
+            return Guide(guide) if guide is not None else None
         guide = self.guide.parentGuide.listConnections(shapes=True)
         if guide:
             return Guide(guide[0])
@@ -210,7 +124,9 @@ class Guide(object):
         will orient to this guide's first handle.
         
         Other index values represent which handle on the previous guide
-        is the parent of the first handle of this guide.
+        is the parent of the first handle of this guide. The guide is linked
+        to that Handle itself, so the index follows it through insertions
+        and removals.
         """
         baseHandle = self.handleAtIndex(0)
         baseHandle.setParent(None)
@@ -219,6 +135,7 @@ class Guide(object):
             currentParent.guide.childGuide.disconnect()
             currentParent.handleAtIndex(-1).setOrientTarget(None)
         self.guide.parentGuide.disconnect()
+        pm.disconnectAttr(self.guide.parentGuideHandle)
         if guide is not None:
             guide.guide.message.connect(self.guide.parentGuide)
             baseHandle.setParent(guide.handleAtIndex(index))
@@ -228,13 +145,35 @@ class Guide(object):
                 guide.setChildGuide(self)
             self.setParentGuideHandleIndex(index)
 
-    def parentGuideHandleIndex(self):
-        return self.guide.parentGuideHandleIndex.get()
+    def parentGuideHandle(self):
+        """Returns the Handle of the parent guide that this guide is linked to.
+
+        Returns None if the guide follows the last handle of its parent guide,
+        has no parent, or has not been migrated from a stored index.
+        """
+        guideGraph = graph.activeGraph()
+        if guideGraph is not None:
+            handle = guideGraph.parentGuideHandle(self.guide)
+            return Handle(handle) if handle is not None else None
+        handle = self.guide.parentGuideHandle.listConnections(shapes=True)
+        if handle:
+            return Handle(handle[0])
+        return None
 
     def setParentGuideHandleIndex(self, index):
+        """Link this guide to the handle at the given index of its parent guide."""
+        pm.disconnectAttr(self.guide.parentGuideHandle)
         self.guide.parentGuideHandleIndex.set(index)
+        parentGuide = self.parentGuide()
+        if index != -1 and parentGuide is not None:
+            parentHandle = parentGuide.handleAtIndex(index)
+            parentHandle.node.message.connect(self.guide.parentGuideHandle)
 
     def childGuide(self):
+        guideGraph = graph.activeGraph()
+        if guideGraph is not None:
+            guide = guideGraph.childGuide(self.guide)
+            return Guide(guide) if guide is not None else None
         guide = self.guide.childGuide.listConnections(shapes=True)
         if guide:
             return Guide(guide[0])
@@ -268,66 +207,15 @@ class Guide(object):
     def setHandleColor(self, color):
         self.guide.handleColor.set(color)
 
-    def getGuideData(self):
-        data = {}
-        data["guideNodeType"] = self.nodetype
-        data["className"] = self.__class__.__name__
-        data["forgeID"] = self.forgeID
-        data["name"] = self.name()
-        parentGuide = self.parentGuide()
-        parentGuideHandleIndex = self.parentGuideHandleIndex()
-        if parentGuide is not None:
-            parentGuideID = parentGuide.forgeID
-        else:
-            parentGuideID = None
-        data["parentGuideID"] = parentGuideID
-        data["parentGuideHandleIndex"] = parentGuideHandleIndex
-
-        data["handleCount"] = self.handleCount()
-
-        ## Handle Data
-        handleData = []
-        for handle in self.handles():
-            hd = {}
-            hd["forgeID"] = handle.forgeID
-            hd["name"] = handle.name
-            hd["rotateOrder"] = handle.rotateOrder
-            hd["translation"] = tuple(pm.xform(handle.transform, q=True, translation=True, worldSpace=True))
-            hd["rotation"] = tuple(pm.xform(handle.transform, q=True, rotation=True, worldSpace=True))
-            hd["radius"] = handle.transform.radius.get()
-
-        data["handleColor"] = self.handleColor()
-
-        data["translation"] = tuple(pm.xform(self.transform, q=True, translation=True, worldSpace=True))
-        data["rotation"] = tuple(pm.xform(self.transform, q=True, rotation=True, worldSpace=True))
-        data["scale"] = tuple(pm.xform(self.transform, q=True, scale=True, worldSpace=True))
-        return data
-
-    @staticMethod
-    def fromGuideData(data, idMap=None):
-        nodeType = data["guideNodeType"]
-        cls = GUIDE_NODE_CLASS[nodeType]
-        guide = cls.create(name=data["name"])
-        cls._setValuesFromGuideData(guide, data, idMap)
-        return guide
-    
-    @classmethod
-    def _setValuesFromGuideData(cls, guide, data, idMap=None):
-        pm.xform(guide.transform, translation=data["translation"], worldSpace=True)
-        pm.xform(guide.transform, rotation=data["rotation"], worldSpace=True)
-        pm.xform(guide.transform, scale=data["scale"], worldSpace=True)
-        guide.setHandleColor(data.get("handleColor", (0.0, 0.0, 0.0)))
-        ## Get parent guide from given id
-        ## I think this needs to be in the import template script to ensure the parent
-        ## exists by the time we set it
-        #parentGuide = data["parentGuideID"]
-        #parentGuideHandleIndex = data["parentGuideHandleIndex"]
-        #guide.setParentGuide(parentGuide, parentGuideHandleIndex)
+    @staticmethod
+    def _nodeClass(nodeType):
+        return GUIDE_NODE_CLASS[nodeType]
 
 
 class GuideSpine(Guide):
     """Control Class for planar spine guide object."""
 
+    __slots__ = ()
     nodetype = "skeletonGuideSpine"
 
     @classmethod
@@ -347,15 +235,18 @@ class GuideSpine(Guide):
         handle.transform.translateX.setLocked(True)
         return handle
 
-    def insertHandle(self, index, name="joint", position=(0, 0, 0)):
-        """Insert a new handle at the given index."""
-        handle = super(GuideSpine, self).addHandle(index, name, position)
-        handle.transform.translateX.setLocked(True)
+    def insertHandles(self, index, positions, name="joint"):
+        """Insert a new handle at the given index for each of the given positions."""
+        handles = super(GuideSpine, self).insertHandles(index, positions, name)
+        for handle in handles:
+            handle.transform.translateX.setLocked(True)
+        return handles
 
 
 class GuideLimb(Guide):
     """Control Class for limb guide object."""
 
+    __slots__ = ()
     nodetype = "skeletonGuideLimb"
 
     @classmethod
@@ -482,18 +373,27 @@ class GuideLimb(Guide):
         self.setEndHandle(handle)
         return handle
 
-    def insertHandle(self, index, name="joint", position=(0, 0, 0)):
-        """Insert a new handle at the given index.
-        
-        This extends the base class to set the new handle as the Base Handle
-        if it becomes the new first handle (inserted at index 0).
+    def insertHandles(self, index, positions, name="joint"):
+        """Insert a new handle at the given index for each of the given positions.
+
+        This extends the base class to set the first new handle as the Base Handle
+        if inserted at index 0, or the last new handle as the End Handle if
+        appended after the last handle.
         """
-        handle = super(GuideLimb, self).insertHandle(index, name, position)
+        handleCount = self.handleCount()
+        handles = super(GuideLimb, self).insertHandles(index, positions, name)
+        if not handles:
+            return handles
+        orientGroupHandles = handles
         if index == 0:
-            self.setBaseHandle(handle)
-        else:
+            self.setBaseHandle(handles[0])
+            orientGroupHandles = handles[1:]
+        elif index >= handleCount:
+            self.setEndHandle(handles[-1])
+            orientGroupHandles = handles[:-1]
+        for handle in orientGroupHandles:
             self.moveToOrientGroup(handle)
-        return handle
+        return handles
 
     def _pynodeIsGuidePart(self, node):
         return (super(GuideLimb, self)._pynodeIsGuidePart(node)
@@ -503,6 +403,7 @@ class GuideLimb(Guide):
 class GuideBlock(Guide):
     """Control Class for block guide object."""
 
+    __slots__ = ()
     nodetype = "skeletonGuideBlock"
 
     @classmethod
@@ -517,6 +418,9 @@ class GuideBlock(Guide):
         return guide
 
 
+_guideCache = lib.nodecache.NodeCache(graph.GUIDE_NODE_TYPES)
+
+
 GUIDE_NODE_TYPES = (GuideSpine.nodetype, GuideLimb.nodetype, GuideBlock.nodetype)
 GUIDE_NODE_CLASS = {
     GuideSpine.nodetype: GuideSpine,
@@ -524,6 +428,20 @@ GUIDE_NODE_CLASS = {
     GuideBlock.nodetype: GuideBlock,
 }
 
+def guidesFromScene():
+    """Returns Guides for every guide node in the scene."""
+    guideGraph = graph.activeGraph()
+    if guideGraph is not None:
+        return map(Guide, guideGraph.guides())
+    allGuides = set()
+    for nodetype in GUIDE_NODE_TYPES:
+        allGuides.update(map(Guide, pm.ls(type=nodetype)))
+    return list(allGuides)
+
+def guideFromName(name):
+    """Returns the Guide of the named guide node or transform."""
+    return Guide(pm.PyNode(name))
+
 def isGuideType(obj):
     if pm.nodeType(obj) == "transform":
         obj = obj.getShape()
@@ -0,0 +1,461 @@
+"""my.skeleton.boneforge.guidebase
+
+Backend independent behaviour shared by the Guide classes.
+
+GuideBase implements handle list queries, handle insertion and removal and the
+handle hierarchy in terms of the public Guide and Handle methods and a few
+node level primitives. The PyMEL (boneforge.guide) and OpenMaya
+(boneforge.apiguide) backends subclass it and provide the primitives:
+
+    _queryHandles()                    ordered list of connected Handles
+    _createHandle(name, position)      new Handle parented under the guide
+    _connectHandles(handles, index)    connect Handles from the given array index
+    _deleteHandles(handles)            delete the Handles' transforms
+    _storedParentGuideHandleIndex()    raw parentGuideHandleIndex value
+    _nodeClass(nodeType)               Guide class of a guide node type
+
+This module must not import PyMEL.
+"""
+import maya.api.OpenMaya as OpenMaya
+import maya.cmds as cmds
+
+import lib.api
+import lib.modifier
+from template import LIMB_NODE_TYPE, limbLayout
+
+
+class GuideBase(object):
+    """Base class of the Guide classes of every backend.
+
+    Each backend sets _handleListCache to its own HandleListCache, as the
+    cached lists hold that backend's Handles.
+    """
+
+    __slots__ = ()
+    _handleListCache = None
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def handleCount(self):
+        """Returns the number of handles associated with this guide."""
+        handles, _ = self._handleListCache.get(self)
+        return len(handles)
+
+    def handleAtIndex(self, index):
+        """Returns the Handle at the given index."""
+        handles, _ = self._handleListCache.get(self)
+        return handles[index]
+
+    def indexOf(self, handle):
+        """Returns the index of the given Handle."""
+        _, indices = self._handleListCache.get(self)
+        return indices.get(handle, -1)
+
+    def handles(self):
+        """Return an ordered iterator of the handles managed by this guide."""
+        handles, _ = self._handleListCache.get(self)
+        return iter(handles)
+
+    def addHandle(self, name="joint", position=(0, 0, 0)):
+        """Append a new handle to the end of the chain."""
+        self._consolidateSparseHandleArray()
+        numHandles = self.handleCount()
+        handle = self._addNewHandleAtIndex(numHandles, name, position)
+        return handle
+
+    def _addNewHandleAtIndex(self, index, name, position):
+        """Internal helper method for creating handles."""
+        handle = self._createHandle(name, position)
+        self._connectHandles([handle], index)
+        self._refreshHandleHierarchicalConnections()
+        return handle
+
+    def insertHandle(self, index, name="joint", position=(0, 0, 0)):
+        """Insert a new handle at the given index."""
+        if index >= self.handleCount():
+            return self.addHandle(name, position)
+        return self.insertHandles(index, [position], name)[0]
+
+    def insertHandles(self, index, positions, name="joint"):
+        """Insert a new handle at the given index for each of the given positions.
+
+        Every later handle is shifted once, and the handle hierarchy is updated
+        once for the whole operation. Returns the list of new Handles.
+        """
+        if not positions:
+            return []
+        with lib.modifier.undoChunk("boneforgeInsertHandles"):
+            self._consolidateSparseHandleArray()
+            handleCount = self.handleCount()
+            count = len(positions)
+            index = min(index, handleCount)
+            self._reindexHandles(dict((i, i + count) for i in xrange(index, handleCount)))
+            newHandles = [self._createHandle(name, position) for position in positions]
+            self._connectHandles(newHandles, index)
+            self._refreshHandleHierarchicalConnections()
+        return newHandles
+
+    def removeHandle(self, index):
+        """Remove and delete the handle at the given index."""
+        self.removeHandles([index])
+
+    def removeHandles(self, indices):
+        """Remove and delete the handles at the given indices.
+
+        Negative indices count from the last handle, as in a list. Raises an
+        IndexError for indices out of range.
+
+        Every remaining handle is moved at most once, and the handle hierarchy
+        is updated once for the whole operation.
+        """
+        indices = list(indices)
+        if not indices:
+            return
+        self._consolidateSparseHandleArray()
+        handleList = list(self.handles())
+        handleCount = len(handleList)
+        if handleCount == 0:
+            return
+        for i in indices:
+            if not -handleCount <= i < handleCount:
+                raise IndexError("Handle index {} out of range for guide {!r} with {} handles".format(
+                    i, self.name, handleCount))
+        removed = sorted(set(i + handleCount if i < 0 else i for i in indices))
+        if len(removed) == handleCount:
+            raise RuntimeError("Cannot remove every handle of guide {!r}".format(self.name))
+        removedSet = set(removed)
+        with lib.modifier.undoChunk("boneforgeRemoveHandles"):
+            # If a handle being removed has children in other guides,
+            # Set those guides to have no parent
+            for i in removed:
+                for child in handleList[i].children():
+                    if not lib.api.sameNode(child.guideNode, self.guide):
+                        self.__class__(child.guideNode).setParentGuide(None)
+            moves = {}
+            newIndex = 0
+            for i in xrange(handleCount):
+                if i in removedSet:
+                    continue
+                if i != newIndex:
+                    moves[i] = newIndex
+                newIndex += 1
+            self._reindexHandles(moves, removed)
+            self._deleteHandles([handleList[i] for i in removed])
+            self._refreshHandleHierarchicalConnections()
+
+    def sanitize(self):
+        """Sanitize handles attribute and update hierarchy connections."""
+        self.migrateParentGuideHandleIndex()
+        self._consolidateSparseHandleArray()
+        self._refreshHandleHierarchicalConnections()
+
+    def _refreshHandleHierarchicalConnections(self):
+        """Re-set parent/child relationship connections on the handles of this guide."""
+        handleIter = self.handles()
+        prevHandle = next(handleIter)
+        # Set the first handle's parent to the handle at parentHandleIndex of parentHandle
+        if self.parentGuide() is not None:
+            parentHandle = self.parentGuide().handleAtIndex(self.parentGuideHandleIndex())
+            prevHandle.setParent(parentHandle)
+            if self.parentGuideHandleIndex() == -1:
+                parentHandle.setOrientTarget(prevHandle)
+        for handle in handleIter:
+            handle.setParent(prevHandle)
+            prevHandle.setOrientTarget(handle)
+            prevHandle = handle
+        # Set the final handle's orient target if there is a child guide
+        if self.childGuide() is not None:
+            nextHandle = self.childGuide().handleAtIndex(0)
+            lastHandle = self.handleAtIndex(-1)
+            nextHandle.setParent(lastHandle)
+            lastHandle.setOrientTarget(nextHandle)
+        else:
+            lastHandle = self.handleAtIndex(-1)
+            lastHandle.setOrientTarget(None)
+
+    def _consolidateSparseHandleArray(self):
+        """Remove unconnected handle array entries.
+
+        Pushes all connections to occupy consecutive indices starting from 0.
+        """
+        if self._handleListCache.isCompact(self):
+            return
+        arrayPlug = self._handleArrayPlug()
+        connected = [i for i in arrayPlug.getExistingArrayAttributeIndices()
+                     if arrayPlug.elementByLogicalIndex(i).isConnected]
+        moves = dict((fromIndex, toIndex) for toIndex, fromIndex in enumerate(connected)
+                     if fromIndex != toIndex)
+        self._reindexHandles(moves)
+        self._handleListCache.setCompact(self, len(connected))
+
+    def _changeHandleIndex(self, fromIndex, toIndex):
+        """Moves the handle connection from one index to another."""
+        self._reindexHandles({fromIndex: toIndex})
+
+    def _reindexHandles(self, moves, removed=()):
+        """Apply a permutation of handle array connections as one undoable step.
+
+        moves maps source indices to destination indices, and the connections
+        at the removed indices are broken. All disconnections and connections
+        are executed by a single MDGModifier, and array elements left empty
+        are removed.
+        """
+        if not (moves or removed):
+            return
+        arrayPlug = self._handleArrayPlug()
+        modifier = OpenMaya.MDGModifier()
+        sources = {}
+        for index in set(moves) | set(removed):
+            element = arrayPlug.elementByLogicalIndex(index)
+            for source in element.connectedTo(True, False):
+                modifier.disconnect(source, element)
+                sources[index] = source
+        for fromIndex, toIndex in moves.items():
+            if fromIndex in sources:
+                modifier.connect(sources[fromIndex], arrayPlug.elementByLogicalIndex(toIndex))
+        for index in (set(moves) | set(removed)) - set(moves.values()):
+            modifier.removeMultiInstance(arrayPlug.elementByLogicalIndex(index), True)
+        lib.modifier.doIt(modifier)
+
+    def _handleArrayPlug(self):
+        """Returns the API 2.0 MPlug of the guide's handle array."""
+        return lib.api.findPlug(lib.api.toMObject(self.guide), "handle")
+
+    def parentGuideHandleIndex(self):
+        """Returns the index of the parent guide handle this guide is attached to.
+
+        The index is derived from the parentGuideHandle link. -1 means the guide
+        follows the last handle of its parent guide. Unmigrated guides fall back
+        to the stored parentGuideHandleIndex value.
+        """
+        handle = self.parentGuideHandle()
+        if handle is not None:
+            parentGuide = self.parentGuide()
+            if parentGuide is not None:
+                return parentGuide.indexOf(handle)
+        return self._storedParentGuideHandleIndex()
+
+    def migrateParentGuideHandleIndex(self):
+        """Convert a stored parentGuideHandleIndex into a parentGuideHandle link.
+
+        Returns True if the guide was migrated.
+        """
+        if self.parentGuide() is None or self.parentGuideHandle() is not None:
+            return False
+        index = self._storedParentGuideHandleIndex()
+        if index == -1:
+            return False
+        self.setParentGuideHandleIndex(index)
+        return True
+
+    def getGuideData(self):
+        """Returns a dictionary of the values of this guide and its handles.
+
+        Handle values are stored as one list per attribute, ordered by handle
+        index. handleTranslations and handleRotations hold 3 floats per handle,
+        in the local space of the handle transform's parent.
+        """
+        data = {}
+        data["guideNodeType"] = self.nodetype
+        data["className"] = self.__class__.__name__
+        data["forgeID"] = self.forgeID
+        data["name"] = self.name
+        parentGuide = self.parentGuide()
+        data["parentGuideID"] = parentGuide.forgeID if parentGuide is not None else None
+        data["parentGuideHandleIndex"] = self.parentGuideHandleIndex()
+        data["provideAimVector"] = bool(self.provideAimVector)
+        data["handleColor"] = tuple(self.handleColor())
+
+        transform = str(self.transform)
+        data["translation"] = tuple(cmds.xform(transform, q=True, translation=True, worldSpace=True))
+        data["rotation"] = tuple(cmds.xform(transform, q=True, rotation=True, worldSpace=True))
+        data["scale"] = tuple(cmds.xform(transform, q=True, scale=True, worldSpace=True))
+
+        handles = list(self.handles())
+        data["handleCount"] = len(handles)
+        data["handleForgeIDs"] = [handle.forgeID for handle in handles]
+        data["handleNames"] = [handle.name for handle in handles]
+        data["handleRotateOrders"] = [handle.rotateOrder for handle in handles]
+        translations, rotations, radii = [], [], []
+        for handle in handles:
+            transform = str(handle.transform)
+            translations.extend(cmds.getAttr(transform + ".translate")[0])
+            rotations.extend(cmds.getAttr(transform + ".rotate")[0])
+            radii.append(cmds.getAttr(transform + ".scaleY"))
+        data["handleTranslations"] = translations
+        data["handleRotations"] = rotations
+        data["handleRadii"] = radii
+        if self.nodetype == LIMB_NODE_TYPE:
+            data.update(self._getLimbLayoutData(handles))
+        return data
+
+    def _orientGroupChildren(self):
+        """Returns the set of long names of the transforms in a limb's orient group."""
+        group = cmds.ls(str(self.orientGroup), long=True)[0]
+        return set(cmds.listRelatives(group, children=True, type="transform", fullPath=True) or [])
+
+    def _getLimbLayoutData(self, handles):
+        """Returns the limb handle roles and orient group membership for getGuideData.
+
+        limbHandleIndices holds the base, hinge and end handle indices, see
+        limbLayout, and handleInOrientGroup one bool per handle.
+        """
+        indices = dict((handle, i) for i, handle in enumerate(handles))
+        roles = (self.baseHandle(), self.hingeHandle(), self.endHandle())
+        grouped = self._orientGroupChildren()
+        return {
+            "limbHandleIndices": [indices.get(handle, -1) if handle is not None else -1 for handle in roles],
+            "handleInOrientGroup": [cmds.ls(str(handle.transform), long=True)[0] in grouped for handle in handles],
+            "useChildBaseAsEnd": bool(self.useChildBaseAsEnd),
+        }
+
+    @classmethod
+    def fromGuideData(cls, data, idMap=None):
+        """Create a guide from a getGuideData dictionary.
+
+        Parenting to other guides is not restored, see boneforge.template.
+        If idMap is given, it is updated with the forgeIDs of the data mapped
+        to the forgeIDs of the new guide and handles.
+        """
+        guideClass = cls._nodeClass(data["guideNodeType"])
+        guide = guideClass.create(name=data["name"])
+        guideClass._setValuesFromGuideData(guide, data, idMap)
+        return guide
+
+    @classmethod
+    def _setValuesFromGuideData(cls, guide, data, idMap=None):
+        transform = str(guide.transform)
+        cmds.xform(transform, translation=data["translation"], worldSpace=True)
+        cmds.xform(transform, rotation=data["rotation"], worldSpace=True)
+        cmds.xform(transform, scale=data["scale"], worldSpace=True)
+        guide.setHandleColor(data.get("handleColor", (0.0, 0.0, 0.0)))
+        guide.provideAimVector = data.get("provideAimVector", False)
+
+        count = data["handleCount"]
+        currentCount = guide.handleCount()
+        if currentCount < count:
+            guide.insertHandles(currentCount, [(0, 0, 0)] * (count - currentCount))
+        elif currentCount > count:
+            guide.removeHandles(range(count, currentCount))
+        if data["guideNodeType"] == LIMB_NODE_TYPE:
+            # Handle translations are local to the orient group or guide, so
+            # arrange the handles before setting them
+            guide._setLimbLayoutFromGuideData(data)
+
+        translations = data["handleTranslations"]
+        rotations = data["handleRotations"]
+        for i, handle in enumerate(guide.handles()):
+            handle.name = data["handleNames"][i]
+            handle.rotateOrder = data["handleRotateOrders"][i]
+            transform = str(handle.transform)
+            _setUnlocked(transform, ("translateX", "translateY", "translateZ"), translations[i * 3:i * 3 + 3])
+            _setUnlocked(transform, ("rotateX", "rotateY", "rotateZ"), rotations[i * 3:i * 3 + 3])
+            _setUnlocked(transform, ("scaleY",), (data["handleRadii"][i],))
+
+        if idMap is not None:
+            idMap[data["forgeID"]] = guide.forgeID
+            for oldID, handle in zip(data["handleForgeIDs"], guide.handles()):
+                idMap[oldID] = handle.forgeID
+
+
+    def _setLimbLayoutFromGuideData(self, data):
+        """Set a limb's base, hinge and end handles and orient group membership from getGuideData."""
+        base, hinge, end, groupIndices = limbLayout(data)
+        handles = list(self.handles())
+        if base >= 0:
+            self.setBaseHandle(handles[base])
+        if hinge >= 0:
+            self.setHingeHandle(handles[hinge])
+        if end >= 0:
+            self.setEndHandle(handles[end])
+        grouped = self._orientGroupChildren()
+        for i, handle in enumerate(handles):
+            inGroup = cmds.ls(str(handle.transform), long=True)[0] in grouped
+            if i in groupIndices and not inGroup:
+                self.moveToOrientGroup(handle)
+            elif i not in groupIndices and inGroup:
+                self.removeFromOrientGroup(handle)
+
+
+def _setUnlocked(node, attrs, values):
+    """Set the values of the given attributes, skipping locked ones."""
+    for attr, value in zip(attrs, values):
+        plug = "{}.{}".format(node, attr)
+        if not cmds.getAttr(plug, lock=True):
+            cmds.setAttr(plug, value)
+
+
+class HandleListCache(object):
+    """Ordered handle lists per guide node.
+
+    Each entry is invalidated by an attribute changed callback on its guide
+    node whenever a connection to the handle array is made or broken.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._compactCounts = {}
+        self._callbackIDs = {}
+
+    def get(self, guide):
+        """Returns a (handles, indices) tuple for the guide.
+
+        handles is the ordered list of Handles and indices maps each Handle to its index.
+        """
+        key = lib.api.nodeKey(guide.guide)
+        entry = self._entries.get(key)
+        if entry is None:
+            handles = guide._queryHandles()
+            entry = (handles, dict((h, i) for i, h in enumerate(handles)))
+            self._entries[key] = entry
+            if key not in self._callbackIDs:
+                self._watch(key, guide.guide)
+        return entry
+
+    def isCompact(self, guide):
+        """Returns True if the guide's handle connections are known to occupy indices 0 to n-1."""
+        return lib.api.nodeKey(guide.guide) in self._compactCounts
+
+    def setCompact(self, guide, count):
+        """Record that the guide's handle connections occupy indices 0 to count-1."""
+        key = lib.api.nodeKey(guide.guide)
+        self._compactCounts[key] = count
+        if key not in self._callbackIDs:
+            self._watch(key, guide.guide)
+
+    def invalidate(self, guideNode=None):
+        """Discard the cached handles of the given guide node, or of all guides."""
+        if guideNode is None:
+            self._entries.clear()
+            self._compactCounts.clear()
+        else:
+            key = lib.api.nodeKey(guideNode)
+            self._entries.pop(key, None)
+            self._compactCounts.pop(key, None)
+
+    def _watch(self, key, guideNode):
+        obj = lib.api.toMObject(guideNode)
+        self._callbackIDs[key] = [
+            OpenMaya.MNodeMessage.addAttributeChangedCallback(obj, self._onAttributeChanged, key),
+            OpenMaya.MNodeMessage.addNodePreRemovalCallback(obj, self._onNodeRemoved, key),
+        ]
+
+    def _onAttributeChanged(self, msg, plug, otherPlug, key):
+        if not msg & (OpenMaya.MNodeMessage.kConnectionMade | OpenMaya.MNodeMessage.kConnectionBroken):
+            return
+        if plug.isElement and OpenMaya.MFnAttribute(plug.array().attribute()).name == "handle":
+            self._entries.pop(key, None)
+            # Appending to or removing from the end keeps the array compact
+            count = self._compactCounts.pop(key, None)
+            if count is not None:
+                index = plug.logicalIndex()
+                if msg & OpenMaya.MNodeMessage.kConnectionMade and index == count:
+                    self._compactCounts[key] = count + 1
+                elif msg & OpenMaya.MNodeMessage.kConnectionBroken and index == count - 1:
+                    self._compactCounts[key] = count - 1
+
+    def _onNodeRemoved(self, obj, key):
+        self._entries.pop(key, None)
+        self._compactCounts.pop(key, None)
+        OpenMaya.MMessage.removeCallbacks(self._callbackIDs.pop(key, []))
@@ -0,0 +1,309 @@
+"""my.skeleton.boneforge.guidebuild
+
+Batched guide creation engine.
+
+buildGuides creates a whole graph of guides from getGuideData dictionaries in
+three batched steps instead of one Guide.create, handle insertion and
+setParentGuide call per guide:
+
+    create    one MDagModifier creates every guide, orient group and handle node
+    connect   one MDGModifier sets every value and makes every connection,
+              including the handle hierarchy and the links between guides
+    lock      one MEL batch, queued on a modifier, aliases and locks channels
+
+Guides are ordered parents first, so every link is wired in the connect step.
+The whole build is one undo chunk. The result matches guides built by
+fromGuideData and setParentGuide, which template.buildGuidesSerially keeps as
+the reference implementation.
+
+This module must not import PyMEL.
+"""
+import maya.api.OpenMaya as OpenMaya
+import maya.cmds as cmds
+
+from .apihandle import GUIDE_HANDLE_ATTRS, HANDLE_NODE_TYPE
+import lib.api
+import lib.modifier
+import lib.timing
+import template
+from template import LIMB_NODE_TYPE, SPINE_NODE_TYPE, limbLayout, orientGroupIndices
+
+
+class GuideNodes(object):
+    """MObjects of one guide being built."""
+
+    __slots__ = ("transform", "shape", "orientGroup", "handleTransforms", "handles", "nextChildElements",
+                 "hasChildGuide", "useChildBaseAsEnd")
+
+    def __init__(self):
+        self.orientGroup = None
+        self.hasChildGuide = False
+        # A limb whose end handle is the base handle of its child guide
+        self.useChildBaseAsEnd = False
+        self.handleTransforms = []
+        self.handles = []
+        # Next free childHandle element index, per handle
+        self.nextChildElements = []
+
+
+def buildGuides(guideData, timings=None, builtGuides=None):
+    """Create guides from getGuideData dictionaries and restore their parenting.
+
+    builtGuides maps the data forgeIDs of guides built by earlier calls, or of
+    existing guides (see guideNodesFromGuide), to their GuideNodes, so a
+    template can be built in several batches or attached to guides in the
+    scene. It is updated with the new guides. Links to parent guides found in neither are
+    dropped. A guide has a single child guide following its last handle, so
+    further guides following the same parent are left unparented.
+
+    If timings is given, it is filled with the seconds spent in each phase.
+
+    Returns a (guides, idMap) tuple, where idMap maps the forgeIDs of the data
+    to the forgeIDs of the new guides and handles.
+    """
+    from . import core
+
+    timer = lib.timing.PhaseTimer(timings)
+    records = template.sortGuideData(guideData)
+    if not records:
+        return [], {}
+    if builtGuides is None:
+        builtGuides = {}
+    timer.lap("sort")
+
+    with lib.modifier.undoChunk("boneforgeBuildGuides"):
+        nodes = _createNodes(records)
+        builtGuides.update((data["forgeID"], guideNodes) for data, guideNodes in zip(records, nodes))
+        timer.lap("create")
+
+        modifier = OpenMaya.MDGModifier()
+        for data, guideNodes in zip(records, nodes):
+            _queueGuide(modifier, data, guideNodes)
+        for data, guideNodes in zip(records, nodes):
+            parentNodes = builtGuides.get(data["parentGuideID"])
+            if parentNodes is None or parentNodes is guideNodes:
+                continue
+            handleIndex = data["parentGuideHandleIndex"]
+            if handleIndex == -1:
+                if parentNodes.hasChildGuide:
+                    continue
+                parentNodes.hasChildGuide = True
+            _queueGuideLink(modifier, parentNodes, guideNodes, handleIndex)
+        lib.modifier.doIt(modifier)
+        timer.lap("connect")
+
+        lib.modifier.doIt(_lockModifier(records, nodes))
+        timer.lap("lock")
+
+        guideNames = [OpenMaya.MFnDagNode(guideNodes.transform).fullPathName() for guideNodes in nodes]
+        cmds.select(guideNames)
+
+    idMap = {}
+    for data, guideNodes in zip(records, nodes):
+        idMap[data["forgeID"]] = _forgeID(guideNodes.shape)
+        for oldID, handle in zip(data["handleForgeIDs"], guideNodes.handles):
+            idMap[oldID] = _forgeID(handle)
+    guides = map(core.guideFromName, guideNames)
+    timer.lap("wrap")
+    timer.stop()
+    return guides, idMap
+
+def guideNodesFromGuide(guide):
+    """Returns the GuideNodes of an existing Guide, of either backend.
+
+    New guides can then be linked to it through the builtGuides argument of
+    buildGuides.
+    """
+    guideNodes = GuideNodes()
+    guideNodes.shape = lib.api.toMObject(guide.guide)
+    guideNodes.transform = OpenMaya.MFnDagNode(guideNodes.shape).parent(0)
+    guideNodes.hasChildGuide = guide.childGuide() is not None
+    for handle in guide.handles():
+        node = lib.api.toMObject(handle.node)
+        guideNodes.handles.append(node)
+        guideNodes.handleTransforms.append(OpenMaya.MFnDagNode(node).parent(0))
+        indices = lib.api.findPlug(node, "childHandle").getExistingArrayAttributeIndices()
+        guideNodes.nextChildElements.append(max(indices) + 1 if indices else 0)
+    return guideNodes
+
+def snapshotGuides(guides, linkExternal=True):
+    """Returns the (guideData, builtGuides) needed to rebuild copies of the given Guides.
+
+    guideData holds the getGuideData of every guide. Links between the given
+    guides are kept. Links to other parent guides are kept through builtGuides
+    if linkExternal is True, and cleared otherwise.
+    """
+    guideData = [guide.getGuideData() for guide in guides]
+    ids = set(data["forgeID"] for data in guideData)
+    builtGuides = {}
+    for guide, data in zip(guides, guideData):
+        parentID = data["parentGuideID"]
+        if not parentID or parentID in ids:
+            continue
+        if not linkExternal:
+            data["parentGuideID"] = None
+        elif parentID not in builtGuides:
+            builtGuides[parentID] = guideNodesFromGuide(guide.parentGuide())
+    return guideData, builtGuides
+
+def duplicateGuides(guides, linkExternal=True, timings=None):
+    """Create copies of the given Guides in one batch.
+
+    The copies get new forgeIDs, and links between the given guides are
+    recreated between their copies. If linkExternal is True, copies of guides
+    parented to a guide outside the set are parented to that same guide.
+
+    Returns a (guides, idMap) tuple, where idMap maps the forgeIDs of the
+    original guides and handles to those of their copies.
+    """
+    guideData, builtGuides = snapshotGuides(guides, linkExternal)
+    return buildGuides(guideData, timings, builtGuides)
+
+def _createNodes(records):
+    """Create the nodes of every guide with one MDagModifier and return their GuideNodes."""
+    modifier = OpenMaya.MDagModifier()
+    nodes = []
+    for data in records:
+        guideNodes = GuideNodes()
+        guideNodes.transform = modifier.createNode("transform")
+        modifier.renameNode(guideNodes.transform, data["name"])
+        guideNodes.shape = modifier.createNode(data["guideNodeType"], guideNodes.transform)
+        modifier.renameNode(guideNodes.shape, data["name"] + "Shape")
+        if data["guideNodeType"] == LIMB_NODE_TYPE:
+            guideNodes.orientGroup = modifier.createNode("transform", guideNodes.transform)
+            guideNodes.useChildBaseAsEnd = bool(data.get("useChildBaseAsEnd", False))
+        groupIndices = orientGroupIndices(data)
+        for i, name in enumerate(data["handleNames"]):
+            parent = guideNodes.orientGroup if i in groupIndices else guideNodes.transform
+            transform = modifier.createNode("transform", parent)
+            modifier.renameNode(transform, name)
+            handle = modifier.createNode(HANDLE_NODE_TYPE, transform)
+            modifier.renameNode(handle, name + "Shape")
+            guideNodes.handleTransforms.append(transform)
+            guideNodes.handles.append(handle)
+            guideNodes.nextChildElements.append(0)
+        nodes.append(guideNodes)
+    lib.modifier.doIt(modifier)
+    return nodes
+
+def _worldMatrixPlug(transform):
+    return lib.api.findPlug(transform, "worldMatrix").elementByLogicalIndex(0)
+
+def _queueValues(modifier, plug, values, convert=float):
+    """Queue setting the children of a compound double plug."""
+    for i, value in enumerate(values):
+        modifier.newPlugValueDouble(plug.child(i), convert(value))
+
+def _queueGuide(modifier, data, guideNodes):
+    """Queue the values and internal connections of one guide and its handles."""
+    guideFn = OpenMaya.MFnDependencyNode(guideNodes.shape)
+    transformFn = OpenMaya.MFnDependencyNode(guideNodes.transform)
+    modifier.connect(_worldMatrixPlug(guideNodes.transform), guideFn.findPlug("guideMatrix", False))
+    _queueValues(modifier, transformFn.findPlug("translate", False), data["translation"],
+                 OpenMaya.MDistance.uiToInternal)
+    _queueValues(modifier, transformFn.findPlug("rotate", False), data["rotation"],
+                 OpenMaya.MAngle.uiToInternal)
+    _queueValues(modifier, transformFn.findPlug("scale", False), data["scale"])
+    colorPlug = guideFn.findPlug("handleColor", False)
+    for i, value in enumerate(data.get("handleColor", (0.0, 0.0, 0.0))):
+        modifier.newPlugValueFloat(colorPlug.child(i), value)
+    modifier.newPlugValueBool(guideFn.findPlug("provideAimVector", False),
+                              bool(data.get("provideAimVector", False)))
+
+    if guideNodes.orientGroup is not None:
+        groupFn = OpenMaya.MFnDependencyNode(guideNodes.orientGroup)
+        modifier.connect(groupFn.findPlug("message", False), guideFn.findPlug("orientGroup", False))
+        modifier.connect(guideFn.findPlug("orientGroupTranslate", False), groupFn.findPlug("translate", False))
+        modifier.connect(guideFn.findPlug("orientGroupRotate", False), groupFn.findPlug("rotate", False))
+
+    handleArray = guideFn.findPlug("handle", False)
+    translations = data["handleTranslations"]
+    rotations = data["handleRotations"]
+    for i, (transform, handle) in enumerate(zip(guideNodes.handleTransforms, guideNodes.handles)):
+        handleFn = OpenMaya.MFnDependencyNode(handle)
+        transformFn = OpenMaya.MFnDependencyNode(transform)
+        scaleY = transformFn.findPlug("scaleY", False)
+        modifier.connect(_worldMatrixPlug(transform), handleFn.findPlug("handleMatrix", False))
+        modifier.connect(scaleY, transformFn.findPlug("scaleX", False))
+        modifier.connect(scaleY, transformFn.findPlug("scaleZ", False))
+        for guideAttr, handleAttr in GUIDE_HANDLE_ATTRS:
+            modifier.connect(guideFn.findPlug(guideAttr, False), handleFn.findPlug(handleAttr, False))
+        modifier.connect(handleFn.findPlug("message", False), handleArray.elementByLogicalIndex(i))
+
+        _queueValues(modifier, transformFn.findPlug("translate", False), translations[i * 3:i * 3 + 3],
+                     OpenMaya.MDistance.uiToInternal)
+        _queueValues(modifier, transformFn.findPlug("rotate", False), rotations[i * 3:i * 3 + 3],
+                     OpenMaya.MAngle.uiToInternal)
+        modifier.newPlugValueDouble(scaleY, data["handleRadii"][i])
+        modifier.newPlugValueShort(handleFn.findPlug("jointRotateOrder", False), data["handleRotateOrders"][i])
+
+        if i > 0:
+            _queueHandleParent(modifier, guideNodes, i - 1, guideNodes, i)
+            _queueOrientTarget(modifier, guideNodes, i - 1, guideNodes, i)
+
+    if data["guideNodeType"] == LIMB_NODE_TYPE:
+        base, hinge, end = limbLayout(data)[:3]
+        for attr, index in (("baseMatrix", base), ("hingeMatrix", hinge), ("endMatrix", end)):
+            if index >= 0:
+                modifier.connect(_worldMatrixPlug(guideNodes.handleTransforms[index]), guideFn.findPlug(attr, False))
+
+def _queueHandleParent(modifier, parentNodes, parentIndex, childNodes, childIndex):
+    """Queue making a handle the child of another, as Handle.setParent does."""
+    parentFn = OpenMaya.MFnDependencyNode(parentNodes.handles[parentIndex])
+    childFn = OpenMaya.MFnDependencyNode(childNodes.handles[childIndex])
+    parentMatrix = _worldMatrixPlug(parentNodes.handleTransforms[parentIndex])
+    childMatrix = _worldMatrixPlug(childNodes.handleTransforms[childIndex])
+    modifier.connect(parentFn.findPlug("message", False), childFn.findPlug("parentHandle", False))
+    modifier.connect(parentMatrix, childFn.findPlug("parentHandleMatrix", False))
+    element = parentNodes.nextChildElements[parentIndex]
+    parentNodes.nextChildElements[parentIndex] += 1
+    modifier.connect(childFn.findPlug("message", False),
+                     parentFn.findPlug("childHandle", False).elementByLogicalIndex(element))
+    modifier.connect(childMatrix, parentFn.findPlug("childHandleMatrix", False).elementByLogicalIndex(element))
+
+def _queueOrientTarget(modifier, handleNodes, handleIndex, targetNodes, targetIndex):
+    """Queue making a handle orient towards another."""
+    handleFn = OpenMaya.MFnDependencyNode(handleNodes.handles[handleIndex])
+    targetFn = OpenMaya.MFnDependencyNode(targetNodes.handles[targetIndex])
+    modifier.connect(targetFn.findPlug("message", False), handleFn.findPlug("orientTarget", False))
+    modifier.connect(_worldMatrixPlug(targetNodes.handleTransforms[targetIndex]),
+                     handleFn.findPlug("orientTargetMatrix", False))
+
+def _queueGuideLink(modifier, parentNodes, childNodes, handleIndex):
+    """Queue linking a guide to the handle at handleIndex of its parent guide, as setParentGuide does."""
+    parentFn = OpenMaya.MFnDependencyNode(parentNodes.shape)
+    childFn = OpenMaya.MFnDependencyNode(childNodes.shape)
+    modifier.connect(parentFn.findPlug("message", False), childFn.findPlug("parentGuide", False))
+    parentHandleIndex = xrange(len(parentNodes.handles))[handleIndex]
+    _queueHandleParent(modifier, parentNodes, parentHandleIndex, childNodes, 0)
+    modifier.newPlugValueInt(childFn.findPlug("parentGuideHandleIndex", False), handleIndex)
+    if handleIndex == -1:
+        modifier.connect(childFn.findPlug("message", False), parentFn.findPlug("childGuide", False))
+        _queueOrientTarget(modifier, parentNodes, parentHandleIndex, childNodes, 0)
+        if parentNodes.useChildBaseAsEnd:
+            modifier.connect(_worldMatrixPlug(childNodes.handleTransforms[0]), parentFn.findPlug("endMatrix", False))
+            modifier.newPlugValueBool(parentFn.findPlug("useChildBaseAsEnd", False), True)
+    else:
+        parentHandleFn = OpenMaya.MFnDependencyNode(parentNodes.handles[parentHandleIndex])
+        modifier.connect(parentHandleFn.findPlug("message", False), childFn.findPlug("parentGuideHandle", False))
+
+def _lockModifier(records, nodes):
+    """Returns a modifier running one MEL batch that aliases and locks the handle channels."""
+    commands = []
+    for data, guideNodes in zip(records, nodes):
+        groupIndices = orientGroupIndices(data)
+        for i, transform in enumerate(guideNodes.handleTransforms):
+            path = OpenMaya.MFnDagNode(transform).fullPathName()
+            commands.append('aliasAttr "radius" "{}.scaleY";'.format(path))
+            for attr in ("scaleX", "scaleZ"):
+                commands.append('setAttr -lock true -keyable false -channelBox false "{}.{}";'.format(path, attr))
+            if data["guideNodeType"] == SPINE_NODE_TYPE:
+                commands.append('setAttr -lock true "{}.translateX";'.format(path))
+            if i in groupIndices:
+                commands.append('setAttr -lock true "{}.translateY";'.format(path))
+    modifier = OpenMaya.MDGModifier()
+    modifier.commandToExecute("\n".join(commands))
+    return modifier
+
+def _forgeID(node):
+    return lib.api.findPlug(node, "forgeID").asString()
@@ -1,16 +1,40 @@
 import pymel.core as pm
 
+from . import graph
 import lib.transform
 import lib.attribute
+import lib.nodecache
 
 
 class Handle(object):
-    """Control class for handle objects."""
+    """Control class for handle objects.
+
+    Instances are interned per node: Handle(node) returns the existing wrapper
+    for the node, or its shape, until the node is deleted.
+    """
+
+    __slots__ = ("node",)
+
+    def __new__(cls, handle):
+        key = hash(handle)
+        instance = _handleCache.get(key)
+        if instance is None:
+            node = handle
+            if pm.nodeType(handle) == "transform":
+                node = handle.getShape()
+            nodeKey = hash(node)
+            instance = _handleCache.get(nodeKey)
+            if instance is None:
+                instance = super(Handle, cls).__new__(cls)
+                instance.node = node
+                _handleCache.add(nodeKey, node.__apimhandle__(), instance)
+            if key != nodeKey:
+                _handleCache.add(key, handle.__apimhandle__(), instance, primaryKey=nodeKey)
+        return instance
 
     def __init__(self, handle):
-        if pm.nodeType(handle) == "transform":
-            handle = handle.getShape()
-        self.node = handle
+        # Instances are fully initialized, or reused, by __new__
+        pass
 
     @classmethod
     def create(cls, guideNode, name=None):
@@ -59,6 +83,9 @@ class Handle(object):
 
     @property
     def guideNode(self):
+        guideGraph = graph.activeGraph()
+        if guideGraph is not None:
+            return guideGraph.guideOf(self.node)
         guide = self.node.guide.listConnections(shapes=True)
         if guide:
             return guide[0]
@@ -78,6 +105,10 @@ class Handle(object):
 
     def parent(self):
         """Returns the parent Handle."""
+        guideGraph = graph.activeGraph()
+        if guideGraph is not None:
+            parentNode = guideGraph.parentHandle(self.node)
+            return self.__class__(parentNode) if parentNode is not None else None
         parentNode = self.node.parentHandle.listConnections(shapes=True)
         if parentNode:
             return self.__class__(parentNode[0])
@@ -129,11 +160,18 @@ class Handle(object):
 
     def children(self):
         """Return a list of child Handles."""
+        guideGraph = graph.activeGraph()
+        if guideGraph is not None:
+            return map(self.__class__, guideGraph.childHandles(self.node))
         return map(self.__class__,
                    self.node.childHandle.listConnections(shapes=True))
 
     def orientTarget(self):
         """Returns the Handle that this Handle will orient towards."""
+        guideGraph = graph.activeGraph()
+        if guideGraph is not None:
+            target = guideGraph.orientTarget(self.node)
+            return self.__class__(target) if target is not None else None
         target = self.node.orientTarget.listConnections(shapes=True)
         if target:
             return self.__class__(target[0])
@@ -168,6 +206,8 @@ class Handle(object):
         return jnt
 
 
+_handleCache = lib.nodecache.NodeCache(["guideHandle"])
+
 def connectGuideToHandle(guideNode, handle):
     guideNode.message.connect(handle.guide)
     guideNode.provideAimVector.connect(handle.useGuideAim)
@@ -0,0 +1,90 @@
+"""my.lib.api
+
+Maya Python API 2.0 helpers for code paths that need to avoid PyMEL overhead.
+"""
+import maya.api.OpenMaya as OpenMaya
+
+def toMObject(node):
+    """Returns the API 2.0 MObject for the given node name, PyNode, MObject or MDagPath."""
+    if isinstance(node, OpenMaya.MObject):
+        return node
+    if isinstance(node, OpenMaya.MDagPath):
+        return node.node()
+    selection = OpenMaya.MSelectionList()
+    selection.add(str(node))
+    return selection.getDependNode(0)
+
+def toDagPath(node):
+    """Returns the API 2.0 MDagPath for the given DAG node name, PyNode or MObject."""
+    if isinstance(node, OpenMaya.MDagPath):
+        return node
+    if isinstance(node, OpenMaya.MObject):
+        return OpenMaya.MDagPath.getAPathTo(node)
+    selection = OpenMaya.MSelectionList()
+    selection.add(str(node))
+    return selection.getDagPath(0)
+
+def findPlug(mobject, name):
+    """Returns the named (non-networked) plug on the given MObject."""
+    return OpenMaya.MFnDependencyNode(mobject).findPlug(name, False)
+
+def getMatrix(plug):
+    """Returns the MMatrix value of the given matrix plug."""
+    return OpenMaya.MFnMatrixData(plug.asMObject()).matrix()
+
+def nodeKey(node):
+    """Returns a hashable key identifying the node of a PyNode or API 2.0 MObject."""
+    if isinstance(node, OpenMaya.MObject):
+        return OpenMaya.MObjectHandle(node).hashCode()
+    return hash(node)
+
+def sameNode(nodeA, nodeB):
+    """Returns True if both MObjects refer to the same node, or both are None."""
+    if nodeA is None or nodeB is None:
+        return nodeA is nodeB
+    return nodeA == nodeB
+
+def shapeOfType(node, typeName):
+    """Returns the MObject of the node, or of its first child of the given type if it is a transform.
+
+    Returns None if a transform has no such child.
+    """
+    mobject = toMObject(node)
+    if not mobject.hasFn(OpenMaya.MFn.kTransform):
+        return mobject
+    dagFn = OpenMaya.MFnDagNode(mobject)
+    for i in xrange(dagFn.childCount()):
+        child = dagFn.child(i)
+        if OpenMaya.MFnDependencyNode(child).typeName == typeName:
+            return child
+    return None
+
+def sourceNode(plug):
+    """Returns the MObject of the node connected into the plug, or None."""
+    sources = plug.connectedTo(True, False)
+    if sources:
+        return sources[0].node()
+    return None
+
+def arraySourceNodes(arrayPlug):
+    """Returns the MObjects of the nodes connected into the elements of the array plug, ordered by index."""
+    nodes = []
+    for index in arrayPlug.getExistingArrayAttributeIndices():
+        sources = arrayPlug.elementByLogicalIndex(index).connectedTo(True, False)
+        if sources:
+            nodes.append(sources[0].node())
+    return nodes
+
+def firstOpenIndex(arrayPlug):
+    """Returns the first logical index of the array plug without an incoming connection."""
+    connected = set(i for i in arrayPlug.getExistingArrayAttributeIndices()
+                    if arrayPlug.elementByLogicalIndex(i).isDestination)
+    index = 0
+    while index in connected:
+        index += 1
+    return index
+
+def disconnectSources(modifier, plug):
+    """Add the disconnection of every incoming connection of the plug to the modifier."""
+    for source in plug.connectedTo(True, False):
+        modifier.disconnect(source, plug)
@@ -0,0 +1,70 @@
+"""my.lib.lazy
+
+Deferred imports, for modules that should be cheap and side effect free to import.
+
+    cmds = LazyModule("maya.cmds")
+
+    def createLocator():
+        return cmds.spaceLocator()   # maya.cmds is imported here, on first use
+
+lazyAttributes() does the same for attributes of a module, such as classes
+re-exported from a module that is expensive to import.
+"""
+import importlib
+import sys
+import types
+
+class LazyModule(object):
+    """Stand-in for a module that is imported on first attribute access."""
+
+    __slots__ = ("_name", "_module")
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return "<LazyModule {!r} ({})>".format(self._name, state)
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+    def load(self):
+        """Import and return the module."""
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def isLoaded(self):
+        return self._module is not None
+
+
+class _LazyAttributeModule(types.ModuleType):
+    """Module whose missing attributes are resolved by loader functions on first access."""
+
+    def __getattr__(self, name):
+        loaders = self.__dict__.get("_lazyLoaders", {})
+        if name not in loaders:
+            raise AttributeError("module {!r} has no attribute {!r}".format(self.__name__, name))
+        value = loaders[name]()
+        setattr(self, name, value)
+        return value
+
+def lazyAttributes(moduleName, loaders):
+    """Make attributes of an imported module resolve on first access.
+
+    loaders maps attribute names to functions returning their value. The module
+    is replaced in sys.modules by an equivalent module object that calls the
+    loader of an attribute the first time it is read. Call at the end of the
+    module. Functions of the module still see its original globals, so they
+    should call the loaders rather than read the lazy names.
+    """
+    module = sys.modules[moduleName]
+    lazyModule = _LazyAttributeModule(moduleName, module.__doc__)
+    lazyModule.__dict__.update(module.__dict__)
+    lazyModule._lazyLoaders = dict(loaders)
+    # Keep the original module alive, Python 2 clears the globals of deallocated modules
+    lazyModule._originalModule = module
+    sys.modules[moduleName] = lazyModule
+    return lazyModule
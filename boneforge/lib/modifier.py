@@ -0,0 +1,25 @@
+"""my.lib.modifier
+
+Undoable execution of OpenMaya modifiers from script code.
+
+Modifiers run directly from Python are not recorded on the undo queue, so they
+are handed to the boneforgeModifier command registered by the BoneForge plugin.
+"""
+import contextlib
+
+import maya.cmds as cmds
+
+def doIt(modifier):
+    """Execute the given MDGModifier or MDagModifier as one undoable command."""
+    import boneforgecomponents.command
+    boneforgecomponents.command.pushModifier(modifier)
+    cmds.boneforgeModifier()
+
+@contextlib.contextmanager
+def undoChunk(name="boneforge"):
+    """Context manager which groups all undoable operations in its block into one undo step."""
+    cmds.undoInfo(openChunk=True, chunkName=name)
+    try:
+        yield
+    finally:
+        cmds.undoInfo(closeChunk=True)
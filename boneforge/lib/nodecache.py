@@ -0,0 +1,80 @@
+"""my.lib.nodecache
+
+Interned per-node wrapper instances.
+
+A NodeCache maps the MObjectHandle hash code of a node to a single wrapper
+instance, so looking up the same node again returns the existing wrapper
+instead of allocating a new one. Entries are dropped once their node is
+deleted, and the whole cache is cleared when a new scene is opened.
+"""
+import maya.api.OpenMaya as OpenMaya
+
+class NodeCache(object):
+    """Wrapper instances keyed by the MObjectHandle hash code of their node.
+
+    A wrapper may be registered under several keys, for example under both a
+    transform and its shape. Alias keys are discarded together with the
+    primary key they were added for.
+    """
+
+    def __init__(self, nodeTypes):
+        self.nodeTypes = tuple(nodeTypes)
+        self._entries = {}
+        self._aliases = {}
+        self._callbackIDs = []
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Returns the wrapper registered under key, or None if its node no longer exists."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        objHandle, instance = entry
+        if not objHandle.isValid():
+            self.discard(key)
+            return None
+        return instance
+
+    def add(self, key, objHandle, instance, primaryKey=None):
+        """Register a wrapper under key.
+
+        objHandle is an MObjectHandle (API 1.0 or 2.0) of the keyed node, used to
+        check that the node still exists. If primaryKey is given, key is an
+        alias that is discarded along with primaryKey.
+        """
+        if not self._callbackIDs:
+            self.addCallbacks()
+        self._entries[key] = (objHandle, instance)
+        if primaryKey is not None and primaryKey != key:
+            self._aliases.setdefault(primaryKey, []).append(key)
+
+    def discard(self, key):
+        """Drop the wrapper registered under key and its aliases."""
+        self._entries.pop(key, None)
+        for alias in self._aliases.pop(key, ()):
+            self._entries.pop(alias, None)
+
+    def clear(self):
+        self._entries.clear()
+        self._aliases.clear()
+
+    def addCallbacks(self):
+        """Register the node removed and scene callbacks that expire entries."""
+        for nodeType in self.nodeTypes:
+            self._callbackIDs.append(
+                OpenMaya.MDGMessage.addNodeRemovedCallback(self._onNodeRemoved, nodeType))
+        for message in (OpenMaya.MSceneMessage.kBeforeNew, OpenMaya.MSceneMessage.kBeforeOpen):
+            self._callbackIDs.append(OpenMaya.MSceneMessage.addCallback(message, self._onSceneCleared))
+
+    def removeCallbacks(self):
+        if self._callbackIDs:
+            OpenMaya.MMessage.removeCallbacks(self._callbackIDs)
+        self._callbackIDs = []
+
+    def _onNodeRemoved(self, obj, clientData=None):
+        self.discard(OpenMaya.MObjectHandle(obj).hashCode())
+
+    def _onSceneCleared(self, clientData=None):
+        self.clear()
@@ -0,0 +1,37 @@
+"""my.lib.timing
+
+Wall clock timing of the phases of long operations.
+
+    timer = PhaseTimer(timings)
+    createNodes()
+    timer.lap("create")
+    connectNodes()
+    timer.lap("connect")
+    timer.stop()     # timings == {"create": ..., "connect": ..., "total": ...}
+"""
+import time
+
+class PhaseTimer(object):
+    """Records the seconds spent in each phase into a dictionary.
+
+    Times are added to those already in the dictionary, so one dictionary can
+    total several runs. timings may be None, in which case nothing is recorded.
+    """
+
+    __slots__ = ("timings", "_start", "_lapStart")
+
+    def __init__(self, timings=None):
+        self.timings = timings
+        self._start = self._lapStart = time.time()
+
+    def lap(self, phase):
+        """Record the time since the previous lap, or the start, as the given phase."""
+        now = time.time()
+        if self.timings is not None:
+            self.timings[phase] = self.timings.get(phase, 0.0) + now - self._lapStart
+        self._lapStart = now
+
+    def stop(self, phase="total"):
+        """Record the time since the start as the given phase."""
+        if self.timings is not None:
+            self.timings[phase] = self.timings.get(phase, 0.0) + time.time() - self._start
@@ -0,0 +1,158 @@
+"""my.skeleton.boneforge.mirror
+
+Vectorized mirroring of guide subtrees.
+
+mirrorGuides snapshots a set of guides and all their descendant guides with
+getGuideData, reflects every guide and handle transform across a world plane
+with a few NumPy array operations, and creates the mirrored guides through
+guidebuild.buildGuides, so the whole mirror is one undoable step.
+
+A guide's world matrix G becomes Sl G Sw, where Sw reflects across the world
+plane and Sl reflects the guide's local X axis, which keeps the matrix a
+rotation. Handles parented to the guide transform have their local X
+translation and their Y and Z rotations negated to match. The orient group of
+a limb is solved by the guide node from its mirrored base, hinge and end
+handles, which reflects its local Y (plane normal) axis, so handles inside it,
+as recorded by getGuideData, have their local Y translation and X and Z
+rotations negated.
+
+Guide and handle names have their side tokens swapped, see mirrorName.
+"""
+import re
+
+import numpy
+
+import template
+
+AXIS_INDEX = {"x": 0, "y": 1, "z": 2}
+# Pairs of side tokens swapped in names, matched as whole "_" separated parts
+SIDE_TOKENS = (("L", "R"), ("l", "r"), ("Lf", "Rt"), ("lf", "rt"),
+               ("Left", "Right"), ("left", "right"))
+# Side words swapped at the start of camelCase names, such as leftArm
+SIDE_PREFIXES = (("left", "right"),)
+
+_SIDE_TOKEN_MAP = dict(SIDE_TOKENS + tuple((b, a) for a, b in SIDE_TOKENS))
+_SIDE_PREFIX_MAP = dict(SIDE_PREFIXES + tuple((b, a) for a, b in SIDE_PREFIXES))
+_SIDE_PREFIX_PATTERN = re.compile(r"^({})(?=[A-Z0-9])".format("|".join(_SIDE_PREFIX_MAP)))
+
+
+def mirrorName(name):
+    """Returns the name with its side tokens swapped, such as L_arm to R_arm."""
+    parts = [_SIDE_TOKEN_MAP.get(part, part) for part in name.split("_")]
+    parts[0] = _SIDE_PREFIX_PATTERN.sub(lambda m: _SIDE_PREFIX_MAP[m.group(1)], parts[0])
+    return "_".join(parts)
+
+def eulerToMatrices(degrees):
+    """Returns (N, 3, 3) row-vector rotation matrices of (N, 3) XYZ Euler angles in degrees."""
+    a, b, c = numpy.radians(numpy.asarray(degrees, dtype=numpy.float64).reshape(-1, 3)).T
+    ca, sa, cb, sb, cc, sc = numpy.cos(a), numpy.sin(a), numpy.cos(b), numpy.sin(b), numpy.cos(c), numpy.sin(c)
+    matrices = numpy.empty((len(a), 3, 3))
+    matrices[:, 0] = numpy.stack([cb * cc, cb * sc, -sb], axis=-1)
+    matrices[:, 1] = numpy.stack([sa * sb * cc - ca * sc, sa * sb * sc + ca * cc, sa * cb], axis=-1)
+    matrices[:, 2] = numpy.stack([ca * sb * cc + sa * sc, ca * sb * sc - sa * cc, ca * cb], axis=-1)
+    return matrices
+
+def matricesToEuler(matrices):
+    """Returns (N, 3) XYZ Euler angles in degrees of (N, 3, 3) row-vector rotation matrices."""
+    sinB = numpy.clip(-matrices[:, 0, 2], -1.0, 1.0)
+    b = numpy.arcsin(sinB)
+    gimbal = numpy.abs(sinB) > 1.0 - 1e-9
+    a = numpy.where(gimbal, 0.0, numpy.arctan2(matrices[:, 1, 2], matrices[:, 2, 2]))
+    c = numpy.where(gimbal,
+                    numpy.arctan2(-matrices[:, 1, 0], matrices[:, 1, 1]),
+                    numpy.arctan2(matrices[:, 0, 1], matrices[:, 0, 0]))
+    return numpy.degrees(numpy.stack([a, b, c], axis=-1))
+
+def _reflection(axis):
+    scale = numpy.ones(3)
+    scale[AXIS_INDEX[axis]] = -1.0
+    return scale
+
+def mirrorGuideData(guideData, axis="x", renameSides=True):
+    """Returns copies of getGuideData dictionaries mirrored across the world plane normal to axis.
+
+    forgeIDs and parent links are kept, so the result can be passed to
+    guidebuild.buildGuides, which assigns new forgeIDs. Needs NumPy but not Maya.
+    """
+    if not guideData:
+        return []
+    worldScale = _reflection(axis)
+    localX = _reflection("x")
+
+    translations = numpy.array([data["translation"] for data in guideData], dtype=numpy.float64)
+    rotations = eulerToMatrices([data["rotation"] for data in guideData])
+    translations *= worldScale
+    # Sl R Sw, as row and column scales
+    rotations *= localX[numpy.newaxis, :, numpy.newaxis]
+    rotations *= worldScale[numpy.newaxis, numpy.newaxis, :]
+    eulers = matricesToEuler(rotations)
+
+    counts = [data["handleCount"] for data in guideData]
+    handleTranslations = numpy.concatenate(
+        [numpy.asarray(data["handleTranslations"], dtype=numpy.float64) for data in guideData]).reshape(-1, 3)
+    handleRotations = numpy.concatenate(
+        [numpy.asarray(data["handleRotations"], dtype=numpy.float64) for data in guideData]).reshape(-1, 3)
+    inOrientGroup = numpy.zeros(len(handleTranslations), dtype=bool)
+    first = 0
+    for data, count in zip(guideData, counts):
+        for index in template.orientGroupIndices(data):
+            inOrientGroup[first + index] = True
+        first += count
+    translationScale = numpy.where(inOrientGroup[:, numpy.newaxis], _reflection("y"), localX)
+    rotationScale = -translationScale
+    handleTranslations *= translationScale
+    handleRotations *= rotationScale
+
+    mirrored = []
+    first = 0
+    for i, (data, count) in enumerate(zip(guideData, counts)):
+        last = first + count
+        record = dict(data)
+        record["translation"] = tuple(translations[i])
+        record["rotation"] = tuple(eulers[i])
+        record["handleTranslations"] = handleTranslations[first:last].ravel().tolist()
+        record["handleRotations"] = handleRotations[first:last].ravel().tolist()
+        if renameSides:
+            record["name"] = mirrorName(data["name"])
+            record["handleNames"] = map(mirrorName, data["handleNames"])
+        mirrored.append(record)
+        first = last
+    return mirrored
+
+def guideSubtrees(guides, allGuides=None):
+    """Returns the given Guides and all their descendant guides, parents first."""
+    from . import core
+
+    if allGuides is None:
+        allGuides = core.guidesFromScene()
+    children = {}
+    for guide in allGuides:
+        parent = guide.parentGuide()
+        if parent is not None:
+            children.setdefault(parent.forgeID, []).append(guide)
+    result, visited = [], set()
+    stack = list(reversed(guides))
+    while stack:
+        guide = stack.pop()
+        forgeID = guide.forgeID
+        if forgeID in visited:
+            continue
+        visited.add(forgeID)
+        result.append(guide)
+        stack.extend(reversed(children.get(forgeID, [])))
+    return result
+
+def mirrorGuides(guides, axis="x", renameSides=True, timings=None):
+    """Mirror the given Guides and all their descendant guides.
+
+    The mirrored subtree is attached to the same parent guides and handle
+    indices as the original, unless that parent already has a child guide
+    following its last handle.
+
+    Returns a (guides, idMap) tuple, where idMap maps the forgeIDs of the
+    original guides and handles to those of their mirrors.
+    """
+    from . import guidebuild
+
+    guideData, builtGuides = guidebuild.snapshotGuides(guideSubtrees(guides))
+    return guidebuild.buildGuides(mirrorGuideData(guideData, axis, renameSides), timings, builtGuides)
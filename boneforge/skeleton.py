@@ -0,0 +1,430 @@
+"""my.skeleton.boneforge.skeleton
+
+Batched skeleton build engine.
+
+Joints are created, parented and named through a single MDagModifier and their
+transforms are written through a single MDGModifier, all inside one undo chunk.
+core.buildSkeleton is kept as the reference implementation to compare against.
+
+Joint values are solved analytically: each joint gets zero rotation, its
+orientation relative to the parent handle's jointMatrix in jointOrient and its
+translation relative to the parent joint, so no makeIdentity pass is needed.
+
+Every built joint is tagged with the forgeID of its handle, which lets
+updateSkeleton edit an existing skeleton in place instead of rebuilding it.
+A HandleTracker passed to the updates remembers the skeleton's root joint and
+records which handles changed since, so later updates neither search the
+scene for joints nor compare the joints of unchanged handles.
+"""
+import maya.api.OpenMaya as OpenMaya
+import maya.cmds as cmds
+import pymel.core as pm
+
+import lib.api
+import lib.modifier
+
+FORGE_ID_ATTR = "forgeID"
+VALUE_TOLERANCE = 1e-6
+
+
+def collectHandleTree(rootGuide):
+    """Walk the handle hierarchy below the root guide once.
+
+    Returns a list of (handle, parentIndex) pairs in which every parent
+    precedes its children. The root handle has a parentIndex of -1.
+    """
+    records = []
+    stack = [(rootGuide.handleAtIndex(0), -1)]
+    while stack:
+        handle, parentIndex = stack.pop()
+        index = len(records)
+        records.append((handle, parentIndex))
+        for child in handle.children():
+            stack.append((child, index))
+    return records
+
+def handleJointMatrix(handle):
+    """Returns the jointMatrix of the given Handle as an MMatrix."""
+    node = lib.api.toMObject(handle.node)
+    return lib.api.getMatrix(lib.api.findPlug(node, "jointMatrix"))
+
+def buildSkeleton(rootGuide, update=False, tracker=None):
+    """Build a joint hierarchy from the handles of the root guide and its descendants.
+
+    If update is True and a skeleton was previously built from this guide,
+    it is updated in place with updateSkeleton instead. The tracker, if
+    given, is passed on to it, and starts tracking a newly built skeleton.
+
+    Returns the list of created or updated joints, root first.
+    """
+    records = collectHandleTree(rootGuide)
+    handleIDs = _checkHandleIDs(records)
+    if update:
+        rootPath = _rootJoint(handleIDs[0], tracker)
+        if rootPath is not None:
+            joints = _updateSkeleton(records, handleIDs, rootPath, tracker)[3]
+            paths = [OpenMaya.MFnDagNode(joints[forgeID]).fullPathName() for forgeID in handleIDs]
+            return map(pm.PyNode, paths)
+    worldMatrices = [handleJointMatrix(handle) for handle, _ in records]
+
+    with lib.modifier.undoChunk("boneforgeBuildSkeleton"):
+        dagModifier = OpenMaya.MDagModifier()
+        joints = []
+        for handle, parentIndex in records:
+            if parentIndex == -1:
+                parent = OpenMaya.MObject.kNullObj
+            else:
+                parent = joints[parentIndex]
+            joints.append(_createJoint(dagModifier, handle.name, parent))
+        lib.modifier.doIt(dagModifier)
+
+        dgModifier = OpenMaya.MDGModifier()
+        for i, (handle, parentIndex) in enumerate(records):
+            parent, parentMatrix = None, None
+            if parentIndex != -1:
+                parent = joints[parentIndex]
+                parentMatrix = worldMatrices[parentIndex]
+            translate, jointOrient = jointLocalValues(worldMatrices[i], parentMatrix)
+            _initJoint(dgModifier, joints[i], parent, handle.forgeID)
+            _setJointValues(dgModifier, joints[i], translate, jointOrient, handle.rotateOrder)
+        lib.modifier.doIt(dgModifier)
+
+        paths = [OpenMaya.MFnDagNode(jnt).fullPathName() for jnt in joints]
+        skeleton = map(pm.PyNode, paths)
+        pm.select(skeleton[0])
+    if tracker is not None:
+        tracker.track(records, lib.api.toDagPath(paths[0]))
+    return skeleton
+
+def updateSkeleton(rootGuide, records=None, tracker=None):
+    """Update the skeleton built from the root guide to match its handles.
+
+    Joints are matched to handles by forgeID. Only joints whose handle was added,
+    removed, moved, reparented or renamed are edited; all other joints, and
+    anything bound to them, are left untouched.
+
+    Only the joints below the skeleton's root joint are considered. With a
+    tracker that tracks the skeleton, the values of joints are compared only
+    for handles it recorded as changed, so joints edited by hand, or by
+    undoing an update, are left as they are. The tracker then tracks the updated skeleton.
+
+    Returns a tuple of (added, removed, changed) forgeID lists.
+    """
+    if records is None:
+        records = collectHandleTree(rootGuide)
+    handleIDs = _checkHandleIDs(records)
+    return _updateSkeleton(records, handleIDs, _rootJoint(handleIDs[0], tracker), tracker)[:3]
+
+def _updateSkeleton(records, handleIDs, rootPath, tracker):
+    """Update the skeleton below rootPath, returning (added, removed, changed, joints).
+
+    joints is a dictionary of forgeID to the MObject of every joint of the
+    updated skeleton.
+    """
+    existing, removed = {}, []
+    if rootPath is not None:
+        validIDs = set(handleIDs)
+        for forgeID, path in jointsByForgeID(root=rootPath).items():
+            if forgeID in validIDs:
+                existing[forgeID] = path
+            else:
+                removed.append((forgeID, path))
+    dirtyIDs = tracker.dirtyIDs(handleIDs) if tracker is not None else None
+    worldMatrices = {}
+
+    def worldMatrix(i):
+        if i not in worldMatrices:
+            worldMatrices[i] = handleJointMatrix(records[i][0])
+        return worldMatrices[i]
+
+    def localValues(i):
+        parentIndex = records[i][1]
+        if parentIndex == -1:
+            path = existing.get(handleIDs[i])
+            parentMatrix = path.exclusiveMatrix() if path is not None else None
+            return jointLocalValues(worldMatrix(i), parentMatrix)
+        parentPath = existing.get(handleIDs[parentIndex])
+        parentScale = None
+        if parentPath is not None:
+            parentScale = _plugValues(OpenMaya.MFnDependencyNode(parentPath.node()), "scale")
+        return jointLocalValues(worldMatrix(i), worldMatrix(parentIndex), parentScale)
+
+    added, changed, reparented, renamed = [], [], [], []
+    for i, (handle, parentIndex) in enumerate(records):
+        forgeID = handleIDs[i]
+        path = existing.get(forgeID)
+        if path is None:
+            added.append(i)
+            continue
+        if OpenMaya.MFnDagNode(path).name() != handle.name:
+            renamed.append(i)
+        parentID = handleIDs[parentIndex] if parentIndex != -1 else None
+        if _parentForgeID(path) != parentID:
+            reparented.append(i)
+            changed.append(i)
+            continue
+        # A joint's local values depend on its own and its parent's handle
+        if dirtyIDs is not None and forgeID not in dirtyIDs and parentID not in dirtyIDs:
+            continue
+        translate, jointOrient = localValues(i)
+        if not _jointValuesMatch(path.node(), translate, jointOrient, handle.rotateOrder):
+            changed.append(i)
+
+    joints = dict((forgeID, path.node()) for forgeID, path in existing.items())
+    if not (added or removed or changed or renamed):
+        if tracker is not None:
+            tracker.track(records, rootPath)
+        return [], [], [], joints
+
+    with lib.modifier.undoChunk("boneforgeUpdateSkeleton"):
+        dagModifier = OpenMaya.MDagModifier()
+        for i in added:
+            handle, parentIndex = records[i]
+            if parentIndex == -1:
+                parent = OpenMaya.MObject.kNullObj
+            else:
+                parent = joints[handleIDs[parentIndex]]
+            joints[handleIDs[i]] = _createJoint(dagModifier, handle.name, parent)
+        for i in reparented:
+            parentIndex = records[i][1]
+            if parentIndex == -1:
+                parent = OpenMaya.MObject.kNullObj
+            else:
+                parent = joints[handleIDs[parentIndex]]
+            dagModifier.reparentNode(joints[handleIDs[i]], parent)
+        for i in renamed:
+            dagModifier.renameNode(joints[handleIDs[i]], records[i][0].name)
+        # Children that survive have been reparented above, so only the
+        # topmost removed joints need deleting
+        removedObjects = set(OpenMaya.MObjectHandle(path.node()).hashCode() for _, path in removed)
+        for _, path in removed:
+            parent = OpenMaya.MFnDagNode(path).parent(0)
+            if OpenMaya.MObjectHandle(parent).hashCode() not in removedObjects:
+                dagModifier.deleteNode(path.node())
+        lib.modifier.doIt(dagModifier)
+
+        dgModifier = OpenMaya.MDGModifier()
+        for i in added:
+            parentIndex = records[i][1]
+            parent = joints[handleIDs[parentIndex]] if parentIndex != -1 else None
+            _initJoint(dgModifier, joints[handleIDs[i]], parent, handleIDs[i])
+        for i in reparented:
+            parentIndex = records[i][1]
+            parent = joints[handleIDs[parentIndex]] if parentIndex != -1 else None
+            _connectInverseScale(dgModifier, joints[handleIDs[i]], parent)
+        for i in added + changed:
+            translate, jointOrient = localValues(i)
+            _setJointValues(dgModifier, joints[handleIDs[i]], translate, jointOrient,
+                            records[i][0].rotateOrder)
+        lib.modifier.doIt(dgModifier)
+
+    for forgeID, _ in removed:
+        joints.pop(forgeID, None)
+    if tracker is not None:
+        tracker.track(records, OpenMaya.MDagPath.getAPathTo(joints[handleIDs[0]]))
+    return ([handleIDs[i] for i in added],
+            [forgeID for forgeID, _ in removed],
+            [handleIDs[i] for i in sorted(set(changed + renamed))],
+            joints)
+
+def jointsByForgeID(forgeIDs=None, root=None):
+    """Returns a dictionary of forgeID to MDagPath for joints built by BoneForge.
+
+    If forgeIDs is given, only joints tagged with those IDs are returned. If
+    root is given, as an MDagPath, only it and the joints below it are
+    searched, otherwise every joint in the scene is.
+
+    Joints sharing a forgeID, as left by duplicating part of a skeleton, are
+    reported with a warning and only the first one found is returned.
+    """
+    if forgeIDs is not None:
+        forgeIDs = set(forgeIDs)
+    joints = {}
+    duplicates = []
+    for forgeID, path in _taggedJoints(root):
+        if forgeIDs is not None and forgeID not in forgeIDs:
+            continue
+        if forgeID in joints:
+            duplicates.append(path.fullPathName())
+        else:
+            joints[forgeID] = path
+    if duplicates:
+        OpenMaya.MGlobal.displayWarning(
+            "Ignoring joints with the forgeID of another joint: {}".format(", ".join(duplicates)))
+    return joints
+
+def _taggedJoints(root=None):
+    """Yield (forgeID, MDagPath) pairs of the tagged joints below root, or in the scene."""
+    if root is None:
+        names = cmds.ls("*.{}".format(FORGE_ID_ATTR), type="joint", objectsOnly=True,
+                        long=True, recursive=True) or []
+        for name in names:
+            path = lib.api.toDagPath(name)
+            yield lib.api.findPlug(path.node(), FORGE_ID_ATTR).asString(), path
+        return
+    dagIter = OpenMaya.MItDag(OpenMaya.MItDag.kDepthFirst, OpenMaya.MFn.kJoint)
+    dagIter.reset(root)
+    while not dagIter.isDone():
+        path = dagIter.getPath()
+        nodeFn = OpenMaya.MFnDependencyNode(path.node())
+        if nodeFn.hasAttribute(FORGE_ID_ATTR):
+            yield nodeFn.findPlug(FORGE_ID_ATTR, False).asString(), path
+        dagIter.next()
+
+def _checkHandleIDs(records):
+    """Returns the forgeIDs of the handle records, raising if any are shared."""
+    handleIDs = [handle.forgeID for handle, _ in records]
+    if len(set(handleIDs)) != len(handleIDs):
+        seen, shared = set(), []
+        for handle, _ in records:
+            if handle.forgeID in seen:
+                shared.append(handle.name)
+            seen.add(handle.forgeID)
+        raise RuntimeError("Handles {} share their forgeID with another handle".format(", ".join(shared)))
+    return handleIDs
+
+def _rootJoint(forgeID, tracker=None):
+    """Returns the MDagPath of the joint built from the root handle, or None."""
+    if tracker is not None:
+        path = tracker.rootJoint(forgeID)
+        if path is not None:
+            return path
+    return jointsByForgeID([forgeID]).get(forgeID)
+
+class HandleTracker(object):
+    """Tracks the handles of built skeletons between skeleton updates.
+
+    Records the forgeIDs of the handles dirtied since they were last tracked
+    and the root joint of each skeleton. Call clear to stop tracking.
+    """
+    def __init__(self):
+        # forgeID: node dirty callback ID of the handle
+        self._callbackIDs = {}
+        # Root handle forgeID: (MObjectHandle of the root joint, forgeIDs of its handles)
+        self._skeletons = {}
+        self._dirtyIDs = set()
+
+    def track(self, records, rootPath):
+        """Track the handle records of a skeleton built or updated at rootPath."""
+        handleIDs = set()
+        for handle, _ in records:
+            forgeID = handle.forgeID
+            handleIDs.add(forgeID)
+            self._dirtyIDs.discard(forgeID)
+            if forgeID not in self._callbackIDs:
+                node = lib.api.toMObject(handle.node)
+                self._callbackIDs[forgeID] = OpenMaya.MNodeMessage.addNodeDirtyPlugCallback(
+                    node, self._onDirtyPlug, forgeID)
+        rootID = records[0][0].forgeID
+        previous = self._skeletons.get(rootID)
+        if previous is not None:
+            for forgeID in previous[1] - handleIDs:
+                self._untrack(forgeID)
+        self._skeletons[rootID] = (OpenMaya.MObjectHandle(rootPath.node()), handleIDs)
+
+    def dirtyIDs(self, handleIDs):
+        """Returns the dirty forgeIDs among handleIDs, or None if any of them is not tracked."""
+        if not all(forgeID in self._callbackIDs for forgeID in handleIDs):
+            return None
+        return self._dirtyIDs.intersection(handleIDs)
+
+    def rootJoint(self, forgeID):
+        """Returns the MDagPath of the tracked root joint of the root handle, or None."""
+        skeleton = self._skeletons.get(forgeID)
+        if skeleton is None or not skeleton[0].isValid():
+            return None
+        return OpenMaya.MDagPath.getAPathTo(skeleton[0].object())
+
+    def clear(self):
+        """Stop tracking all handles."""
+        if self._callbackIDs:
+            OpenMaya.MMessage.removeCallbacks(self._callbackIDs.values())
+        self._callbackIDs = {}
+        self._skeletons = {}
+        self._dirtyIDs = set()
+
+    def _untrack(self, forgeID):
+        callbackID = self._callbackIDs.pop(forgeID, None)
+        if callbackID is not None:
+            OpenMaya.MMessage.removeCallback(callbackID)
+        self._dirtyIDs.discard(forgeID)
+
+    def _onDirtyPlug(self, node, plug, forgeID):
+        self._dirtyIDs.add(forgeID)
+
+def _parentForgeID(path):
+    """Returns the forgeID tagged on the parent of the given joint, or None."""
+    parent = OpenMaya.MFnDagNode(path).parent(0)
+    nodeFn = OpenMaya.MFnDependencyNode(parent)
+    if parent.hasFn(OpenMaya.MFn.kJoint) and nodeFn.hasAttribute(FORGE_ID_ATTR):
+        return nodeFn.findPlug(FORGE_ID_ATTR, False).asString()
+    return None
+
+def _createJoint(modifier, name, parent):
+    """Queue the creation of a named joint tagged with a forgeID attribute."""
+    joint = modifier.createNode("joint", parent)
+    modifier.renameNode(joint, name)
+    attr = OpenMaya.MFnTypedAttribute().create(FORGE_ID_ATTR, "fid", OpenMaya.MFnData.kString)
+    modifier.addAttribute(joint, attr)
+    return joint
+
+def _initJoint(modifier, joint, parent, forgeID):
+    """Queue the forgeID tag and inverse scale connection of a newly created joint."""
+    modifier.newPlugValueString(lib.api.findPlug(joint, FORGE_ID_ATTR), forgeID)
+    _connectInverseScale(modifier, joint, parent)
+
+def _connectInverseScale(modifier, joint, parent):
+    """Queue connecting the parent joint's scale to the joint's inverseScale."""
+    inverseScale = lib.api.findPlug(joint, "inverseScale")
+    for source in inverseScale.connectedTo(True, False):
+        modifier.disconnect(source, inverseScale)
+    if parent is not None and parent.hasFn(OpenMaya.MFn.kJoint):
+        modifier.connect(lib.api.findPlug(parent, "scale"), inverseScale)
+
+def jointLocalValues(worldMatrix, parentMatrix=None, parentScale=None):
+    """Returns the (translate, jointOrient) values placing a joint at worldMatrix.
+
+    The joint is assumed to have zero rotation, so its orientation is carried
+    entirely by jointOrient. parentMatrix is the world matrix of the parent
+    joint before scaling and parentScale the parent's scale, which inverseScale
+    removes from the joint's rotation but not from its translation.
+    """
+    if parentMatrix is None:
+        transformation = OpenMaya.MTransformationMatrix(worldMatrix)
+        return transformation.translation(OpenMaya.MSpace.kTransform), transformation.rotation()
+    jointOrient = OpenMaya.MTransformationMatrix(worldMatrix * parentMatrix.inverse()).rotation()
+    if parentScale is not None:
+        scaled = OpenMaya.MTransformationMatrix()
+        scaled.setScale(parentScale, OpenMaya.MSpace.kTransform)
+        parentMatrix = scaled.asMatrix() * parentMatrix
+    local = OpenMaya.MTransformationMatrix(worldMatrix * parentMatrix.inverse())
+    return local.translation(OpenMaya.MSpace.kTransform), jointOrient
+
+def _plugValues(nodeFn, name):
+    """Returns the X, Y and Z child values of a compound double plug."""
+    return [nodeFn.findPlug(name + axis, False).asDouble() for axis in "XYZ"]
+
+def _jointValuesMatch(joint, translate, jointOrient, rotateOrder):
+    """Returns True if the joint already holds the given local values."""
+    nodeFn = OpenMaya.MFnDependencyNode(joint)
+    if nodeFn.findPlug("rotateOrder", False).asInt() != rotateOrder:
+        return False
+    expected = (("translate", (translate.x, translate.y, translate.z)),
+                ("jointOrient", (jointOrient.x, jointOrient.y, jointOrient.z)),
+                ("rotate", (0.0, 0.0, 0.0)))
+    for name, values in expected:
+        for current, value in zip(_plugValues(nodeFn, name), values):
+            if abs(current - value) > VALUE_TOLERANCE:
+                return False
+    return True
+
+def _setJointValues(modifier, joint, translate, jointOrient, rotateOrder):
+    """Queue the final translate, jointOrient, rotate and rotateOrder values of a joint."""
+    nodeFn = OpenMaya.MFnDependencyNode(joint)
+    modifier.newPlugValueInt(nodeFn.findPlug("rotateOrder", False), rotateOrder)
+    for axis, value in zip("XYZ", (translate.x, translate.y, translate.z)):
+        modifier.newPlugValueDouble(nodeFn.findPlug("translate" + axis, False), value)
+    for axis, value in zip("XYZ", (jointOrient.x, jointOrient.y, jointOrient.z)):
+        modifier.newPlugValueDouble(nodeFn.findPlug("jointOrient" + axis, False), value)
+    for axis in "XYZ":
+        modifier.newPlugValueDouble(nodeFn.findPlug("rotate" + axis, False), 0.0)
@@ -0,0 +1,146 @@
+"""my.skeleton.boneforge.solver
+
+Vectorized NumPy solver for handle joint matrices.
+
+Solves the same aim/up frames as GuideHandle.computeJointMatrix in the plugin,
+but for every handle at once and without evaluating the DG. Matrices use
+Maya's row-vector layout: rows 0-2 hold the X, Y and Z axes, row 3 the position.
+"""
+import numpy
+
+
+def solveJointMatrices(positions, parentIndices, orientTargetIndices,
+                       aimAxes, upAxes, aimVectors, upVectors, useGuideAim=False):
+    """Returns an (N, 4, 4) array of joint matrices for N handles.
+
+    positions: (N, 3) world space handle positions.
+    parentIndices, orientTargetIndices: (N,) indices into positions, -1 for none.
+    aimAxes, upAxes: (N,) or scalar axis enum values (0-5 for x, y, z, -x, -y, -z).
+    aimVectors, upVectors: (N, 3) or (3,) guide aim and up vectors.
+    useGuideAim: (N,) or scalar flags forcing the guide aim vector.
+    """
+    positions = numpy.asarray(positions, dtype=numpy.float64).reshape(-1, 3)
+    count = len(positions)
+    parentIndices = numpy.asarray(parentIndices, dtype=numpy.intp).reshape(count)
+    orientTargetIndices = numpy.asarray(orientTargetIndices, dtype=numpy.intp).reshape(count)
+    aimAxes = numpy.broadcast_to(numpy.asarray(aimAxes, dtype=numpy.intp), (count,))
+    upAxes = numpy.broadcast_to(numpy.asarray(upAxes, dtype=numpy.intp), (count,))
+    aimVectors = numpy.broadcast_to(numpy.asarray(aimVectors, dtype=numpy.float64), (count, 3))
+    upVectors = numpy.broadcast_to(numpy.asarray(upVectors, dtype=numpy.float64), (count, 3))
+    useGuideAim = numpy.broadcast_to(numpy.asarray(useGuideAim, dtype=bool), (count,))
+
+    hasParent = parentIndices >= 0
+    hasOrientTarget = orientTargetIndices >= 0
+
+    # Aim selection mirrors the branches of GuideHandle.computeJointMatrix
+    aim = numpy.array(aimVectors)
+    fromParent = ~useGuideAim & hasParent & ~hasOrientTarget
+    toTarget = ~useGuideAim & hasOrientTarget
+    aim[fromParent] = normalize(
+        positions[fromParent] - positions[parentIndices[fromParent]])
+    aim[toTarget] = normalize(
+        positions[orientTargetIndices[toTarget]] - positions[toTarget])
+
+    return buildAimMatrices(aim, upVectors, aimAxes, upAxes, positions)
+
+def buildAimMatrices(aimVectors, upVectors, aimAxes, upAxes, positions):
+    """Vectorized equivalent of GuideHandle.buildAimMatrix."""
+    count = len(positions)
+    rows = numpy.arange(count)
+    absAimAxes = aimAxes % 3
+    absUpAxes = upAxes % 3
+    aimSign = numpy.where(aimAxes < 3, 1.0, -1.0)[:, None]
+    upSign = numpy.where(upAxes < 3, 1.0, -1.0)[:, None]
+
+    axes = numpy.zeros((count, 3, 3))
+    axes[rows, absAimAxes] = aimVectors * aimSign
+    axes[rows, absUpAxes] = upVectors * upSign
+
+    # X^Y=Z, Y^Z=X, Z^X=Y
+    missingAxes = 3 - absAimAxes - absUpAxes
+    axes[rows, missingAxes] = numpy.cross(axes[rows, (missingAxes - 2) % 3],
+                                          axes[rows, (missingAxes - 1) % 3])
+    # Orthogonalize by recomputing the up axis
+    axes[rows, absUpAxes] = numpy.cross(axes[rows, (absUpAxes - 2) % 3],
+                                        axes[rows, (absUpAxes - 1) % 3])
+
+    matrices = numpy.zeros((count, 4, 4))
+    matrices[:, :3, :3] = normalize(axes)
+    matrices[:, 3, :3] = positions
+    matrices[:, 3, 3] = 1.0
+    return matrices
+
+def normalize(vectors):
+    """Normalize vectors along the last axis, leaving zero length vectors untouched."""
+    vectors = numpy.asarray(vectors, dtype=numpy.float64)
+    lengths = numpy.linalg.norm(vectors, axis=-1)[..., None]
+    return numpy.divide(vectors, lengths, out=numpy.zeros_like(vectors), where=lengths > 0)
+
+def matrixToArray(matrix):
+    """Returns a (4, 4) array from an MMatrix."""
+    return numpy.array([[matrix.getElement(r, c) for c in range(4)] for r in range(4)])
+
+def solverInputsFromHandles(handles):
+    """Gather solveJointMatrices keyword arguments from the given Handles.
+
+    Parent and orient target handles outside of the given list are treated as missing,
+    so the list should contain every handle whose matrix is required.
+    """
+    import maya.api.OpenMaya as OpenMaya
+    import lib.api
+
+    nodes = [lib.api.toMObject(handle.node) for handle in handles]
+    indexOf = dict((OpenMaya.MObjectHandle(node).hashCode(), i) for i, node in enumerate(nodes))
+
+    def connectedIndex(plug):
+        sources = plug.connectedTo(True, False)
+        if not sources:
+            return -1
+        return indexOf.get(OpenMaya.MObjectHandle(sources[0].node()).hashCode(), -1)
+
+    count = len(nodes)
+    inputs = {
+        "positions": numpy.zeros((count, 3)),
+        "parentIndices": numpy.full(count, -1, dtype=numpy.intp),
+        "orientTargetIndices": numpy.full(count, -1, dtype=numpy.intp),
+        "aimAxes": numpy.zeros(count, dtype=numpy.intp),
+        "upAxes": numpy.zeros(count, dtype=numpy.intp),
+        "aimVectors": numpy.zeros((count, 3)),
+        "upVectors": numpy.zeros((count, 3)),
+        "useGuideAim": numpy.zeros(count, dtype=bool),
+    }
+    for i, node in enumerate(nodes):
+        nodeFn = OpenMaya.MFnDependencyNode(node)
+        handleMatrix = lib.api.getMatrix(nodeFn.findPlug("handleMatrix", False))
+        inputs["positions"][i] = matrixToArray(handleMatrix)[3, :3]
+        if nodeFn.findPlug("parentHandleMatrix", False).isConnected:
+            inputs["parentIndices"][i] = connectedIndex(nodeFn.findPlug("parentHandle", False))
+        inputs["orientTargetIndices"][i] = connectedIndex(nodeFn.findPlug("orientTarget", False))
+        inputs["aimAxes"][i] = nodeFn.findPlug("aimAxis", False).asShort()
+        inputs["upAxes"][i] = nodeFn.findPlug("upAxis", False).asShort()
+        for name in ("aimVector", "upVector"):
+            plug = nodeFn.findPlug(name, False)
+            inputs[name + "s"][i] = [plug.child(c).asDouble() for c in range(3)]
+        inputs["useGuideAim"][i] = nodeFn.findPlug("useGuideAim", False).asBool()
+    return inputs
+
+def solveHandles(handles):
+    """Returns an (N, 4, 4) array of joint matrices for the given Handles."""
+    return solveJointMatrices(**solverInputsFromHandles(handles))
+
+def compareWithScene(handles, tolerance=1e-6):
+    """Check solver parity against the jointMatrix computed by each handle node.
+
+    Returns a list of (handle, maxDifference) pairs for handles that differ by
+    more than the given tolerance.
+    """
+    import skeleton
+
+    solved = solveHandles(handles)
+    mismatches = []
+    for handle, matrix in zip(handles, solved):
+        sceneMatrix = matrixToArray(skeleton.handleJointMatrix(handle))
+        difference = numpy.abs(sceneMatrix - matrix).max()
+        if difference > tolerance:
+            mismatches.append((handle, difference))
+    return mismatches
@@ -0,0 +1,134 @@
+"""my.skeleton.boneforge.streamimport
+
+Template import that keeps Maya interactive.
+
+A TemplateStream parses the file in a worker thread, while the guides are
+built on Maya's main thread in small batches through maya.utils.executeDeferred.
+Between batches Maya processes its event queue, so the viewport and UI stay
+responsive and the import can be cancelled. While the worker has no records
+ready, each step waits up to template.STREAM_POLL_INTERVAL for one:
+
+    job = StreamingImport(path, progress=lambda job: statusBar(job.guideCount))
+    job.start()
+    ...
+    job.cancel()
+
+Each batch is built by guidebuild.buildGuides and is its own undo step. Guides
+whose parent guide has not been built yet wait until it has, so the template
+does not have to list parents first.
+"""
+import maya.utils
+
+from . import core
+import guidebuild
+import template
+
+DEFAULT_BATCH_SIZE = 25
+
+
+class StreamingImport(object):
+    """Build the guides of a template file in batches, on Maya's idle queue.
+
+    progress is called with this job after every batch, and finished once the
+    import ends, whether it completed, failed or was cancelled. After it ends,
+    error holds the exception that stopped it, if any.
+    """
+
+    def __init__(self, path, batchSize=DEFAULT_BATCH_SIZE, progress=None, finished=None):
+        self.path = path
+        self.batchSize = batchSize
+        self.progress = progress
+        self.finished = finished
+        self.guides = []
+        self.idMap = {}
+        self.timings = {}
+        self.error = None
+        self._stream = None
+        self._builtGuides = {}
+        # Records waiting for their parent guide to be built, by parent forgeID
+        self._waiting = {}
+        self._running = False
+        self._cancelled = False
+
+    @property
+    def guideCount(self):
+        return len(self.guides)
+
+    def isRunning(self):
+        return self._running
+
+    def isCancelled(self):
+        return self._cancelled
+
+    def start(self):
+        """Start parsing the file and schedule the first batch. Returns this job."""
+        if self._running:
+            return self
+        if core.LOAD_PLUGIN:
+            core.ensurePlugin()
+        self._stream = template.TemplateStream(self.path).start()
+        self._running = True
+        maya.utils.executeDeferred(self._step)
+        return self
+
+    def cancel(self):
+        """Stop the import after the current batch. Guides already built are kept."""
+        self._cancelled = True
+        if self._stream is not None:
+            self._stream.cancel()
+
+    def _step(self):
+        if not self._running:
+            return
+        if self._cancelled:
+            self._finish()
+            return
+        try:
+            # While the worker has nothing ready, wait for it here rather than
+            # rescheduling at once, which would keep Maya's idle queue busy
+            records = self._stream.poll(self.batchSize, timeout=template.STREAM_POLL_INTERVAL)
+            batch = self._readyRecords(records)
+            if self._stream.isFinished():
+                # Parents never found in the file, build the waiting guides unparented
+                for waiting in self._waiting.values():
+                    batch.extend(waiting)
+                self._waiting.clear()
+            if batch:
+                guides, idMap = guidebuild.buildGuides(batch, self.timings, self._builtGuides)
+                self.guides.extend(guides)
+                self.idMap.update(idMap)
+                if self.progress is not None:
+                    self.progress(self)
+        except Exception as e:
+            self.error = e
+            self._stream.cancel()
+            self._finish()
+            raise
+        if self._stream.isFinished():
+            self._finish()
+        else:
+            maya.utils.executeDeferred(self._step)
+
+    def _readyRecords(self, records):
+        """Returns the records whose parent guide is built or in the same batch.
+
+        Other records wait for their parent, and are released along with it.
+        """
+        ready = []
+        pending = list(records)
+        inBatch = set()
+        while pending:
+            data = pending.pop()
+            parentID = data["parentGuideID"]
+            if parentID and parentID not in self._builtGuides and parentID not in inBatch:
+                self._waiting.setdefault(parentID, []).append(data)
+                continue
+            ready.append(data)
+            inBatch.add(data["forgeID"])
+            pending.extend(self._waiting.pop(data["forgeID"], []))
+        return ready
+
+    def _finish(self):
+        self._running = False
+        if self.finished is not None:
+            self.finished(self)
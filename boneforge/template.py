@@ -0,0 +1,465 @@
+"""my.skeleton.boneforge.template
+
+Guide template export and import.
+
+A template stores a whole guide graph: every guide's getGuideData dictionary,
+ordered so that parent guides come before their children. The file is compact
+JSON:
+
+    {"format": "boneforgeTemplate", "version": 2, "guides": [...]}
+
+Version 2 added the limb layout keys of getGuideData. Version 1 files are
+still read, and their limbs get the default layout, see limbLayout.
+
+Per handle float arrays (FLOAT_ARRAY_KEYS) are not written as JSON numbers.
+They are packed as little endian float64 and base64 encoded:
+
+    "handleTranslations": {"f8": "AAAAAAAA8D8..."}
+
+Reading and writing template files does not import Maya, so farm scripts can
+parse templates cheaply. Building guides from a template uses boneforge.core.
+Large files can be read record by record with iterTemplate, or parsed in a
+worker thread with TemplateStream, see streamimport. readTemplate also reads
+the binary format of templatebinary.
+
+    template.exportTemplate("/path/biped.bft")
+    timings = {}
+    guides, idMap = template.importTemplate("/path/biped.bft", timings)
+"""
+import array
+import base64
+import json
+import Queue
+import re
+import sys
+import threading
+import time
+
+import templatebinary
+
+FORMAT_NAME = "boneforgeTemplate"
+FORMAT_VERSION = 2
+SUPPORTED_VERSIONS = (1, 2)
+TEXT_EXTENSION = ".bft"
+FLOAT_ARRAY_KEYS = ("handleTranslations", "handleRotations", "handleRadii")
+STREAM_BLOCK_SIZE = 1 << 16
+STREAM_MAX_QUEUED = 256
+STREAM_POLL_INTERVAL = 0.05
+# guideNodeTypes of spine and limb guides, defined here so guide data can be
+# made and read without Maya
+SPINE_NODE_TYPE = "skeletonGuideSpine"
+LIMB_NODE_TYPE = "skeletonGuideLimb"
+RECORD_KEYS = ("guideNodeType", "forgeID", "name", "parentGuideID", "parentGuideHandleIndex",
+               "translation", "rotation", "scale", "handleCount", "handleForgeIDs", "handleNames",
+               "handleRotateOrders") + FLOAT_ARRAY_KEYS
+
+_DECODER = json.JSONDecoder()
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_RECORD, _ERROR, _END = range(3)
+
+def limbLayout(data):
+    """Returns the (base, hinge, end, orientGroupIndices) of a limb's getGuideData dictionary.
+
+    base, hinge and end are handle indices, -1 for a role that is unset or,
+    for the end, taken by the base handle of the child guide. Data written
+    before the layout was recorded gets the layout of a limb built by create
+    and insertHandles: base 0, hinge 1, end last and the handles between
+    hinge and end in the orient group.
+    """
+    count = data["handleCount"]
+    indices = data.get("limbHandleIndices")
+    if indices is None:
+        return 0, (1 if count > 2 else -1), count - 1, set(xrange(2, count - 1))
+    base, hinge, end = indices
+    return base, hinge, end, set(i for i, grouped in enumerate(data["handleInOrientGroup"]) if grouped)
+
+def orientGroupIndices(data):
+    """Returns the indices of the handles parented to a limb's orient group, see limbLayout.
+
+    Returns an empty set for other guide types.
+    """
+    if data["guideNodeType"] != LIMB_NODE_TYPE:
+        return set()
+    return limbLayout(data)[3]
+
+def encodeFloats(values):
+    """Returns the base64 text of the values packed as little endian float64."""
+    packed = array.array("d", values)
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return base64.b64encode(packed.tostring())
+
+def decodeFloats(text):
+    """Returns an array of floats from encodeFloats text."""
+    packed = array.array("d")
+    packed.fromstring(base64.b64decode(text))
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return packed
+
+def encodeTemplate(guideData):
+    """Returns the template text of the given list of getGuideData dictionaries.
+
+    The format and version are written before the guides, so streaming readers
+    can validate a file before reading its guides.
+    """
+    records = []
+    for data in guideData:
+        record = dict(data)
+        for key in FLOAT_ARRAY_KEYS:
+            record[key] = {"f8": encodeFloats(record[key])}
+        records.append(json.dumps(record, separators=(",", ":")))
+    return '{{"format":{},"version":{},"guides":[{}]}}'.format(
+        json.dumps(FORMAT_NAME), FORMAT_VERSION, ",".join(records))
+
+def decodeTemplate(text):
+    """Returns the list of guide data dictionaries of the template text.
+
+    Raises ValueError if the text is not a template of a supported version.
+    """
+    template = json.loads(text)
+    if not isinstance(template, dict):
+        raise ValueError("Not a BoneForge template")
+    _checkHeader(template)
+    return [_decodeRecord(record) for record in template["guides"]]
+
+def _checkHeader(header, partial=False):
+    """Raise ValueError if the header values are not those of a supported template.
+
+    If partial is True, missing values are not an error.
+    """
+    if partial:
+        defaults = {"format": FORMAT_NAME, "version": FORMAT_VERSION}
+        defaults.update(header)
+        header = defaults
+    if header.get("format") != FORMAT_NAME:
+        raise ValueError("Not a BoneForge template")
+    version = header.get("version")
+    if version not in SUPPORTED_VERSIONS:
+        raise ValueError("Unsupported BoneForge template version {!r}, expected one of {}".format(
+            version, SUPPORTED_VERSIONS))
+
+def _decodeRecord(record):
+    """Decode the float arrays of a guide record and check its handle values are complete."""
+    if not isinstance(record, dict):
+        raise ValueError("Invalid guide record {!r}".format(record))
+    missing = [key for key in RECORD_KEYS if key not in record]
+    if missing:
+        raise ValueError("Guide record {!r} is missing {}".format(record.get("name"), ", ".join(missing)))
+    for key in FLOAT_ARRAY_KEYS:
+        record[key] = decodeFloats(record[key]["f8"])
+    count = record["handleCount"]
+    expected = (("handleForgeIDs", count), ("handleNames", count), ("handleRotateOrders", count),
+                ("handleTranslations", count * 3), ("handleRotations", count * 3), ("handleRadii", count))
+    if "handleInOrientGroup" in record:
+        expected += (("handleInOrientGroup", count), ("limbHandleIndices", 3))
+    for key, length in expected:
+        if len(record[key]) != length:
+            raise ValueError("Guide record {!r} has {} {}, expected {}".format(
+                record["name"], len(record[key]), key, length))
+    for index in record.get("limbHandleIndices", ()):
+        if not -1 <= index < count:
+            raise ValueError("Guide record {!r} has limb handle index {} out of range".format(
+                record["name"], index))
+    return record
+
+def writeTemplate(path, guideData):
+    with open(path, "wb") as f:
+        f.write(encodeTemplate(guideData))
+
+def readTemplate(path):
+    """Returns the guide data dictionaries of a text or binary template file."""
+    if templatebinary.isBinaryTemplate(path):
+        return templatebinary.readBinaryTemplate(path)
+    with open(path, "rb") as f:
+        return decodeTemplate(f.read())
+
+def iterTemplate(path, blockSize=STREAM_BLOCK_SIZE):
+    """Yield the guide data dictionaries of a template file as they are parsed.
+
+    The file is read and parsed in blocks in the calling thread, so memory use
+    does not grow with the file size. Raises ValueError as soon as the file is
+    found not to be a valid template. See TemplateStream to parse in a worker
+    thread.
+    """
+    with open(path, "rb") as f:
+        for record in _iterRecords(_StreamScanner(f, blockSize)):
+            yield record
+
+def _iterRecords(scanner):
+    """Yield the decoded guide records of the template object being scanned."""
+    header = {}
+    scanner.expect("{")
+    if scanner.peek() == "}":
+        scanner.expect("}")
+    else:
+        while True:
+            key = scanner.value()
+            scanner.expect(":")
+            if key == "guides":
+                _checkHeader(header, partial=True)
+                scanner.expect("[")
+                if scanner.peek() == "]":
+                    scanner.expect("]")
+                else:
+                    while True:
+                        yield _decodeRecord(scanner.value())
+                        if scanner.peek() != ",":
+                            scanner.expect("]")
+                            break
+                        scanner.expect(",")
+                header["guides"] = True
+            else:
+                header[key] = scanner.value()
+            if scanner.peek() != ",":
+                scanner.expect("}")
+                break
+            scanner.expect(",")
+    _checkHeader(header)
+    if "guides" not in header:
+        raise ValueError("BoneForge template has no guides")
+
+
+class _StreamScanner(object):
+    """Reads JSON values one at a time from a file, loading it in blocks."""
+
+    __slots__ = ("_file", "_blockSize", "_buffer", "_pos", "_eof")
+
+    def __init__(self, fileObj, blockSize):
+        self._file = fileObj
+        self._blockSize = blockSize
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self):
+        """Append the next block of the file to the buffer. Returns False at the end of the file."""
+        block = self._file.read(self._blockSize)
+        if not block:
+            self._eof = True
+            return False
+        self._buffer = self._buffer[self._pos:] + block
+        self._pos = 0
+        return True
+
+    def peek(self):
+        """Returns the next character that is not whitespace, or an empty string at the end of the file."""
+        while True:
+            self._pos = _WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer) or not self._fill():
+                return self._buffer[self._pos:self._pos + 1]
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError("Invalid BoneForge template, expected {!r} but found {!r}".format(
+                char, found or "end of file"))
+        self._pos += 1
+
+    def value(self):
+        """Returns the next JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self._buffer, self._pos)
+            except ValueError:
+                if self._eof:
+                    raise
+            else:
+                # A number at the end of the buffer may continue in the next block
+                if end < len(self._buffer) or self._eof:
+                    self._pos = end
+                    return value
+            self._fill()
+
+
+class TemplateStream(object):
+    """Parses and validates a template file in a worker thread.
+
+    Guide records are queued as soon as they are decoded, and can be taken
+    either by iterating, which blocks until the next record is ready, or
+    with poll(), which waits at most a given timeout:
+
+        stream = TemplateStream(path).start()
+        for data in stream:
+            ...
+
+    An error found by the worker is raised in the consuming thread. cancel()
+    stops the worker, and closing an iteration early cancels the stream.
+    """
+
+    def __init__(self, path, blockSize=STREAM_BLOCK_SIZE, maxQueued=STREAM_MAX_QUEUED):
+        self.path = path
+        self.blockSize = blockSize
+        self._queue = Queue.Queue(maxQueued)
+        self._cancelled = threading.Event()
+        self._thread = None
+        self._finished = False
+
+    def start(self):
+        """Start the worker thread and return this stream."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._parse, name="boneforgeTemplateStream")
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def cancel(self):
+        """Stop parsing. Records already queued are discarded."""
+        self._cancelled.set()
+        self._finished = True
+
+    def isCancelled(self):
+        return self._cancelled.is_set()
+
+    def isFinished(self):
+        """Returns True once every record has been taken, or the stream was cancelled."""
+        return self._finished
+
+    def _parse(self):
+        try:
+            with open(self.path, "rb") as f:
+                for record in _iterRecords(_StreamScanner(f, self.blockSize)):
+                    if not self._put((_RECORD, record)):
+                        return
+        except Exception as e:
+            self._put((_ERROR, e))
+        else:
+            self._put((_END, None))
+
+    def _put(self, item):
+        """Queue an item, waiting for space unless cancelled. Returns False if cancelled."""
+        while not self._cancelled.is_set():
+            try:
+                self._queue.put(item, timeout=STREAM_POLL_INTERVAL)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def _take(self, item):
+        """Returns the record of a queued item, or None at the end of the stream."""
+        kind, value = item
+        if kind == _RECORD:
+            return value
+        self._finished = True
+        if kind == _ERROR:
+            raise value
+        return None
+
+    def poll(self, maxCount=None, timeout=None):
+        """Returns the list of up to maxCount records that are ready.
+
+        If none are ready, waits up to timeout seconds for the first one, or
+        returns at once if timeout is None.
+        """
+        records = []
+        while not self._finished and (maxCount is None or len(records) < maxCount):
+            try:
+                if timeout is not None and not records:
+                    item = self._queue.get(timeout=timeout)
+                else:
+                    item = self._queue.get_nowait()
+            except Queue.Empty:
+                break
+            record = self._take(item)
+            if record is not None:
+                records.append(record)
+        return records
+
+    def __iter__(self):
+        self.start()
+        try:
+            while not self._finished:
+                try:
+                    item = self._queue.get(timeout=STREAM_POLL_INTERVAL)
+                except Queue.Empty:
+                    continue
+                record = self._take(item)
+                if record is not None:
+                    yield record
+        finally:
+            if not self._finished:
+                self.cancel()
+
+
+def sortGuideData(guideData):
+    """Returns the guide data ordered so that every guide follows its parent guide."""
+    byID = dict((data["forgeID"], data) for data in guideData)
+    ordered, visited = [], set()
+    for data in guideData:
+        chain = []
+        while data is not None and data["forgeID"] not in visited:
+            visited.add(data["forgeID"])
+            chain.append(data)
+            data = byID.get(data["parentGuideID"])
+        ordered.extend(reversed(chain))
+    return ordered
+
+def exportTemplate(path, guides=None, binary=False):
+    """Write the given Guides, or every guide in the scene, to a template file.
+
+    If binary is True, the file is written in the memory mappable format of
+    templatebinary.
+    """
+    from . import core
+
+    if guides is None:
+        guides = core.guidesFromScene()
+    guideData = sortGuideData([guide.getGuideData() for guide in guides])
+    if binary:
+        templatebinary.writeBinaryTemplate(path, guideData)
+    else:
+        writeTemplate(path, guideData)
+    return guideData
+
+def buildGuides(guideData, timings=None):
+    """Create guides from guide data dictionaries and restore their parenting.
+
+    Everything is created in one batch and one undo chunk, see
+    guidebuild.buildGuides. Returns a (guides, idMap) tuple, where idMap maps
+    the forgeIDs of the data to the forgeIDs of the new guides and handles.
+    """
+    from . import core
+    from . import guidebuild
+
+    if core.LOAD_PLUGIN:
+        core.ensurePlugin()
+    return guidebuild.buildGuides(guideData, timings)
+
+def buildGuidesSerially(guideData):
+    """Reference implementation of buildGuides, one fromGuideData and setParentGuide per guide."""
+    from . import core
+
+    idMap = {}
+    guidesByID = {}
+    guides = []
+    guideData = sortGuideData(guideData)
+    for data in guideData:
+        guide = core.Guide.fromGuideData(data, idMap)
+        guidesByID[data["forgeID"]] = guide
+        guides.append(guide)
+    for data in guideData:
+        parentGuide = guidesByID.get(data["parentGuideID"])
+        if parentGuide is not None:
+            guidesByID[data["forgeID"]].setParentGuide(parentGuide, data["parentGuideHandleIndex"])
+    for data in guideData:
+        guide = guidesByID[data["forgeID"]]
+        if data.get("useChildBaseAsEnd") and guide.childGuide() is not None:
+            guide.useChildBaseAsEnd = True
+    return guides, idMap
+
+def importTemplate(path, timings=None):
+    """Create the guides of a template file. See buildGuides.
+
+    If timings is given, it is filled with the seconds spent reading the file
+    and in each phase of the build.
+    """
+    start = time.time()
+    guideData = readTemplate(path)
+    readTime = time.time() - start
+    result = buildGuides(guideData, timings)
+    if timings is not None:
+        timings["read"] = readTime
+        timings["total"] = timings.get("total", 0.0) + readTime
+    return result
@@ -0,0 +1,408 @@
+"""my.skeleton.boneforge.templatebinary
+
+Memory mappable binary guide template format.
+
+The binary format stores the same guide data as the text template format of
+boneforge.template, laid out so that a reader can mmap the file and look up a
+single guide, or a handle count, without decoding the rest:
+
+    header          magic, version, counts and section offsets (HEADER)
+    guide table     one fixed size GUIDE_RECORD per guide
+    handle table    uint32 forgeID and name string indices, int32 rotate orders
+                    and int32 HANDLE_IN_ORIENT_GROUP flags
+    handle floats   float64 translations (3 per handle), rotations (3 per
+                    handle) and radii, each contiguous over every handle
+    string table    (offset, length) pairs followed by the UTF-8 string data
+
+All values are little endian and sections are 8 byte aligned. The handles of a
+guide are contiguous: a guide record holds the index of its first handle and
+its handle count.
+
+Version 2 added the limb layout: the base, hinge and end handle indices and
+GUIDE_* flags of the guide record, and the handle flags column. Version 1
+files are still read.
+
+    with BinaryTemplate(path) as tpl:
+        tpl.guideHandleCount(tpl.findGuide(forgeID))
+        positions = tpl.handleTranslations()    # (handles, 3) NumPy view
+
+NumPy is only imported by the view methods.
+"""
+import array
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+import lib.lazy
+
+numpy = lib.lazy.LazyModule("numpy")
+
+MAGIC = "BFTPLBIN"
+FORMAT_VERSION = 2
+SUPPORTED_VERSIONS = (1, 2)
+NO_STRING = 0xFFFFFFFF
+BINARY_EXTENSION = ".bfb"
+
+# magic, version, guideCount, handleCount, stringCount,
+# guideTableOffset, handleTableOffset, floatOffset, stringTableOffset
+HEADER = struct.Struct("<8sIIIIQQQQ")
+# nodeType, className, forgeID, name, parentGuideID string indices,
+# parentGuideHandleIndex, firstHandle, handleCount, provideAimVector,
+# translation, rotation, scale, handleColor,
+# limb base, hinge and end handle indices, GUIDE_* flags
+GUIDE_RECORD = struct.Struct("<IIIIIiIII3d3d3d3diiiI")
+GUIDE_RECORD_V1 = struct.Struct("<IIIIIiIII3d3d3d3d")
+# Guide record flags
+GUIDE_HAS_LIMB_LAYOUT = 1
+GUIDE_USE_CHILD_BASE_AS_END = 2
+# Handle flags
+HANDLE_IN_ORIENT_GROUP = 1
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+def _pad(data):
+    return data + "\0" * (_align(len(data)) - len(data))
+
+def _packArray(typecode, values):
+    packed = array.array(typecode, values)
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return packed.tostring()
+
+def _unpackArray(typecode, data):
+    unpacked = array.array(typecode)
+    unpacked.fromstring(data)
+    if sys.byteorder == "big":
+        unpacked.byteswap()
+    return unpacked
+
+
+class _StringTable(object):
+    """Collects unique strings and returns their indices."""
+
+    def __init__(self):
+        self.strings = []
+        self._indices = {}
+
+    def add(self, text):
+        if text is None:
+            return NO_STRING
+        if not isinstance(text, unicode):
+            text = text.decode("utf-8")
+        index = self._indices.get(text)
+        if index is None:
+            index = self._indices[text] = len(self.strings)
+            self.strings.append(text)
+        return index
+
+    def pack(self):
+        encoded = [text.encode("utf-8") for text in self.strings]
+        offsets = []
+        position = 0
+        for data in encoded:
+            offsets.extend((position, len(data)))
+            position += len(data)
+        return _pad(_packArray("I", offsets)) + "".join(encoded)
+
+
+def encodeBinaryTemplate(guideData):
+    """Returns the binary template data of the given list of getGuideData dictionaries."""
+    strings = _StringTable()
+    guideRecords = []
+    handleIDs, handleNames, rotateOrders, handleFlags = [], [], [], []
+    translations, rotations, radii = [], [], []
+    for data in guideData:
+        flags = 0
+        limbIndices = (-1, -1, -1)
+        groupFlags = [0] * data["handleCount"]
+        if "limbHandleIndices" in data:
+            flags |= GUIDE_HAS_LIMB_LAYOUT
+            limbIndices = tuple(data["limbHandleIndices"])
+            groupFlags = [HANDLE_IN_ORIENT_GROUP if grouped else 0 for grouped in data["handleInOrientGroup"]]
+        if data.get("useChildBaseAsEnd"):
+            flags |= GUIDE_USE_CHILD_BASE_AS_END
+        guideRecords.append(GUIDE_RECORD.pack(
+            strings.add(data["guideNodeType"]),
+            strings.add(data.get("className")),
+            strings.add(data["forgeID"]),
+            strings.add(data["name"]),
+            strings.add(data["parentGuideID"] or None),
+            data["parentGuideHandleIndex"],
+            len(handleIDs),
+            data["handleCount"],
+            bool(data.get("provideAimVector", False)),
+            *(tuple(data["translation"]) + tuple(data["rotation"]) + tuple(data["scale"])
+              + tuple(data.get("handleColor", (0.0, 0.0, 0.0))) + limbIndices + (flags,))))
+        handleFlags.extend(groupFlags)
+        handleIDs.extend(strings.add(forgeID) for forgeID in data["handleForgeIDs"])
+        handleNames.extend(strings.add(name) for name in data["handleNames"])
+        rotateOrders.extend(data["handleRotateOrders"])
+        translations.extend(data["handleTranslations"])
+        rotations.extend(data["handleRotations"])
+        radii.extend(data["handleRadii"])
+
+    guideTable = "".join(guideRecords)
+    handleTable = _pad(_packArray("I", handleIDs) + _packArray("I", handleNames) + _packArray("i", rotateOrders)
+                       + _packArray("i", handleFlags))
+    floats = _packArray("d", translations) + _packArray("d", rotations) + _packArray("d", radii)
+    stringTable = strings.pack()
+
+    guideTableOffset = _align(HEADER.size)
+    handleTableOffset = guideTableOffset + _align(len(guideTable))
+    floatOffset = handleTableOffset + len(handleTable)
+    stringTableOffset = floatOffset + len(floats)
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, len(guideRecords), len(handleIDs), len(strings.strings),
+                         guideTableOffset, handleTableOffset, floatOffset, stringTableOffset)
+    return "".join((_pad(header), _pad(guideTable), handleTable, floats, stringTable))
+
+def writeBinaryTemplate(path, guideData):
+    with open(path, "wb") as f:
+        f.write(encodeBinaryTemplate(guideData))
+
+def isBinaryTemplate(path):
+    """Returns True if the file starts with the binary template magic."""
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+def readBinaryTemplate(path):
+    """Returns the list of guide data dictionaries of a binary template file."""
+    with BinaryTemplate(path) as tpl:
+        return tpl.guideDataList()
+
+
+class BinaryTemplate(object):
+    """Read only, memory mapped view of a binary template file.
+
+    Guides are addressed by their index in the file. Nothing is decoded until
+    it is asked for, and strings are decoded one at a time. Raises ValueError
+    if the file is not a binary template, or its tables do not fit in it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._data) < HEADER.size:
+            self.close()
+            raise ValueError("Not a BoneForge binary template")
+        (magic, version, self.guideCount, self.handleCount, self.stringCount,
+         self._guideTableOffset, self._handleTableOffset, self._floatOffset,
+         self._stringTableOffset) = HEADER.unpack_from(self._data, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError("Not a BoneForge binary template")
+        if version not in SUPPORTED_VERSIONS:
+            self.close()
+            raise ValueError("Unsupported BoneForge binary template version {!r}, expected one of {}".format(
+                version, SUPPORTED_VERSIONS))
+        self.version = version
+        self._guideStruct = GUIDE_RECORD if version >= 2 else GUIDE_RECORD_V1
+        self._stringDataOffset = self._stringTableOffset + _align(self.stringCount * 8)
+        handleColumns = 4 if version >= 2 else 3
+        sections = ((self._guideTableOffset, self.guideCount * self._guideStruct.size),
+                    (self._handleTableOffset, self.handleCount * handleColumns * 4),
+                    (self._floatOffset, self.handleCount * 7 * 8),
+                    (self._stringTableOffset, self.stringCount * 8))
+        for offset, size in sections:
+            if offset + size > len(self._data):
+                self.close()
+                raise ValueError("Truncated or corrupt BoneForge binary template")
+        self._guideIndices = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Unmap the file. NumPy views returned earlier must not be used afterwards."""
+        if self._data is not None:
+            self._data.close()
+            self._data = None
+
+    def string(self, index):
+        """Returns the string at the given string table index, or None for NO_STRING."""
+        if index == NO_STRING:
+            return None
+        if index >= self.stringCount:
+            raise ValueError("String index {} out of range".format(index))
+        offset, length = struct.unpack_from("<II", self._data, self._stringTableOffset + index * 8)
+        start = self._stringDataOffset + offset
+        if start + length > len(self._data):
+            raise ValueError("String {} out of range".format(index))
+        return self._data[start:start + length].decode("utf-8")
+
+    def _guideRecord(self, index):
+        if not 0 <= index < self.guideCount:
+            raise IndexError("Guide index {} out of range".format(index))
+        return self._guideStruct.unpack_from(self._data, self._guideTableOffset + index * self._guideStruct.size)
+
+    def guideHandleCount(self, index):
+        return self._guideRecord(index)[7]
+
+    def guideHandleRange(self, index):
+        """Returns the (first, count) handle indices of the guide at index."""
+        record = self._guideRecord(index)
+        return record[6], record[7]
+
+    def guideNodeType(self, index):
+        return self.string(self._guideRecord(index)[0])
+
+    def guideForgeID(self, index):
+        return self.string(self._guideRecord(index)[2])
+
+    def findGuide(self, forgeID):
+        """Returns the index of the guide with the given forgeID, or -1."""
+        if self._guideIndices is None:
+            self._guideIndices = dict((self.guideForgeID(i), i) for i in xrange(self.guideCount))
+        return self._guideIndices.get(forgeID, -1)
+
+    def _handleInts(self, column, typecode, first, count):
+        offset = self._handleTableOffset + (column * self.handleCount + first) * 4
+        return _unpackArray(typecode, self._data[offset:offset + count * 4])
+
+    def _floatsOffset(self, column):
+        """Returns the offset of the translation (0), rotation (1) or radius (2) float column."""
+        return self._floatOffset + (0, 24, 48)[column] * self.handleCount
+
+    def _floats(self, column, width, first, count):
+        offset = self._floatsOffset(column) + first * width * 8
+        return _unpackArray("d", self._data[offset:offset + count * width * 8])
+
+    def guideData(self, index):
+        """Returns the getGuideData dictionary of the guide at index."""
+        record = self._guideRecord(index)
+        first, count = record[6], record[7]
+        values = record[9:21]
+        data = {
+            "guideNodeType": self.string(record[0]),
+            "className": self.string(record[1]),
+            "forgeID": self.string(record[2]),
+            "name": self.string(record[3]),
+            "parentGuideID": self.string(record[4]),
+            "parentGuideHandleIndex": record[5],
+            "provideAimVector": bool(record[8]),
+            "translation": values[0:3],
+            "rotation": values[3:6],
+            "scale": values[6:9],
+            "handleColor": values[9:12],
+            "handleCount": count,
+            "handleForgeIDs": map(self.string, self._handleInts(0, "I", first, count)),
+            "handleNames": map(self.string, self._handleInts(1, "I", first, count)),
+            "handleRotateOrders": list(self._handleInts(2, "i", first, count)),
+            "handleTranslations": self._floats(0, 3, first, count),
+            "handleRotations": self._floats(1, 3, first, count),
+            "handleRadii": self._floats(2, 1, first, count),
+        }
+        flags = record[24] if self.version >= 2 else 0
+        if flags & GUIDE_HAS_LIMB_LAYOUT:
+            data["limbHandleIndices"] = list(record[21:24])
+            data["handleInOrientGroup"] = [bool(handleFlags & HANDLE_IN_ORIENT_GROUP)
+                                           for handleFlags in self._handleInts(3, "i", first, count)]
+        if flags & (GUIDE_HAS_LIMB_LAYOUT | GUIDE_USE_CHILD_BASE_AS_END):
+            data["useChildBaseAsEnd"] = bool(flags & GUIDE_USE_CHILD_BASE_AS_END)
+        return data
+
+    def guideDataList(self):
+        """Returns the getGuideData dictionaries of every guide."""
+        return [self.guideData(i) for i in xrange(self.guideCount)]
+
+    def _view(self, column, width, index):
+        if index is None:
+            first, count = 0, self.handleCount
+        else:
+            first, count = self.guideHandleRange(index)
+        view = numpy.frombuffer(self._data, dtype="<f8", count=count * width,
+                                offset=self._floatsOffset(column) + first * width * 8)
+        return view.reshape(count, width) if width > 1 else view
+
+    def handleTranslations(self, index=None):
+        """Returns a read only (handles, 3) NumPy view of the local handle translations.
+
+        The view covers the guide at index, or every handle in the file.
+        """
+        return self._view(0, 3, index)
+
+    def handleRotations(self, index=None):
+        """Returns a read only (handles, 3) NumPy view of the handle rotations in degrees."""
+        return self._view(1, 3, index)
+
+    def handleRadii(self, index=None):
+        """Returns a read only (handles,) NumPy view of the handle radii."""
+        return self._view(2, 1, index)
+
+    def validate(self):
+        """Raise ValueError if any handle value is not finite or a string index is out of range."""
+        for name, view in (("translations", self.handleTranslations()),
+                           ("rotations", self.handleRotations()),
+                           ("radii", self.handleRadii())):
+            finite = numpy.isfinite(view)
+            finite = finite.all(axis=1) if finite.ndim == 2 else finite
+            bad = numpy.flatnonzero(~finite)
+            if len(bad):
+                raise ValueError("Handle {} of {} are not finite".format(list(bad[:10]), name))
+        offset = self._handleTableOffset
+        indices = numpy.frombuffer(self._data, dtype="<u4", count=self.handleCount * 2, offset=offset)
+        if len(indices) and indices.max() >= self.stringCount:
+            raise ValueError("Handle string index out of range")
+        for i in xrange(self.guideCount):
+            record = self._guideRecord(i)
+            for stringIndex in record[:5]:
+                if stringIndex != NO_STRING and stringIndex >= self.stringCount:
+                    raise ValueError("Guide {} string index out of range".format(i))
+            if record[6] + record[7] > self.handleCount:
+                raise ValueError("Guide {} handles out of range".format(i))
+
+
+def parityErrors(expected, actual):
+    """Returns a list of differences between two lists of guide data dictionaries.
+
+    Strings are compared as unicode, with empty strings equal to None, and
+    numbers and arrays by value.
+    """
+    errors = []
+    if len(expected) != len(actual):
+        return ["guide count {} != {}".format(len(expected), len(actual))]
+    for i, (a, b) in enumerate(zip(expected, actual)):
+        for key in sorted(set(a) | set(b)):
+            if _normalize(a.get(key)) != _normalize(b.get(key)):
+                errors.append("guide {} {}: {!r} != {!r}".format(i, key, a.get(key), b.get(key)))
+    return errors
+
+def _normalize(value):
+    # The binary format stores an empty parentGuideID as None
+    if isinstance(value, basestring):
+        if isinstance(value, str):
+            value = value.decode("utf-8")
+        return value or None
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (list, tuple, array.array)):
+        return [_normalize(v) for v in value]
+    if isinstance(value, (int, long, float)):
+        return float(value)
+    return value
+
+def checkSceneParity(guides=None):
+    """Round trip the getGuideData of the given Guides, or every guide in the scene.
+
+    Returns the list of differences between the guide data and its binary
+    round trip, which is empty if the format is lossless for the scene.
+    """
+    from . import core
+
+    if guides is None:
+        guides = core.guidesFromScene()
+    guideData = [guide.getGuideData() for guide in guides]
+    handle, path = tempfile.mkstemp(suffix=BINARY_EXTENSION)
+    os.close(handle)
+    try:
+        writeBinaryTemplate(path, guideData)
+        return parityErrors(guideData, readBinaryTemplate(path))
+    finally:
+        os.remove(path)
@@ -0,0 +1,256 @@
+"""my.skeleton.boneforge.templatelibrary
+
+A directory of reusable guide templates with an SQLite index.
+
+The index holds the name, guide types, guide and handle counts, content hash
+and timestamps of every template file, so a browser can list and filter the
+library from the index alone:
+
+    library = TemplateLibrary("/library/guides")
+    library.refresh()
+    for entry in library.entries(guideType="skeletonGuideLimb"):
+        print entry.name, entry.handleCount
+    library.apply("biped")
+
+refresh() only reads files whose size or mtime changed since they were
+indexed, and only re-summarizes those whose content hash changed. Files that
+are not valid templates are indexed as invalid, so they are not read again
+until they change, but are left out of the entries. Full template data is
+read when a template is loaded or applied.
+
+Text (.bft) and binary (.bfb) templates are both indexed. The index is stored
+in the library directory as INDEX_NAME.
+"""
+import collections
+import hashlib
+import os
+import sqlite3
+import time
+
+import template
+import templatebinary
+
+INDEX_NAME = ".boneforgeTemplates.sqlite"
+INDEX_VERSION = 2
+TEMPLATE_EXTENSIONS = (template.TEXT_EXTENSION, templatebinary.BINARY_EXTENSION)
+HASH_BLOCK_SIZE = 1 << 20
+
+TemplateEntry = collections.namedtuple("TemplateEntry", [
+    "name", "path", "guideTypes", "guideCount", "handleCount",
+    "contentHash", "size", "mtime", "indexedAt"])
+
+_COLUMNS = ", ".join(TemplateEntry._fields)
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS templates (
+    name TEXT NOT NULL,
+    path TEXT PRIMARY KEY,
+    guideTypes TEXT NOT NULL,
+    guideCount INTEGER NOT NULL,
+    handleCount INTEGER NOT NULL,
+    contentHash TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    indexedAt REAL NOT NULL,
+    valid INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS templatesByName ON templates (name);
+"""
+
+
+def contentHash(path):
+    """Returns the SHA-1 hex digest of the file contents."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), ""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def summarizeTemplate(path):
+    """Returns the (guideTypes, guideCount, handleCount) of a template file.
+
+    guideTypes is the sorted list of guide node types in the template. Binary
+    templates are summarized from their guide table alone.
+    """
+    guideTypes = set()
+    guideCount = handleCount = 0
+    if templatebinary.isBinaryTemplate(path):
+        with templatebinary.BinaryTemplate(path) as tpl:
+            for i in xrange(tpl.guideCount):
+                guideTypes.add(tpl.guideNodeType(i))
+            return sorted(guideTypes), tpl.guideCount, tpl.handleCount
+    for data in template.iterTemplate(path):
+        guideTypes.add(data["guideNodeType"])
+        guideCount += 1
+        handleCount += data["handleCount"]
+    return sorted(guideTypes), guideCount, handleCount
+
+
+class TemplateLibrary(object):
+    """Index and access the guide templates in a directory and its subdirectories."""
+
+    def __init__(self, directory, indexPath=None):
+        self.directory = os.path.abspath(directory)
+        self.indexPath = indexPath or os.path.join(self.directory, INDEX_NAME)
+        self._connection = sqlite3.connect(self.indexPath)
+        self._initIndex()
+
+    def _initIndex(self):
+        connection = self._connection
+        version = connection.execute("PRAGMA user_version").fetchone()[0]
+        if version != INDEX_VERSION:
+            # The index only caches file contents, so an outdated one is rebuilt
+            connection.execute("DROP TABLE IF EXISTS templates")
+            connection.execute("PRAGMA user_version = {}".format(INDEX_VERSION))
+        connection.executescript(_SCHEMA)
+        connection.commit()
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _relativePath(self, path):
+        return os.path.relpath(os.path.abspath(path), self.directory).replace(os.sep, "/")
+
+    def absolutePath(self, entry):
+        """Returns the absolute path of the file of a TemplateEntry."""
+        return os.path.join(self.directory, *entry.path.split("/"))
+
+    def _templateFiles(self):
+        """Yield the (relative path, stat result) of every template file in the library."""
+        for root, dirs, files in os.walk(self.directory):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            for filename in files:
+                if os.path.splitext(filename)[1].lower() in TEMPLATE_EXTENSIONS:
+                    path = os.path.join(root, filename)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        # A broken link or a file removed during the walk
+                        continue
+                    yield self._relativePath(path), stat
+
+    def refresh(self):
+        """Bring the index up to date with the template files in the directory.
+
+        Files whose size and mtime match the index are not opened. Changed
+        files are hashed, and only summarized again if their content changed.
+        Unreadable and corrupt files are indexed as invalid.
+
+        Returns a tuple of (added, updated, removed) relative paths of valid
+        templates. A template that became invalid counts as removed.
+        """
+        connection = self._connection
+        indexed = dict((row[0], row[1:]) for row in connection.execute(
+            "SELECT path, size, mtime, contentHash, valid FROM templates"))
+        added, updated, removed = [], [], []
+        now = time.time()
+        for path, stat in self._templateFiles():
+            previous = indexed.pop(path, None)
+            if previous is not None and previous[:2] == (stat.st_size, stat.st_mtime):
+                continue
+            absolutePath = os.path.join(self.directory, *path.split("/"))
+            wasValid = previous is not None and previous[3]
+            name = os.path.splitext(os.path.basename(path))[0]
+            digest = ""
+            try:
+                digest = contentHash(absolutePath)
+                if previous is not None and previous[2] == digest:
+                    connection.execute("UPDATE templates SET size = ?, mtime = ? WHERE path = ?",
+                                       (stat.st_size, stat.st_mtime, path))
+                    continue
+                guideTypes, guideCount, handleCount = summarizeTemplate(absolutePath)
+            except (ValueError, IOError, OSError):
+                # Not a readable, valid template, remember it as such until it changes
+                connection.execute(
+                    "INSERT OR REPLACE INTO templates ({}, valid) VALUES (?, ?, '', 0, 0, ?, ?, ?, ?, 0)"
+                    .format(_COLUMNS), (name, path, digest, stat.st_size, stat.st_mtime, now))
+                if wasValid:
+                    removed.append(path)
+                continue
+            connection.execute(
+                "INSERT OR REPLACE INTO templates ({}, valid) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 1)"
+                .format(_COLUMNS),
+                (name, path, ",".join(guideTypes), guideCount, handleCount, digest,
+                 stat.st_size, stat.st_mtime, now))
+            (updated if wasValid else added).append(path)
+        removed.extend(path for path, previous in indexed.items() if previous[3])
+        connection.executemany("DELETE FROM templates WHERE path = ?", [(path,) for path in indexed])
+        connection.commit()
+        return added, updated, sorted(removed)
+
+    def entries(self, guideType=None, nameFilter=None):
+        """Returns the indexed TemplateEntries, sorted by name.
+
+        guideType only returns templates containing guides of that node type,
+        and nameFilter those whose name contains the given text.
+        """
+        query = "SELECT {} FROM templates".format(_COLUMNS)
+        conditions, values = ["valid"], []
+        if guideType:
+            conditions.append("(',' || guideTypes || ',') LIKE ? ESCAPE '\\'")
+            values.append("%,{},%".format(_escapeLike(guideType)))
+        if nameFilter:
+            conditions.append("name LIKE ? ESCAPE '\\'")
+            values.append("%{}%".format(_escapeLike(nameFilter)))
+        query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY name, path"
+        return [_entry(row) for row in self._connection.execute(query, values)]
+
+    def entry(self, name):
+        """Returns the TemplateEntry with the given name or relative path, or None."""
+        row = self._connection.execute(
+            "SELECT {} FROM templates WHERE valid AND (path = ? OR name = ?) ORDER BY path = ? DESC, path LIMIT 1"
+            .format(_COLUMNS), (name, name, name)).fetchone()
+        return _entry(row) if row is not None else None
+
+    def _requireEntry(self, name):
+        entry = self.entry(name)
+        if entry is None:
+            raise KeyError("No template {!r} in library {!r}".format(name, self.directory))
+        return entry
+
+    def load(self, name):
+        """Returns the guide data dictionaries of the named template."""
+        return template.readTemplate(self.absolutePath(self._requireEntry(name)))
+
+    def apply(self, name, timings=None):
+        """Create the guides of the named template. See template.importTemplate."""
+        return template.importTemplate(self.absolutePath(self._requireEntry(name)), timings)
+
+    def save(self, name, guides=None, binary=False):
+        """Export the given Guides, or every guide in the scene, as a template of the library.
+
+        name is a path relative to the library directory, without extension.
+        Returns the new TemplateEntry.
+        """
+        extension = templatebinary.BINARY_EXTENSION if binary else template.TEXT_EXTENSION
+        path = os.path.join(self.directory, *(name + extension).split("/"))
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        template.exportTemplate(path, guides, binary)
+        self.refresh()
+        return self.entry(self._relativePath(path))
+
+    def delete(self, name):
+        """Delete the file of the named template and remove it from the index."""
+        entry = self._requireEntry(name)
+        os.remove(self.absolutePath(entry))
+        self._connection.execute("DELETE FROM templates WHERE path = ?", (entry.path,))
+        self._connection.commit()
+
+
+def _escapeLike(text):
+    """Escape the LIKE wildcards in text, for patterns with ESCAPE '\\'."""
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def _entry(row):
+    entry = TemplateEntry(*row)
+    return entry._replace(guideTypes=tuple(entry.guideTypes.split(",")) if entry.guideTypes else ())
@@ -30,6 +30,14 @@ class Connector(QtWidgets.QGraphicsPathItem):
             self._activeOutputItem.connections.append(self)
         self.outputNode.setAuxPlugVisibility()
 
+    def setOutputPlugs(self, outputPlugs):
+        """Move the output end of the connector to other plugs, keeping its input."""
+        self.setActiveOutputItem(None)
+        self.outputItems = outputPlugs
+        self.outputNode = outputPlugs[0].node
+        self.outputNodeID = self.outputNode.forgeID
+        self.updatePath()
+
     def updatePath(self):
         end = self.inputItem.plugPos()
         endItem = self.inputItem
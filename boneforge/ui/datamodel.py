@@ -1,12 +1,75 @@
 """my.skeleton.boneforge.ui.datamodel
 """
 
+import itertools
+
 from PySide2 import QtGui, QtCore, QtWidgets
+import maya.api.OpenMaya as OpenMaya
+import maya.utils
 import pymel.core as pm
 
+import boneforge.batch as bfbatch
 import boneforge.core as bfcore
+import boneforge.graph as bfgraph
+import boneforge.guidebuild as bfguidebuild
+import boneforge.lib.api as bfapi
+import boneforge.mirror as bfmirror
+import boneforge.skeleton as bfskeleton
+
+# Guide node attributes whose connections change the guide's parent link
+LINK_ATTRS = ("parentGuide", "parentGuideHandle")
+
+_recordVersions = itertools.count(1)
+
+def _nodeKey(obj):
+    return OpenMaya.MObjectHandle(obj).hashCode()
+
+def _plugName(plug):
+    if plug.isElement:
+        plug = plug.array()
+    return OpenMaya.MFnAttribute(plug.attribute()).name
+
+
+class GuideRecord(object):
+    """The values of a guide shown by the node editor.
+
+    Records are refreshed from the scene only when their guide was marked
+    dirty. Whenever a refresh changes a value the record gets a new version,
+    unique among all records, so views can tell whether they are showing the
+    current values, even of a guide restored by undo.
+    """
+
+    __slots__ = ("forgeID", "name", "guideClass", "handleCount", "version", "dirty")
+
+    def __init__(self, forgeID):
+        self.forgeID = forgeID
+        self.name = None
+        self.guideClass = None
+        self.handleCount = 0
+        self.version = 0
+        self.dirty = True
+
+    def refresh(self, guide):
+        """Read the values of the Guide, returning True if any changed."""
+        values = (guide.name, guide.__class__.__name__, guide.handleCount())
+        self.dirty = False
+        if values == (self.name, self.guideClass, self.handleCount):
+            return False
+        self.name, self.guideClass, self.handleCount = values
+        self.version = next(_recordVersions)
+        return True
+
 
 class GuideDataModel(QtCore.QObject):
+    """The guides of the scene, keyed by forgeID, and the links between them.
+
+    The model is kept in sync by Maya callbacks. They record which guides
+    were added, removed, renamed, re-linked or had their handles changed, and
+    syncPending applies only those changes, emitting the changed forgeIDs.
+    Changes are synced once the current boneforge.batchEdit block ends, or
+    on idle for edits made outside a batch. The scene is only rescanned
+    when a file is opened, imported or referenced, or by gatherDataFromScene.
+    """
 
     guidesAdded = QtCore.Signal(list)
     guidesRemoved = QtCore.Signal(list)
@@ -16,84 +79,323 @@ class GuideDataModel(QtCore.QObject):
 
     def __init__(self):
         super(GuideDataModel, self).__init__()
+        bfgraph.install()
         self.guideNodes = {}
         self.connections = []
+        # forgeID: GuideRecord, see guideRecord
+        self._records = {}
+        # forgeID: (outputID, outputIndex) of every guide with a parent guide
+        self._links = {}
+        # Node keys of the guide nodes and transforms, and the reverse mapping
+        self._nodeIDs = {}
+        self._transformIDs = {}
+        self._guideKeys = {}
+        self._callbackIDs = []
+        # Records the handles changed since the skeletons were last built
+        self.handleTracker = bfskeleton.HandleTracker()
+        self._resetPending()
         self.gatherDataFromScene()
+        self.addCallbacks()
+
+    def _resetPending(self):
+        self._addedNodes = []
+        self._removedIDs = set()
+        self._updatedIDs = set()
+        self._linkIDs = set()
+        self._syncScheduled = False
+        self._suspended = False
+
+    # Full rescans
 
     def gatherDataFromScene(self):
+        """Rebuild the model from every guide in the scene."""
         guides = bfcore.guidesFromScene()
+        bfcore.migrateGuideLinks(guides)
         self.guideNodes.clear()
+        self._records.clear()
+        self._nodeIDs.clear()
+        self._transformIDs.clear()
+        self._guideKeys.clear()
         for guide in guides:
-            self.guideNodes[guide.forgeID] = guide
+            self._refreshRecord(self._storeGuide(guide))
         self.gatherConnectionsFromScene(guides)
+        self._addedNodes = []
+        self._removedIDs.clear()
+        self._updatedIDs.clear()
+        self._linkIDs.clear()
         self.guideDataUpdated.emit()
 
     def gatherConnectionsFromScene(self, guides=None):
+        """Rebuild the links between guides from the given guides, or every guide in the model."""
         if guides is None:
-            guides = bfcore.guidesFromScene()
-        self.connections[:] = []
+            guides = self.guideNodes.values()
+        self._links.clear()
         for guide in guides:
-            if guide.parentGuide():
-                output = guide.parentGuide()
-                outputIndex = guide.parentGuideHandleIndex()
-                input = guide
-                self.connections.append((output.forgeID, outputIndex, input.forgeID))
+            self._queryLink(guide)
+        self._updateConnectionList()
+
+    def _storeGuide(self, guide):
+        forgeID = guide.forgeID
+        obj = bfapi.toMObject(guide.guide)
+        nodeKey = _nodeKey(obj)
+        transformKey = _nodeKey(OpenMaya.MFnDagNode(obj).parent(0))
+        self.guideNodes[forgeID] = guide
+        self._records[forgeID] = GuideRecord(forgeID)
+        self._nodeIDs[nodeKey] = forgeID
+        self._transformIDs[transformKey] = forgeID
+        self._guideKeys[forgeID] = (nodeKey, transformKey)
+        return forgeID
+
+    def _forgetGuide(self, forgeID):
+        self.guideNodes.pop(forgeID, None)
+        self._records.pop(forgeID, None)
+        keys = self._guideKeys.pop(forgeID, None)
+        if keys is not None:
+            self._nodeIDs.pop(keys[0], None)
+            self._transformIDs.pop(keys[1], None)
+
+    def _queryLink(self, guide):
+        """Store the parent link of the guide, returning True if it changed."""
+        forgeID = guide.forgeID
+        previous = self._links.get(forgeID)
+        parent = guide.parentGuide()
+        if parent is None:
+            link = None
+            self._links.pop(forgeID, None)
+        else:
+            link = (parent.forgeID, guide.parentGuideHandleIndex())
+            self._links[forgeID] = link
+        return link != previous
+
+    def _updateConnectionList(self):
+        self.connections[:] = [(outputID, index, inputID)
+                               for inputID, (outputID, index) in self._links.iteritems()]
+
+    # Callbacks
+
+    def addCallbacks(self):
+        """Register the Maya callbacks that keep the model in sync with the scene."""
+        if self._callbackIDs:
+            return
+        bfbatch.addListener(self)
+        ids = self._callbackIDs
+        for nodeType in bfgraph.GUIDE_NODE_TYPES:
+            ids.append(OpenMaya.MDGMessage.addNodeAddedCallback(self._onNodeAdded, nodeType))
+            ids.append(OpenMaya.MDGMessage.addNodeRemovedCallback(self._onNodeRemoved, nodeType))
+        ids.append(OpenMaya.MDGMessage.addConnectionCallback(self._onConnection))
+        ids.append(OpenMaya.MNodeMessage.addNameChangedCallback(OpenMaya.MObject.kNullObj, self._onNameChanged))
+        for message in (OpenMaya.MSceneMessage.kBeforeOpen,
+                        OpenMaya.MSceneMessage.kBeforeImport,
+                        OpenMaya.MSceneMessage.kBeforeCreateReference,
+                        OpenMaya.MSceneMessage.kBeforeLoadReference,
+                        OpenMaya.MSceneMessage.kBeforeNew):
+            ids.append(OpenMaya.MSceneMessage.addCallback(message, self._onBeforeFileIO))
+        for message in (OpenMaya.MSceneMessage.kAfterOpen,
+                        OpenMaya.MSceneMessage.kAfterImport,
+                        OpenMaya.MSceneMessage.kAfterCreateReference,
+                        OpenMaya.MSceneMessage.kAfterLoadReference,
+                        OpenMaya.MSceneMessage.kAfterUnloadReference,
+                        OpenMaya.MSceneMessage.kAfterNew):
+            ids.append(OpenMaya.MSceneMessage.addCallback(message, self._onAfterFileIO))
+
+    def removeCallbacks(self):
+        """Deregister the callbacks of this model. Call when the model is discarded or hidden."""
+        if self._callbackIDs:
+            OpenMaya.MMessage.removeCallbacks(self._callbackIDs)
+        self._callbackIDs = []
+        self.handleTracker.clear()
+        bfbatch.removeListener(self)
+
+    def reconnect(self):
+        """Re-register the callbacks removed by removeCallbacks and rescan the scene."""
+        if self._callbackIDs:
+            return
+        self._suspended = False
+        self.addCallbacks()
+        self.gatherDataFromScene()
+
+    def _onBeforeFileIO(self, clientData=None):
+        # Ignore the individual events of a file read and rescan once it has finished
+        self._suspended = True
+        # A cancelled or failed read sends no after message, so check again once
+        # Maya is idle, which is after the read either way
+        maya.utils.executeDeferred(self._resumeAfterFileIO)
+
+    def _resumeAfterFileIO(self):
+        if self._suspended and self._callbackIDs:
+            self._onAfterFileIO()
+
+    def _onAfterFileIO(self, clientData=None):
+        self._suspended = False
+        self.handleTracker.clear()
+        self.gatherDataFromScene()
+
+    def _onNodeAdded(self, obj, clientData=None):
+        if self._suspended:
+            return
+        # The guide may not be fully built yet, it is read when synced
+        self._addedNodes.append(OpenMaya.MObjectHandle(obj))
+        self._scheduleSync()
+
+    def _onNodeRemoved(self, obj, clientData=None):
+        if self._suspended:
+            return
+        forgeID = self._nodeIDs.get(_nodeKey(obj))
+        if forgeID is not None:
+            self._removedIDs.add(forgeID)
+            self._scheduleSync()
+
+    def _onConnection(self, sourcePlug, destinationPlug, made, clientData=None):
+        if self._suspended:
+            return
+        forgeID = self._nodeIDs.get(_nodeKey(destinationPlug.node()))
+        if forgeID is None:
+            return
+        attrName = _plugName(destinationPlug)
+        if attrName in LINK_ATTRS:
+            self._linkIDs.add(forgeID)
+            self._scheduleSync()
+        elif attrName == "handle":
+            self._updatedIDs.add(forgeID)
+            self._scheduleSync()
+
+    def _onNameChanged(self, obj, previousName, clientData=None):
+        if self._suspended:
+            return
+        forgeID = self._transformIDs.get(_nodeKey(obj))
+        if forgeID is not None:
+            self._updatedIDs.add(forgeID)
+            self._scheduleSync()
+
+    def _scheduleSync(self):
+        # Inside a batch the model is synced by flushBatch
+        if self._syncScheduled or bfbatch.isBatching():
+            return
+        self._syncScheduled = True
+        maya.utils.executeDeferred(self.syncPending)
+
+    def flushBatch(self, dirtyIDs):
+        """Sync the changes made during a boneforge.batchEdit block."""
+        self._updatedIDs.update(dirtyIDs)
+        self.syncPending()
+
+    def syncPending(self):
+        """Apply the scene changes recorded by the callbacks and emit the changed forgeIDs."""
+        self._syncScheduled = False
+        addedNodes, self._addedNodes = self._addedNodes, []
+        removed, self._removedIDs = self._removedIDs, set()
+        updated, self._updatedIDs = self._updatedIDs, set()
+        linkIDs, self._linkIDs = self._linkIDs, set()
+
+        for forgeID in removed:
+            self._forgetGuide(forgeID)
+        added = set()
+        for objHandle in addedNodes:
+            # Nodes deleted again before the sync are no longer valid
+            if not objHandle.isValid():
+                continue
+            path = OpenMaya.MDagPath.getAPathTo(objHandle.object())
+            guide = bfcore.guideFromName(path.fullPathName())
+            added.add(self._storeGuide(guide))
+        # A guide removed and restored, as by undo, is replaced rather than re-added
+        updated |= added & removed
+        added -= removed
+        removed -= set(self.guideNodes)
+
+        linksChanged = False
+        for forgeID in removed:
+            linksChanged |= self._links.pop(forgeID, None) is not None
+        # Handle changes can shift the handle index children are linked to
+        linkIDs |= added | updated
+        linkIDs.update(inputID for inputID, (outputID, index) in self._links.iteritems()
+                       if outputID in updated)
+        for forgeID in linkIDs:
+            guide = self.guideNodes.get(forgeID)
+            if guide is not None:
+                linksChanged |= self._queryLink(guide)
+        if linksChanged:
+            self._updateConnectionList()
+
+        # Records are read here, not while painting, and unchanged ones are not reported
+        for forgeID in added:
+            self.guideRecord(forgeID)
+        updated = set(forgeID for forgeID in updated if forgeID in self.guideNodes) - added
+        updated = set(forgeID for forgeID in updated if self._refreshRecord(forgeID))
+        if removed:
+            self.guidesRemoved.emit(list(removed))
+        if added:
+            self.guidesAdded.emit(list(added))
+        if updated:
+            self.guidesUpdated.emit(list(updated))
+        if linksChanged:
+            self.connectionsUpdated.emit()
 
     def guideIDs(self):
         return self.guideNodes.iterkeys()
 
+    # Edits
+    #
+    # Edits only change the scene, inside a batch. The model picks the changes
+    # up through its callbacks and syncs them when the batch ends.
+
     def addGuide(self, guideClass):
-        guide = guideClass.create()
-        self.guideNodes[guide.forgeID] = guide
-        self.guidesAdded.emit([guide.forgeID])
+        with bfbatch.batchEdit():
+            guideClass.create()
 
     def removeGuides(self, ids):
-        for gID in ids:
-            guide = self.guideNodes.pop(gID)
-            if guide:
-                guide.remove()
-        self.guidesRemoved.emit(ids)
-        self.gatherConnectionsFromScene()
-        self.connectionsUpdated.emit()
+        with bfbatch.batchEdit():
+            for gID in ids:
+                guide = self.guideNodes.get(gID)
+                if guide:
+                    guide.remove()
 
     def connectGuides(self, outputID, outputIndex, inputID):
-        outputGuide = self.guideNodes[outputID]
-        inputGuide = self.guideNodes[inputID]
-        inputGuide.setParentGuide(outputGuide, outputIndex)
-        self.gatherConnectionsFromScene()
-        self.connectionsUpdated.emit()
+        with bfbatch.batchEdit():
+            outputGuide = self.guideNodes[outputID]
+            inputGuide = self.guideNodes[inputID]
+            inputGuide.setParentGuide(outputGuide, outputIndex)
+            # The link index of an existing connection is a plain value, not a connection
+            self._linkIDs.add(inputID)
 
     def disconnectGuides(self, inputIDs):
-        for inputID in inputIDs:
-            inputGuide = self.guideNodes[inputID]
-            inputGuide.setParentGuide(None)
-        self.gatherConnectionsFromScene()
-        self.connectionsUpdated.emit()
+        with bfbatch.batchEdit():
+            for inputID in inputIDs:
+                inputGuide = self.guideNodes[inputID]
+                inputGuide.setParentGuide(None)
 
-    def duplicateGuides(self, ids):
-        pass
+    def mirrorGuides(self, ids, axis="x"):
+        """Mirror the guides and their descendant guides across the world plane normal to axis."""
+        with bfbatch.batchEdit():
+            guides = [self.guideNodes[gID] for gID in ids]
+            bfmirror.mirrorGuides(guides, axis)
+
+    def duplicateGuides(self, ids, linkExternal=True):
+        """Duplicate the guides in one batch, keeping the links between them.
+
+        If linkExternal is True, duplicates of guides parented outside the set
+        are parented to the same guide.
+        """
+        with bfbatch.batchEdit():
+            guides = [self.guideNodes[gID] for gID in ids]
+            bfguidebuild.duplicateGuides(guides, linkExternal)
 
     def changeHandleIndex(self, id, sourceIndex, targetIndex):
         pass
 
     def addHandle(self, id):
-        guide = self.guideNodes[id]
-        bfcore.addGuideHandle(guide)
-        self.guidesUpdated.emit([id])
+        with bfbatch.batchEdit():
+            guide = self.guideNodes[id]
+            bfcore.addGuideHandle(guide)
 
     def insertHandle(self, id, index):
-        guide = self.guideNodes[id]
-        bfcore.insertGuideHandle(guide, index)
-        self.guidesUpdated.emit([id])
-        self.gatherConnectionsFromScene()
-        self.connectionsUpdated.emit()
+        with bfbatch.batchEdit():
+            guide = self.guideNodes[id]
+            bfcore.insertGuideHandle(guide, index)
 
     def removeHandle(self, id, index):
-        guide = self.guideNodes[id]
-        guide.removeHandle(index)
-        self.guidesUpdated.emit([id])
-        self.gatherConnectionsFromScene()
-        self.connectionsUpdated.emit()
+        with bfbatch.batchEdit():
+            guide = self.guideNodes[id]
+            guide.removeHandle(index)
 
     def renameGuide(self, id, name):
         pass
@@ -109,15 +411,25 @@ class GuideDataModel(QtCore.QObject):
         handle = guide.handleAtIndex(index)
         pm.select(handle.transform)
 
-    def guideData(self, id):
-        guide = self.guideNodes.get(id, None)
-        if guide is None:
+    def guideRecord(self, id):
+        """Returns the GuideRecord of the guide, refreshing it first if it is dirty."""
+        record = self._records.get(id)
+        if record is None:
             raise RuntimeError("Model has no reference to guide with ID: {!r}".format(id))
+        if record.dirty:
+            record.refresh(self.guideNodes[id])
+        return record
+
+    def _refreshRecord(self, id):
+        """Refresh the GuideRecord of the guide, returning True if it changed."""
+        return self._records[id].refresh(self.guideNodes[id])
 
+    def guideData(self, id):
+        record = self.guideRecord(id)
         data = {
-            "name": guide.name,
-            "class": guide.__class__.__name__,
-            "handleCount": guide.handleCount()
+            "name": record.name,
+            "class": record.guideClass,
+            "handleCount": record.handleCount
         }
         return data
 
@@ -131,6 +443,6 @@ class GuideDataModel(QtCore.QObject):
 
     def buildSkeleton(self):
         for root in self.getGuideRoots():
-            bfcore.buildSkeleton(root)
+            bfskeleton.buildSkeleton(root, update=True, tracker=self.handleTracker)
 
 
@@ -27,6 +27,16 @@ class BoneForgeTool(lib.ui.MayaToolWindow):
     def sizeHint(self):
         return QtCore.QSize(*self.DefaultSize)
 
+    def showEvent(self, event):
+        # The callbacks are removed when the window is closed, and the scene
+        # may have changed since
+        self.bfWidget.model.reconnect()
+        super(BoneForgeTool, self).showEvent(event)
+
+    def closeEvent(self, event):
+        self.bfWidget.model.removeCallbacks()
+        super(BoneForgeTool, self).closeEvent(event)
+
     @classmethod
     def run(cls):
         window = cls()
@@ -64,6 +74,8 @@ class BoneForgeWidget(QtWidgets.QWidget):
     def _initConnections(self):
         self.toolbar.addGuide.connect(self.addGuideToScene)
         self.toolbar.buildSkeleton.connect(self.nodeScene.buildSkeleton)
+        self.toolbar.mirrorGuides.connect(self.nodeScene.mirrorSelectedGuides)
+        self.toolbar.duplicateGuides.connect(self.nodeScene.duplicateSelectedGuides)
         self.model.guidesAdded.connect(self.nodeScene.addGuideNodes)
         self.model.guidesRemoved.connect(self.nodeScene.removeGuideNodes)
         self.model.guidesUpdated.connect(self.nodeScene.updateGuideNodeData)
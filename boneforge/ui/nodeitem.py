@@ -15,14 +15,24 @@ GUIDE_ICONS = {
 }
 ROTATE_ICON = os.path.join(RESOURCE_FOLDER, "rotate_clockwise.png")
 
+_pixmaps = {}
+
+def _pixmap(path):
+    """Returns the QPixmap of the image file, loading it only once."""
+    pixmap = _pixmaps.get(path)
+    if pixmap is None:
+        pixmap = _pixmaps[path] = QtGui.QPixmap(path)
+    return pixmap
+
 class GuideNodeItem(QtWidgets.QGraphicsRectItem):
 
     def __init__(self, forgeID, dataModel):
         super(GuideNodeItem, self).__init__(parent=None)
         self.forgeID = forgeID
         self.model = dataModel
-        self._guideIcon = QtGui.QPixmap(GUIDE_ICONS[self.guideClass])
-        self._rotateIcon = QtGui.QPixmap(ROTATE_ICON)
+        self._recordVersion = self.record.version
+        self._guideIcon = _pixmap(GUIDE_ICONS[self.guideClass])
+        self._rotateIcon = _pixmap(ROTATE_ICON)
 
         self.xRadius = 8
         self.yRadius = 8
@@ -53,20 +63,20 @@ class GuideNodeItem(QtWidgets.QGraphicsRectItem):
         return self.rect().adjusted(-extra, -extra, extra, extra)
 
     @property
-    def guideData(self):
-        return self.model.guideData(self.forgeID)
+    def record(self):
+        return self.model.guideRecord(self.forgeID)
 
     @property
     def name(self):
-        return self.guideData["name"]
+        return self.record.name
 
     @property
     def guideClass(self):
-        return self.guideData["class"]
+        return self.record.guideClass
 
     @property
     def handleCount(self):
-        return self.guideData["handleCount"]
+        return self.record.handleCount
 
     @property
     def orientation(self):
@@ -227,7 +237,14 @@ class GuideNodeItem(QtWidgets.QGraphicsRectItem):
         self.scene().addHandle(self.forgeID)
 
     def updateData(self):
+        record = self.record
+        if record.version == self._recordVersion:
+            return
+        self._recordVersion = record.version
         self.updateHandleWidget()
+        # Resizing moves the plugs, and reused connectors keep their old paths
+        self.updateConnectionPaths()
+        self.update()
     
     def removeHandle(self, index):
         self.scene().removeHandle(self.forgeID, index)
@@ -28,6 +28,12 @@ class ForgeNodeScene(QtWidgets.QGraphicsScene):
         self._connectionInitPos = None
         self._connectionIndicator = None
 
+        # forgeID: GuideNodeItem, input forgeID: Connector, and input
+        # forgeID: (output forgeID, output index) shown by the Connector
+        self._guideItems = {}
+        self._connectorItems = {}
+        self._connectorLinks = {}
+
     def setSceneSize(self, x, y):
         self.setSceneRect(-x*0.5, -y*0.5, x, y)
 
@@ -77,20 +83,37 @@ class ForgeNodeScene(QtWidgets.QGraphicsScene):
         for gID in guideIDs:
             node = nodeitem.GuideNodeItem(gID, self.model)
             self.addItem(node)
+            self._guideItems[gID] = node
 
     def rebuildFromData(self):
-        self.clear()
-        self.addGuideNodes(self.model.guideIDs())
+        """Reconcile the scene with every guide of the model.
+
+        Items of guides still in the model are kept, with their position and
+        selection, and updated in place. Only items of added or removed
+        guides are created or removed.
+        """
+        guideIDs = set(self.model.guideIDs())
+        removed = [gID for gID in self._guideItems if gID not in guideIDs]
+        kept = [gID for gID in self._guideItems if gID in guideIDs]
+        self.removeGuideNodes(removed)
+        self.addGuideNodes(guideIDs.difference(kept))
+        self.updateGuideNodeData(kept)
         self.updateConnections()
         # TODO: Node layout
 
     def removeGuideNodes(self, guideIDs):
-        guideNodes = self.guideNodeItems(byID=True)
         for gID in guideIDs:
-            guide = guideNodes[gID]
+            guide = self._guideItems.pop(gID)
             #self.disconnect(guide.connections())
             self.removeItem(guide)
 
+    def clearItems(self):
+        """Remove every item from the scene, along with the guide node items and connectors kept by forgeID."""
+        self.clear()
+        self._guideItems.clear()
+        self._connectorItems.clear()
+        self._connectorLinks.clear()
+
     def contextMenuEvent(self, event):
         if event.modifiers() & QtCore.Qt.AltModifier:
             return
@@ -168,35 +191,67 @@ class ForgeNodeScene(QtWidgets.QGraphicsScene):
 
     def guideNodeItems(self, items=None, byID=False):
         if items is None:
-            items = self.items()
-        guideNodes = filter(lambda x: isinstance(x, nodeitem.GuideNodeItem), items)
+            guideNodes = self._guideItems.values()
+        else:
+            guideNodes = filter(lambda x: isinstance(x, nodeitem.GuideNodeItem), items)
         if byID:
             return dict((guide.forgeID, guide) for guide in guideNodes)
         return guideNodes
 
     def connectorItems(self, items=None, byID=False):
         if items is None:
-            items = self.items()
-        connectorItems = filter(lambda x: isinstance(x, connector.Connector), items)
+            connectorItems = self._connectorItems.values()
+        else:
+            connectorItems = filter(lambda x: isinstance(x, connector.Connector), items)
         if byID:
             return dict((connector.inputNodeID, connector) for connector in connectorItems)
         return connectorItems
 
     def getNodeByID(self, gID):
-        nodeItems = self.guideNodeItems(byID=True)
-        return nodeItems[gID]
+        return self._guideItems[gID]
+
+    def getConnectorByID(self, inputID):
+        """Returns the Connector into the guide node with the given forgeID, or None."""
+        return self._connectorItems.get(inputID)
 
     def updateConnections(self):
-        for item in self.connectorItems():
-            item.prepareToRemove()
-            self.removeItem(item)
-        for output, index, input in self.model.connections:
-            outputNode = self.getNodeByID(output)
-            outputPlugs = outputNode.getPlugItems(nodeitem.ConnectionPlugItem.Output, index)
-            inputNode = self.getNodeByID(input)
-            inputPlug = inputNode.getPlugItems(nodeitem.ConnectionPlugItem.Input)[0]
-            connectorItem = connector.Connector(outputPlugs, inputPlug)
-            self.addItem(connectorItem)
+        """Reconcile the connectors with the connections of the model.
+
+        Connectors of unchanged connections are kept as they are, those whose
+        input guide is now linked to another guide or handle are moved, and
+        only new connections get new connectors.
+        """
+        links = dict((input, (output, index)) for output, index, input in self.model.connections)
+        for input in list(self._connectorItems):
+            if input not in links or not self._connectorIsCurrent(input):
+                self._removeConnector(input)
+        for input, link in links.iteritems():
+            if self._connectorLinks.get(input) == link:
+                continue
+            output, index = link
+            outputPlugs = self._guideItems[output].getPlugItems(nodeitem.ConnectionPlugItem.Output, index)
+            connectorItem = self._connectorItems.get(input)
+            if connectorItem is None:
+                inputPlug = self._guideItems[input].getPlugItems(nodeitem.ConnectionPlugItem.Input)[0]
+                connectorItem = connector.Connector(outputPlugs, inputPlug)
+                self.addItem(connectorItem)
+                self._connectorItems[input] = connectorItem
+            else:
+                connectorItem.setOutputPlugs(outputPlugs)
+            self._connectorLinks[input] = link
+
+    def _connectorIsCurrent(self, input):
+        """Returns True if the connector into the guide still joins the guide node items of the scene."""
+        connectorItem = self._connectorItems[input]
+        output = self._connectorLinks[input][0]
+        return (self._guideItems.get(input) is connectorItem.inputNode
+                and self._guideItems.get(output) is connectorItem.outputNode)
+
+    def _removeConnector(self, input):
+        connectorItem = self._connectorItems.pop(input)
+        self._connectorLinks.pop(input, None)
+        connectorItem.prepareToRemove()
+        self.removeItem(connectorItem)
 
     def addHandle(self, nodeID):
         self.model.addHandle(nodeID)
@@ -214,14 +269,23 @@ class ForgeNodeScene(QtWidgets.QGraphicsScene):
         self.model.selectGuides([nodeID])
 
     def updateGuideNodeData(self, nodeIDs):
-        nodeItems = self.guideNodeItems(byID=True)
         for id in nodeIDs:
-            node = nodeItems[id]
+            node = self._guideItems[id]
             node.updateData()
 
     def buildSkeleton(self):
         self.model.buildSkeleton()
 
+    def mirrorSelectedGuides(self):
+        ids = [guide.forgeID for guide in self.guideNodeItems(self.selectedItems())]
+        if ids:
+            self.model.mirrorGuides(ids)
+
+    def duplicateSelectedGuides(self):
+        ids = [guide.forgeID for guide in self.guideNodeItems(self.selectedItems())]
+        if ids:
+            self.model.duplicateGuides(ids)
+
 
 
 class ConnectionContext(object):
@@ -10,6 +10,8 @@ class ForgeToolbar(QtWidgets.QWidget):
     ToolbarHeight = 75
     addGuide = QtCore.Signal(object)
     buildSkeleton = QtCore.Signal()
+    mirrorGuides = QtCore.Signal()
+    duplicateGuides = QtCore.Signal()
 
     def __init__(self, parent=None):
         super(ForgeToolbar, self).__init__(parent)
@@ -46,11 +48,10 @@ class ForgeToolbar(QtWidgets.QWidget):
 
         self._initConnections()
 
-        self.mirrorBtn.setEnabled(False)
-        self.duplicateBtn.setEnabled(False)
-
     def _initConnections(self):
         self.spineGuideBtn.clicked.connect(partial(self.addGuide.emit, bfcore.GuideSpine))
         self.limbGuideBtn.clicked.connect(partial(self.addGuide.emit, bfcore.GuideLimb))
         self.blockGuideBtn.clicked.connect(partial(self.addGuide.emit, bfcore.GuideBlock))
         self.buildSkeletonBtn.clicked.connect(self.buildSkeleton)
+        self.mirrorBtn.clicked.connect(self.mirrorGuides)
+        self.duplicateBtn.clicked.connect(self.duplicateGuides)
@@ -9,6 +9,7 @@ import boneforgecomponents.spine as spine
 import boneforgecomponents.limb as limb
 import boneforgecomponents.block as block
 import boneforgecomponents.handle as handle
+import boneforgecomponents.command as command
 
 def maya_useNewAPI():
     """
@@ -107,6 +108,14 @@ def initializePlugin(obj):
         sys.stderr.write("Failed to register GuideHandleDrawOverride override\n")
         raise
 
+    # COMMANDS #
+    try:
+        plugin.registerCommand(command.ModifierCommand.name,
+                               command.ModifierCommand.creator)
+    except RuntimeError:
+        sys.stderr.write("Failed to register ModifierCommand command\n")
+        raise
+
 
 def uninitializePlugin(obj):
     plugin = OpenMaya.MFnPlugin(obj)
@@ -169,4 +178,11 @@ def uninitializePlugin(obj):
             handle.GuideHandle.drawRegistrantId)
     except RuntimeError:
         sys.stderr.write("Failed to deregister GuideHandleDrawOverride override\n")
-        pass
\ No newline at end of file
+        pass
+
+    # COMMANDS #
+    try:
+        plugin.deregisterCommand(command.ModifierCommand.name)
+    except RuntimeError:
+        sys.stderr.write("Failed to deregister ModifierCommand command\n")
+        pass
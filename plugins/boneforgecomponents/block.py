@@ -45,6 +45,7 @@ class SkeletonGuideBlock(OpenMayaUI.MPxLocatorNode):
 
     parentGuide = None
     parentGuideHandleIndex = None
+    parentGuideHandle = None
     childGuide = None
 
     borderPad = 1.0
@@ -135,6 +136,9 @@ class SkeletonGuideBlock(OpenMayaUI.MPxLocatorNode):
         cls.parentGuideHandleIndex = nAttr.create("parentGuideHandleIndex", "pghi", OpenMaya.MFnNumericData.kShort, -1)
         cls.addAttribute(cls.parentGuideHandleIndex)
 
+        cls.parentGuideHandle = messageAttr.create("parentGuideHandle", "pgh")
+        cls.addAttribute(cls.parentGuideHandle)
+
         cls.childGuide = messageAttr.create("childGuide", "cg")
         cls.addAttribute(cls.childGuide)
 
@@ -0,0 +1,50 @@
+import maya.api.OpenMaya as OpenMaya
+
+
+def maya_useNewAPI():
+    """
+    The presence of this function tells Maya that the plugin produces, and
+    expects to be passed, objects created using the Maya Python API 2.0.
+    """
+    pass
+
+
+# Modifiers waiting to be picked up by the next ModifierCommand invocation
+_pendingModifiers = []
+
+def pushModifier(modifier):
+    """Queue an MDGModifier/MDagModifier for the next boneforgeModifier command."""
+    _pendingModifiers.append(modifier)
+
+
+class ModifierCommand(OpenMaya.MPxCommand):
+    """Runs a queued modifier so that it is recorded on Maya's undo queue.
+
+    Modifiers executed directly from script code are not undoable, so tools
+    queue them with pushModifier() and then invoke this command.
+    """
+
+    name = "boneforgeModifier"
+
+    def __init__(self):
+        super(ModifierCommand, self).__init__()
+        self._modifier = None
+
+    @staticmethod
+    def creator():
+        return ModifierCommand()
+
+    def isUndoable(self):
+        return self._modifier is not None
+
+    def doIt(self, args):
+        if not _pendingModifiers:
+            raise RuntimeError("No pending modifier to execute")
+        self._modifier = _pendingModifiers.pop(0)
+        self.redoIt()
+
+    def redoIt(self):
+        self._modifier.doIt()
+
+    def undoIt(self):
+        self._modifier.undoIt()
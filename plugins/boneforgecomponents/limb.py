@@ -58,6 +58,7 @@ class SkeletonGuideLimb(OpenMayaUI.MPxLocatorNode):
 
     parentGuide = None
     parentGuideHandleIndex = None
+    parentGuideHandle = None
     childGuide = None
 
     borderPad = 1.0
@@ -189,6 +190,9 @@ class SkeletonGuideLimb(OpenMayaUI.MPxLocatorNode):
         cls.parentGuideHandleIndex = nAttr.create("parentGuideHandleIndex", "pghi", OpenMaya.MFnNumericData.kShort, -1)
         cls.addAttribute(cls.parentGuideHandleIndex)
 
+        cls.parentGuideHandle = messageAttr.create("parentGuideHandle", "pgh")
+        cls.addAttribute(cls.parentGuideHandle)
+
         cls.childGuide = messageAttr.create("childGuide", "cg")
         cls.addAttribute(cls.childGuide)
 
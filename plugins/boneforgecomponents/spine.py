@@ -44,6 +44,7 @@ class SkeletonGuideSpine(OpenMayaUI.MPxLocatorNode):
 
     parentGuide = None
     parentGuideHandleIndex = None
+    parentGuideHandle = None
     childGuide = None
 
     borderPad = 1.0
@@ -119,6 +120,9 @@ class SkeletonGuideSpine(OpenMayaUI.MPxLocatorNode):
         cls.parentGuideHandleIndex = nAttr.create("parentGuideHandleIndex", "pghi", OpenMaya.MFnNumericData.kShort, -1)
         cls.addAttribute(cls.parentGuideHandleIndex)
 
+        cls.parentGuideHandle = messageAttr.create("parentGuideHandle", "pgh")
+        cls.addAttribute(cls.parentGuideHandle)
+
         cls.childGuide = messageAttr.create("childGuide", "cg")
         cls.addAttribute(cls.childGuide)
 
@@ -0,0 +1,119 @@
+"""Tests of the NumPy guide data mirroring, which needs no Maya."""
+import os
+import sys
+import unittest
+
+import numpy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from boneforge import benchmark
+from boneforge import mirror
+from boneforge import template
+
+
+def limbData(layout=True):
+    """Returns the getGuideData dictionary of a five handle limb, the last two in its orient group."""
+    data = benchmark.templateGuideData(guideCount=1, handlesPerGuide=5)[0]
+    data.update({
+        "guideNodeType": template.LIMB_NODE_TYPE,
+        "className": "GuideLimb",
+        "name": "L_arm",
+        "handleNames": ["L_shoulder", "L_elbow", "leftForearm_L", "wrist_l_01", "Lower_arm"],
+        "translation": (2.0, 5.0, -1.0),
+        "rotation": (30.0, -60.0, 120.0),
+    })
+    if layout:
+        data.update({
+            "limbHandleIndices": [0, 1, 4],
+            "handleInOrientGroup": [False, False, False, True, True],
+            "useChildBaseAsEnd": False,
+        })
+    return data
+
+
+class EulerTest(unittest.TestCase):
+
+    def assertRoundTrip(self, degrees):
+        matrices = mirror.eulerToMatrices(degrees)
+        numpy.testing.assert_allclose(mirror.eulerToMatrices(mirror.matricesToEuler(matrices)), matrices,
+                                      rtol=0, atol=1e-9)
+
+    def testKnownRotation(self):
+        # Row-vector layout: the rows are the rotated X, Y and Z axes
+        numpy.testing.assert_allclose(mirror.eulerToMatrices([(90.0, 0.0, 0.0)])[0],
+                                      [[1, 0, 0], [0, 0, 1], [0, -1, 0]], rtol=0, atol=1e-12)
+        numpy.testing.assert_allclose(mirror.eulerToMatrices([(0.0, 0.0, 90.0)])[0],
+                                      [[0, 1, 0], [-1, 0, 0], [0, 0, 1]], rtol=0, atol=1e-12)
+
+    def testRoundTrip(self):
+        random = numpy.random.RandomState(7)
+        degrees = random.uniform(-180.0, 180.0, (200, 3))
+        degrees[:, 1] /= 2.0
+        self.assertRoundTrip(degrees)
+        numpy.testing.assert_allclose(mirror.matricesToEuler(mirror.eulerToMatrices(degrees)), degrees,
+                                      rtol=0, atol=1e-9)
+
+    def testGimbal(self):
+        self.assertRoundTrip([(a, b, c) for a in (0.0, 30.0, -75.0)
+                              for b in (90.0, -90.0) for c in (0.0, 45.0, 170.0)])
+
+
+class MirrorGuideDataTest(unittest.TestCase):
+
+    def assertDataEqual(self, actual, expected):
+        self.assertEqual(len(actual), len(expected))
+        for a, b in zip(actual, expected):
+            for key in ("translation", "handleTranslations", "handleRotations"):
+                numpy.testing.assert_allclose(a[key], b[key], rtol=0, atol=1e-9, err_msg=key)
+            numpy.testing.assert_allclose(mirror.eulerToMatrices(a["rotation"]),
+                                          mirror.eulerToMatrices(b["rotation"]), rtol=0, atol=1e-9)
+            self.assertEqual(a["name"], b["name"])
+            self.assertEqual(list(a["handleNames"]), list(b["handleNames"]))
+
+    def testDoubleMirrorIsIdentity(self):
+        guideData = benchmark.templateGuideData(guideCount=3, handlesPerGuide=4)
+        guideData[1]["rotation"] = (10.0, 20.0, 30.0)
+        guideData += [limbData(), limbData(layout=False)]
+        for axis in ("x", "y", "z"):
+            mirrored = mirror.mirrorGuideData(guideData, axis)
+            self.assertDataEqual(mirror.mirrorGuideData(mirrored, axis), guideData)
+
+    def testOrientGroupHandles(self):
+        data = limbData()
+        mirrored = mirror.mirrorGuideData([data])[0]
+        translations = numpy.reshape(data["handleTranslations"], (-1, 3))
+        mirroredTranslations = numpy.reshape(mirrored["handleTranslations"], (-1, 3))
+        # Handles in the orient group reflect its local Y axis, the others the guide's local X
+        scale = numpy.array([[-1, 1, 1]] * 3 + [[1, -1, 1]] * 2)
+        numpy.testing.assert_allclose(mirroredTranslations, translations * scale, rtol=0, atol=1e-12)
+        numpy.testing.assert_allclose(mirrored["translation"], (-2.0, 5.0, -1.0), rtol=0, atol=1e-12)
+
+    def testEmpty(self):
+        self.assertEqual(mirror.mirrorGuideData([]), [])
+
+
+class MirrorNameTest(unittest.TestCase):
+
+    def testSideTokens(self):
+        for name, expected in (("L_arm", "R_arm"),
+                               ("R_arm", "L_arm"),
+                               ("leftArm_L", "rightArm_R"),
+                               ("arm_l_01", "arm_r_01"),
+                               ("Left_leg", "Right_leg"),
+                               ("spine_01", "spine_01"),
+                               ("Lower_arm", "Lower_arm"),
+                               ("leftover", "leftover")):
+            self.assertEqual(mirror.mirrorName(name), expected)
+
+    def testRenameSides(self):
+        data = limbData()
+        mirrored = mirror.mirrorGuideData([data])[0]
+        self.assertEqual(mirrored["name"], "R_arm")
+        self.assertEqual(mirrored["handleNames"],
+                         ["R_shoulder", "R_elbow", "rightForearm_R", "wrist_r_01", "Lower_arm"])
+        kept = mirror.mirrorGuideData([data], renameSides=False)[0]
+        self.assertEqual(kept["handleNames"], data["handleNames"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+"""Parity tests of boneforge.solver against the plugin's GuideHandle.
+
+The reference functions port GuideHandle.buildAimMatrix and
+computeJointMatrix to plain Python, so the tests need NumPy but not Maya.
+"""
+import itertools
+import os
+import sys
+import unittest
+
+import numpy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from boneforge import solver
+
+AXES = range(6)
+AXIS_PAIRS = [(aim, up) for aim, up in itertools.product(AXES, AXES) if aim % 3 != up % 3]
+
+AIM_VECTORS = [(1.0, 0.0, 0.0), (0.3, -0.8, 0.5), (0.0, 0.0, -2.0)]
+UP_VECTORS = [(0.0, 1.0, 0.0), (0.2, 0.7, -0.4),
+              # Degenerate up vectors, zero length or parallel to the aim
+              (0.0, 0.0, 0.0), (2.0, 0.0, 0.0), (-0.3, 0.8, -0.5)]
+
+
+def cross(a, b):
+    return (a[1] * b[2] - a[2] * b[1],
+            a[2] * b[0] - a[0] * b[2],
+            a[0] * b[1] - a[1] * b[0])
+
+def normal(v):
+    """MVector.normal, which leaves a zero length vector unchanged."""
+    length = sum(c * c for c in v) ** 0.5
+    if length == 0.0:
+        return tuple(v)
+    return tuple(c / length for c in v)
+
+def subtract(a, b):
+    return tuple(x - y for x, y in zip(a, b))
+
+def buildAimMatrix(aimVector, upVector, aimAxis, upAxis, position):
+    """Port of GuideHandle.buildAimMatrix."""
+    axisVectors = dict(zip(range(3), [None] * 3))
+    absAimAxis = aimAxis % 3
+    absUpAxis = upAxis % 3
+    absAimVector = aimVector if aimAxis < 3 else tuple(-c for c in aimVector)
+    absUpVector = upVector if upAxis < 3 else tuple(-c for c in upVector)
+
+    axisVectors[absAimAxis] = absAimVector
+    axisVectors[absUpAxis] = absUpVector
+
+    for axis in range(3):
+        if axisVectors[axis] is None:
+            axisVectors[axis] = cross(axisVectors[(axis - 2) % 3], axisVectors[(axis - 1) % 3])
+            break
+
+    axisVectors[absUpAxis] = cross(axisVectors[(absUpAxis - 2) % 3], axisVectors[(absUpAxis - 1) % 3])
+
+    rows = [list(normal(axisVectors[axis])) + [0.0] for axis in range(3)]
+    rows.append(list(position) + [1.0])
+    return numpy.array(rows)
+
+def computeJointMatrix(position, parentPosition, targetPosition, useGuideAim,
+                       aimVector, upVector, aimAxis, upAxis):
+    """Port of GuideHandle.computeJointMatrix, with None for an unconnected parent or orient target."""
+    hasParent = parentPosition is not None
+    hasOrientTarget = targetPosition is not None
+    if useGuideAim or not (hasParent or hasOrientTarget):
+        aim = aimVector
+    elif hasParent and not hasOrientTarget:
+        aim = normal(subtract(position, parentPosition))
+    else:
+        aim = normal(subtract(targetPosition, position))
+    return buildAimMatrix(aim, upVector, aimAxis, upAxis, position)
+
+
+class BuildAimMatricesTest(unittest.TestCase):
+
+    def assertMatricesEqual(self, solved, expected):
+        numpy.testing.assert_allclose(solved, expected, rtol=0, atol=1e-12)
+
+    def testAxisPairs(self):
+        cases = list(itertools.product(AXIS_PAIRS, AIM_VECTORS, UP_VECTORS))
+        positions = numpy.array([(i, -2.0 * i, 0.5) for i in range(len(cases))], dtype=float)
+        aimAxes = numpy.array([aimAxis for (aimAxis, _), _, _ in cases])
+        upAxes = numpy.array([upAxis for (_, upAxis), _, _ in cases])
+        aimVectors = numpy.array([aim for _, aim, _ in cases])
+        upVectors = numpy.array([up for _, _, up in cases])
+
+        solved = solver.buildAimMatrices(aimVectors, upVectors, aimAxes, upAxes, positions)
+        expected = [buildAimMatrix(aim, up, aimAxis, upAxis, positions[i])
+                    for i, ((aimAxis, upAxis), aim, up) in enumerate(cases)]
+        self.assertMatricesEqual(solved, expected)
+
+    def testDegenerateUpVectorsGiveZeroAxes(self):
+        aimVectors = numpy.array([(1.0, 0.0, 0.0), (1.0, 0.0, 0.0)])
+        upVectors = numpy.array([(0.0, 0.0, 0.0), (3.0, 0.0, 0.0)])
+        solved = solver.buildAimMatrices(aimVectors, upVectors, numpy.array([0, 0]),
+                                         numpy.array([1, 1]), numpy.zeros((2, 3)))
+        self.assertTrue(numpy.all(numpy.isfinite(solved)))
+        self.assertMatricesEqual(solved[:, 1:3, :3], numpy.zeros((2, 2, 3)))
+
+
+class SolveJointMatricesTest(unittest.TestCase):
+
+    def testAimBranches(self):
+        # Handle 0 is a root, 1 and 2 aim away from their parent, 3 aims at
+        # its orient target, 4 uses the guide aim despite having a parent and
+        # 5 sits on its parent, so its aim vector has zero length
+        positions = numpy.array([(0.0, 0.0, 0.0), (1.0, 2.0, 0.0), (1.0, 2.0, 3.0),
+                                 (-1.0, 0.5, 0.0), (4.0, 0.0, 1.0), (4.0, 0.0, 1.0)])
+        parentIndices = numpy.array([-1, 0, 1, 0, 0, 4])
+        orientTargetIndices = numpy.array([-1, -1, -1, 2, -1, -1])
+        useGuideAim = numpy.array([False, False, False, False, True, False])
+        aimVector = (0.0, 0.0, 1.0)
+        upVectors = numpy.array([(0.0, 1.0, 0.0), (0.0, 0.0, 1.0), (1.0, 0.0, 0.0),
+                                 (0.0, 1.0, 0.0), (0.0, 0.0, 0.0), (0.0, 1.0, 0.0)])
+
+        for aimAxis, upAxis in AXIS_PAIRS:
+            solved = solver.solveJointMatrices(positions, parentIndices, orientTargetIndices,
+                                               aimAxis, upAxis, aimVector, upVectors, useGuideAim)
+            for i in range(len(positions)):
+                parentPosition = positions[parentIndices[i]] if parentIndices[i] >= 0 else None
+                targetPosition = None
+                if orientTargetIndices[i] >= 0:
+                    targetPosition = positions[orientTargetIndices[i]]
+                expected = computeJointMatrix(tuple(positions[i]), parentPosition, targetPosition,
+                                              useGuideAim[i], aimVector, tuple(upVectors[i]),
+                                              aimAxis, upAxis)
+                numpy.testing.assert_allclose(solved[i], expected, rtol=0, atol=1e-12,
+                                              err_msg="handle {} aim {} up {}".format(i, aimAxis, upAxis))
+
+if __name__ == "__main__":
+    unittest.main()
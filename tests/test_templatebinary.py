@@ -0,0 +1,109 @@
+"""Round trip parity tests of the binary and text template formats.
+
+The tests need NumPy but not Maya.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from boneforge import benchmark
+from boneforge import template
+from boneforge import templatebinary
+
+
+def guideData():
+    """Returns benchmark spine guide data followed by a limb guide with a layout."""
+    guides = benchmark.templateGuideData(guideCount=4, handlesPerGuide=6)
+    limb = dict(guides[-1])
+    limb.update({
+        "guideNodeType": "skeletonGuideLimb",
+        "className": "GuideLimb",
+        "forgeID": "limb",
+        "name": "benchmarkLimb",
+        "parentGuideID": guides[-1]["forgeID"],
+        "parentGuideHandleIndex": 2,
+        "provideAimVector": True,
+        "handleForgeIDs": ["limbHandle{}".format(i) for i in range(6)],
+        "limbHandleIndices": [0, 3, 5],
+        "handleInOrientGroup": [False, False, False, False, True, False],
+        "useChildBaseAsEnd": False,
+    })
+    guides.append(limb)
+    return guides
+
+
+class TemplateParityTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.data = guideData()
+        self.path = os.path.join(self.directory, "parity" + templatebinary.BINARY_EXTENSION)
+        templatebinary.writeBinaryTemplate(self.path, self.data)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testSpineNodeType(self):
+        self.assertEqual(self.data[0]["guideNodeType"], "skeletonGuideSpine")
+
+    def testTextRoundTrip(self):
+        decoded = template.decodeTemplate(template.encodeTemplate(self.data))
+        self.assertEqual(templatebinary.parityErrors(self.data, decoded), [])
+
+    def testBinaryMatchesText(self):
+        decoded = template.decodeTemplate(template.encodeTemplate(self.data))
+        self.assertEqual(templatebinary.parityErrors(decoded, templatebinary.readBinaryTemplate(self.path)), [])
+        self.assertEqual(templatebinary.parityErrors(decoded, template.readTemplate(self.path)), [])
+
+    def testLookups(self):
+        with templatebinary.BinaryTemplate(self.path) as tpl:
+            tpl.validate()
+            self.assertEqual(tpl.guideCount, len(self.data))
+            self.assertEqual(tpl.handleCount, sum(data["handleCount"] for data in self.data))
+            first = 0
+            for i, data in enumerate(self.data):
+                self.assertEqual(tpl.findGuide(data["forgeID"]), i)
+                self.assertEqual(tpl.guideNodeType(i), data["guideNodeType"])
+                self.assertEqual(tpl.guideHandleRange(i), (first, data["handleCount"]))
+                first += data["handleCount"]
+            self.assertEqual(tpl.findGuide("missing"), -1)
+
+    def testViews(self):
+        with templatebinary.BinaryTemplate(self.path) as tpl:
+            for i, data in enumerate(self.data):
+                numpy.testing.assert_array_equal(
+                    tpl.handleTranslations(i), numpy.reshape(data["handleTranslations"], (-1, 3)))
+                numpy.testing.assert_array_equal(
+                    tpl.handleRotations(i), numpy.reshape(data["handleRotations"], (-1, 3)))
+                numpy.testing.assert_array_equal(tpl.handleRadii(i), data["handleRadii"])
+            numpy.testing.assert_array_equal(
+                tpl.handleTranslations(),
+                numpy.concatenate([numpy.reshape(data["handleTranslations"], (-1, 3)) for data in self.data]))
+
+    def testTruncatedFiles(self):
+        with open(self.path, "rb") as f:
+            data = f.read()
+        truncatedPath = os.path.join(self.directory, "truncated" + templatebinary.BINARY_EXTENSION)
+        for size in (templatebinary.HEADER.size, 60, 200, len(data) // 2, len(data) - 1):
+            with open(truncatedPath, "wb") as f:
+                f.write(data[:size])
+            with self.assertRaises(ValueError):
+                templatebinary.readBinaryTemplate(truncatedPath)
+
+    def testEmptyTemplate(self):
+        path = os.path.join(self.directory, "empty" + templatebinary.BINARY_EXTENSION)
+        templatebinary.writeBinaryTemplate(path, [])
+        with templatebinary.BinaryTemplate(path) as tpl:
+            tpl.validate()
+            self.assertEqual(tpl.guideCount, 0)
+            self.assertEqual(tpl.guideDataList(), [])
+            self.assertEqual(tpl.handleTranslations().shape, (0, 3))
+
+if __name__ == "__main__":
+    unittest.main()
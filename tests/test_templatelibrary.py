@@ -0,0 +1,126 @@
+"""Tests of the template library index, which needs neither Maya nor NumPy."""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from boneforge import benchmark
+from boneforge import template
+from boneforge import templatebinary
+from boneforge import templatelibrary
+
+
+class TemplateLibraryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.data = benchmark.templateGuideData(guideCount=2, handlesPerGuide=3)
+        self.writeText("biped", self.data)
+        self.writeBinary("rigs/quad", self.data)
+        self.summarized = []
+        summarizeTemplate = templatelibrary.summarizeTemplate
+
+        def countingSummarize(path):
+            self.summarized.append(self.library._relativePath(path))
+            return summarizeTemplate(path)
+
+        templatelibrary.summarizeTemplate = countingSummarize
+        self.addCleanup(setattr, templatelibrary, "summarizeTemplate", summarizeTemplate)
+        self.library = templatelibrary.TemplateLibrary(self.directory)
+
+    def tearDown(self):
+        self.library.close()
+        shutil.rmtree(self.directory)
+
+    def path(self, name):
+        return os.path.join(self.directory, *name.split("/"))
+
+    def writeText(self, name, data):
+        template.writeTemplate(self.path(name + template.TEXT_EXTENSION), data)
+
+    def writeBinary(self, name, data):
+        path = self.path(name + templatebinary.BINARY_EXTENSION)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        templatebinary.writeBinaryTemplate(path, data)
+
+    def writeFile(self, name, data):
+        with open(self.path(name), "wb") as f:
+            f.write(data)
+
+    def names(self, **kwargs):
+        return [entry.name for entry in self.library.entries(**kwargs)]
+
+    def testFirstRefresh(self):
+        added, updated, removed = self.library.refresh()
+        self.assertEqual(sorted(added), ["biped.bft", "rigs/quad.bfb"])
+        self.assertEqual((updated, removed), ([], []))
+        entry = self.library.entry("biped")
+        self.assertEqual(entry.guideTypes, (template.SPINE_NODE_TYPE,))
+        self.assertEqual((entry.guideCount, entry.handleCount), (2, 6))
+        self.assertEqual(self.library.entry("rigs/quad.bfb").handleCount, 6)
+
+    def testUnchangedRefresh(self):
+        self.library.refresh()
+        del self.summarized[:]
+        self.assertEqual(self.library.refresh(), ([], [], []))
+        self.assertEqual(self.summarized, [])
+
+    def testTouchedFile(self):
+        self.library.refresh()
+        del self.summarized[:]
+        path = self.path("biped.bft")
+        os.utime(path, (os.path.getatime(path), os.path.getmtime(path) + 10))
+        self.assertEqual(self.library.refresh(), ([], [], []))
+        self.assertEqual(self.summarized, [])
+        self.assertEqual(self.library.entry("biped").mtime, os.stat(path).st_mtime)
+
+    def testEditedFile(self):
+        self.library.refresh()
+        self.writeText("biped", self.data[:1])
+        self.assertEqual(self.library.refresh(), ([], ["biped.bft"], []))
+        self.assertEqual(self.library.entry("biped").guideCount, 1)
+
+    def testDeletedFile(self):
+        self.library.refresh()
+        os.remove(self.path("rigs/quad.bfb"))
+        self.assertEqual(self.library.refresh(), ([], [], ["rigs/quad.bfb"]))
+        self.assertIsNone(self.library.entry("quad"))
+
+    def testInvalidFiles(self):
+        with open(self.path("rigs/quad.bfb"), "rb") as f:
+            binary = f.read()
+        self.writeFile("truncated.bfb", binary[:60])
+        self.writeFile("notJson.bft", "not a template")
+        added, updated, removed = self.library.refresh()
+        self.assertEqual(sorted(added), ["biped.bft", "rigs/quad.bfb"])
+        self.assertEqual(self.names(), ["biped", "quad"])
+        self.assertIsNone(self.library.entry("truncated"))
+
+        # Invalid files are not read again until they change
+        del self.summarized[:]
+        self.assertEqual(self.library.refresh(), ([], [], []))
+        self.assertEqual(self.summarized, [])
+
+        self.writeFile("truncated.bfb", binary)
+        self.assertEqual(self.library.refresh(), (["truncated.bfb"], [], []))
+        self.writeFile("biped.bft", "{}")
+        self.assertEqual(self.library.refresh(), ([], [], ["biped.bft"]))
+
+    def testFilterEscaping(self):
+        self.writeText("left_arm", self.data)
+        self.writeText("leftXarm", self.data)
+        self.writeText("100%", self.data)
+        self.library.refresh()
+        self.assertEqual(self.names(nameFilter="_"), ["left_arm"])
+        self.assertEqual(self.names(nameFilter="%"), ["100%"])
+        self.assertEqual(self.names(nameFilter="arm"), ["leftXarm", "left_arm"])
+        self.assertEqual(len(self.names(guideType=template.SPINE_NODE_TYPE)), 5)
+        self.assertEqual(self.names(guideType="skeletonGuide%"), [])
+        self.assertEqual(self.names(guideType="skeletonGuide_pine"), [])
+
+if __name__ == "__main__":
+    unittest.main()